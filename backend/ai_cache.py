@@ -0,0 +1,178 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne
+from backend.db import db
+from backend.singleflight import SingleFlight
+from backend.llm_gateway import set_llm_context, PRIORITY_INTERACTIVE
+from backend.analytics import record_change
+from backend.langchain_pipeline import (
+    AUTOMATE_PROMPT_VERSION,
+    CompactWorkflow,
+    group_and_automate_workflow,
+    workflowdetail_to_reactflow,
+)
+
+# Content-addressed cache of AI-augmented graphs.
+# Key = sha256(prompt version + canonical workflow_json), stored in db.ai_results.
+
+ai_graph_flight = SingleFlight()
+
+
+def workflow_hash(workflow_json: dict) -> str:
+    payload = json.dumps(workflow_json, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{AUTOMATE_PROMPT_VERSION}:{payload}".encode()).hexdigest()
+
+
+async def get_cached_ai_graph(key: str) -> Optional[Tuple[dict, dict]]:
+    cached = await db.ai_results.find_one({"_id": key})
+    if not cached:
+        return None
+    return cached["ai_workflow_json"], cached["ai_react_flow_json"]
+
+
+def _ai_graph_update(ai_workflow_json: dict, ai_react_flow_json: dict) -> dict:
+    return {"$set": {
+        "ai_workflow_json": ai_workflow_json,
+        "ai_react_flow_json": ai_react_flow_json,
+        "prompt_version": AUTOMATE_PROMPT_VERSION,
+        "created_at": datetime.utcnow(),
+    }}
+
+
+async def store_ai_graph(key: str, ai_workflow_json: dict, ai_react_flow_json: dict):
+    await db.ai_results.update_one({"_id": key}, _ai_graph_update(ai_workflow_json, ai_react_flow_json), upsert=True)
+
+
+async def store_ai_graphs(graphs: dict):
+    # graphs: key -> (ai_workflow_json, ai_react_flow_json), written in one round trip
+    if graphs:
+        await db.ai_results.bulk_write(
+            [UpdateOne({"_id": key}, _ai_graph_update(*graph), upsert=True) for key, graph in graphs.items()],
+            ordered=False,
+        )
+
+
+async def _compute_ai_graph(key: str, workflow_json: dict) -> Tuple[dict, dict]:
+    cached = await get_cached_ai_graph(key)
+    if cached:
+        return cached
+    ai_workflow_detail = await group_and_automate_workflow(workflow_json)
+    ai_workflow_json = ai_workflow_detail.model_dump()
+    ai_react_flow_json = workflowdetail_to_reactflow(ai_workflow_detail)
+    await store_ai_graph(key, ai_workflow_json, ai_react_flow_json)
+    return ai_workflow_json, ai_react_flow_json
+
+
+async def compute_ai_graph(workflow_json: dict, key: Optional[str] = None) -> Tuple[dict, dict]:
+    # Concurrent callers for the same workflow share one LLM call
+    key = key or workflow_hash(workflow_json)
+    return await ai_graph_flight.do(key, lambda: _compute_ai_graph(key, workflow_json))
+
+
+def integration_node_list(ai_react_flow_json: dict) -> list:
+    node_list = []
+    for node in ai_react_flow_json.get("nodes", []):
+        data = node.get("data", {})
+        node_type = data.get("nodeType")
+        if node_type is None:
+            node_type = "default"
+        node_list.append({
+            "name": data.get("label"),
+            "type": node_type,
+            "description": data.get("description")
+        })
+    return node_list
+
+
+def integration_types(node_list: list) -> list:
+    return sorted({node["type"] for node in node_list or [] if node.get("type")})
+
+
+async def attach_ai_graph(orgview_filter: dict, key: str, ai_workflow_json: dict, ai_react_flow_json: dict):
+    # Stores the AI graph on the orgview and keeps the derived integration data in step
+    node_list = integration_node_list(ai_react_flow_json)
+    orgview = await db.orgviews.find_one_and_update(
+        orgview_filter,
+        {"$set": {
+            "ai_workflow_json": ai_workflow_json,
+            "ai_react_flow_json": ai_react_flow_json,
+            "node_list": node_list,
+            "workflow_hash": key,
+            "ai_workflow_hash": key,
+        }},
+        projection={"project_id": 1, "user_id": 1, "node_list": 1},
+    )
+    if orgview is None:
+        return False
+    owner = orgview.get("user_id")
+    if ObjectId.is_valid(orgview.get("project_id", "")):
+        project = await db.projects.find_one_and_update(
+            {"_id": ObjectId(orgview["project_id"])},
+            {"$set": {"integration_types": integration_types(node_list)}},
+            projection={"user_id": 1},
+        )
+        owner = owner or (project or {}).get("user_id")
+    # The pre-image's node_list is what the aggregates counted for this orgview
+    await record_change(owner, {"node_list": orgview.get("node_list")}, {"node_list": node_list})
+    return True
+
+
+async def refresh_orgview_ai_graph(orgview_id, workflow_json: dict, key: Optional[str] = None, user_id: Optional[str] = None):
+    # Background task: recompute the AI graph and attach it to the orgview,
+    # unless the workflow was patched again in the meantime.
+    set_llm_context(user_id, PRIORITY_INTERACTIVE)
+    key = key or workflow_hash(workflow_json)
+    try:
+        ai_workflow_json, ai_react_flow_json = await compute_ai_graph(workflow_json, key)
+    except Exception as e:
+        print("Error recomputing AI graph:", e)
+        return
+    await attach_ai_graph({"_id": orgview_id, "workflow_hash": key}, key, ai_workflow_json, ai_react_flow_json)
+
+
+def _never_patched(orgview: dict) -> bool:
+    # Before versioning, patches rewrote updated_at but not the AI graph. Creation
+    # set created_at and updated_at with two utcnow() calls, so an unpatched
+    # orgview has them within a second of each other (and no revision).
+    if orgview.get("revision"):
+        return False
+    created_at, updated_at = orgview.get("created_at"), orgview.get("updated_at")
+    if created_at is None or updated_at is None:
+        return False
+    return abs((updated_at - created_at).total_seconds()) < 1
+
+
+async def resolve_ai_graph(orgview: dict, background_tasks=None, user_id: Optional[str] = None) -> Tuple[dict, bool]:
+    # Returns (ai_react_flow_json, stale). Never calls the LLM inline.
+    workflow_json = orgview.get("workflow_json")
+    if not workflow_json:
+        return {"nodes": [], "edges": []}, False
+    key = orgview.get("workflow_hash") or workflow_hash(workflow_json)
+    ai_hash = orgview.get("ai_workflow_hash")
+    ai_react_flow_json = orgview.get("ai_react_flow_json")
+    if ai_hash == key and ai_react_flow_json:
+        return ai_react_flow_json, False
+    # Attach only if the workflow was not patched since this orgview was read
+    unchanged = {"_id": orgview["_id"], "workflow_hash": orgview.get("workflow_hash")}
+    if ai_hash is None and orgview.get("ai_workflow_json") and _never_patched(orgview):
+        # Orgviews stored before the cache only have ai_workflow_json; if the
+        # workflow was never patched it was generated from this workflow, so
+        # rebuild the graph without the LLM.
+        ai_workflow_json = orgview["ai_workflow_json"]
+        ai_react_flow_json = workflowdetail_to_reactflow(CompactWorkflow(**ai_workflow_json))
+        await attach_ai_graph(unchanged, key, ai_workflow_json, ai_react_flow_json)
+        await store_ai_graph(key, ai_workflow_json, ai_react_flow_json)
+        return ai_react_flow_json, False
+    cached = await get_cached_ai_graph(key)
+    if cached:
+        ai_workflow_json, ai_react_flow_json = cached
+        await attach_ai_graph(unchanged, key, ai_workflow_json, ai_react_flow_json)
+        return ai_react_flow_json, False
+    if not orgview.get("workflow_hash"):
+        await db.orgviews.update_one(unchanged, {"$set": {"workflow_hash": key}})
+    if background_tasks is not None:
+        background_tasks.add_task(refresh_orgview_ai_graph, orgview["_id"], workflow_json, key, user_id)
+    return ai_react_flow_json or {"nodes": [], "edges": []}, True
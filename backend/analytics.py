@@ -0,0 +1,293 @@
+import asyncio
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+from backend.db import db
+from backend.llm_gateway import current_llm_user
+from backend.metrics import llm_cost_usd
+
+# Materialized dashboard analytics. db.analytics holds one summary document per
+# user ("user:<id>") and one for the whole installation ("global"): flow count,
+# graph sizes, integration type counts (automated vs manual steps are derived
+# from them), actor counts and LLM usage per month. Writes that change an
+# orgview apply the difference between its old and new state with $inc, so
+# /analytics is a single find_one by _id however many orgviews there are.
+# LLM usage is buffered in memory and flushed every ANALYTICS_FLUSH_SECONDS.
+#
+# backfill_analytics() rebuilds the flow summaries from the orgviews with
+# aggregation pipelines; it runs at startup until it has completed once.
+
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "5"))
+ANALYTICS_TOP_ACTORS = int(os.getenv("ANALYTICS_TOP_ACTORS", "10"))
+# Savings model for costBenefit: each automated step saves this much manual time per run
+ANALYTICS_MINUTES_PER_STEP = float(os.getenv("ANALYTICS_MINUTES_PER_STEP", "10"))
+ANALYTICS_RUNS_PER_MONTH = float(os.getenv("ANALYTICS_RUNS_PER_MONTH", "20"))
+ANALYTICS_HOURLY_RATE = float(os.getenv("ANALYTICS_HOURLY_RATE", "50"))
+
+GLOBAL_ID = "global"
+# Steps the AI graph leaves without an integration
+MANUAL_TYPE = "default"
+
+
+def summary_id(user_id: Optional[str]) -> str:
+    return f"user:{user_id}" if user_id else GLOBAL_ID
+
+
+def _key(name: str) -> str:
+    # Actor and type names become field names; Mongo reserves "." and "$" there
+    return str(name).replace(".", "．").replace("$", "＄")
+
+
+def _unkey(key: str) -> str:
+    return key.replace("．", ".").replace("＄", "$")
+
+
+def _month(now: Optional[datetime] = None) -> str:
+    return (now or datetime.utcnow()).strftime("%Y-%m")
+
+
+def orgview_summary(orgview: dict) -> dict:
+    # What one orgview contributes to the aggregates; backfill_analytics computes the same in Mongo
+    react_flow_json = orgview.get("react_flow_json") or {}
+    workflow_json = orgview.get("workflow_json") or {}
+    return {
+        "nodes": len(react_flow_json.get("nodes") or []),
+        "edges": len(react_flow_json.get("edges") or []),
+        "actors": Counter(actor for actor in workflow_json.get("actors") or [] if actor),
+        "integration_types": Counter(node["type"] for node in orgview.get("node_list") or [] if node.get("type")),
+    }
+
+
+def _increments(new: Optional[dict], old: Optional[dict] = None, flows: int = 0) -> Dict[str, int]:
+    new, old = new or {}, old or {}
+    inc = {"flows": flows}
+    for field in ("nodes", "edges"):
+        inc[field] = new.get(field, 0) - old.get(field, 0)
+    for field in ("actors", "integration_types"):
+        counts = Counter(new.get(field) or {})
+        counts.subtract(old.get(field) or {})
+        for name, count in counts.items():
+            inc[f"{field}.{_key(name)}"] = count
+    return {path: value for path, value in inc.items() if value}
+
+
+async def _apply(user_id: Optional[str], inc: Dict[str, int], max_nodes: int = 0):
+    if not inc:
+        return
+    update = {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}}
+    if max_nodes:
+        update["$max"] = {"max_nodes": max_nodes}
+    requests = [UpdateOne({"_id": GLOBAL_ID}, update, upsert=True)]
+    if user_id:
+        requests.append(UpdateOne({"_id": summary_id(user_id)}, update, upsert=True))
+    try:
+        await db.analytics.bulk_write(requests, ordered=False)
+    except Exception as e:
+        # The aggregates are derived data; the write that triggered this stands
+        print("Analytics update failed:", e)
+
+
+async def record_orgviews(user_id: Optional[str], orgviews: List[dict]):
+    # New orgviews: one $inc per summary document for the whole group
+    inc = Counter()
+    max_nodes = 0
+    for orgview in orgviews:
+        summary = orgview_summary(orgview)
+        inc.update(_increments(summary, flows=1))
+        max_nodes = max(max_nodes, summary["nodes"])
+    await _apply(user_id, dict(inc), max_nodes)
+
+
+async def record_change(user_id: Optional[str], old: dict, new: dict):
+    # `old` must be the state the write replaced (the revision-checked document, or a
+    # find_one_and_update pre-image), so concurrent writers apply disjoint differences
+    new_summary = orgview_summary(new)
+    await _apply(user_id, _increments(new_summary, orgview_summary(old)), new_summary["nodes"])
+
+
+class UsageBuffer:
+    # LLM calls, tokens and cost per (summary document, month), flushed with one bulk_write
+    def __init__(self):
+        self._pending: Dict[tuple, list] = {}
+        self._task = None
+
+    def record(self, input_tokens: int, output_tokens: int):
+        user_id = current_llm_user()
+        month = _month()
+        usage = (1, input_tokens, output_tokens, llm_cost_usd(input_tokens, output_tokens))
+        targets = [GLOBAL_ID] if user_id == "anonymous" else [GLOBAL_ID, summary_id(user_id)]
+        for target in targets:
+            totals = self._pending.setdefault((target, month), [0, 0, 0, 0.0])
+            for i, value in enumerate(usage):
+                totals[i] += value
+
+    def pending(self, target: str, month: str) -> list:
+        return self._pending.get((target, month), [0, 0, 0, 0.0])
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        requests = [
+            UpdateOne({"_id": target}, {"$inc": {
+                f"llm.{month}.calls": calls,
+                f"llm.{month}.input_tokens": input_tokens,
+                f"llm.{month}.output_tokens": output_tokens,
+                f"llm.{month}.cost_usd": cost,
+            }}, upsert=True)
+            for (target, month), (calls, input_tokens, output_tokens, cost) in pending.items()
+        ]
+        try:
+            await db.analytics.bulk_write(requests, ordered=False)
+        except Exception as e:
+            print("Analytics usage flush failed:", e)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(ANALYTICS_FLUSH_SECONDS)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+usage_buffer = UsageBuffer()
+
+
+def record_llm_usage(input_tokens: int, output_tokens: int):
+    usage_buffer.record(input_tokens, output_tokens)
+
+
+async def get_analytics(user_id: Optional[str]) -> dict:
+    # Shaped like the frontend's AnalyticsData, plus the breakdowns behind it
+    target = summary_id(user_id)
+    summary = await db.analytics.find_one({"_id": target}) or {}
+    month = _month()
+    stored = (summary.get("llm") or {}).get(month) or {}
+    # Usage this worker has not flushed yet
+    calls, _, _, cost = usage_buffer.pending(target, month)
+    calls += stored.get("calls", 0)
+    cost += stored.get("cost_usd", 0.0)
+    types = {_unkey(k): v for k, v in (summary.get("integration_types") or {}).items() if v > 0}
+    manual = types.get(MANUAL_TYPE, 0)
+    automated = sum(count for name, count in types.items() if name != MANUAL_TYPE)
+    savings = automated * ANALYTICS_RUNS_PER_MONTH * ANALYTICS_MINUTES_PER_STEP / 60 * ANALYTICS_HOURLY_RATE
+    actors = sorted(
+        ((_unkey(k), v) for k, v in (summary.get("actors") or {}).items() if v > 0), key=lambda item: -item[1]
+    )
+    flows = summary.get("flows", 0)
+    return {
+        "totalFlows": flows,
+        "monthlyLLMCalls": calls,
+        "monthlyCost": f"${cost:,.2f}",
+        "costBenefit": f"${max(0.0, savings - cost):,.0f}",
+        "automatedSteps": automated,
+        "manualSteps": manual,
+        "integrationTypes": types,
+        "topActors": [{"name": name, "count": count} for name, count in actors[:ANALYTICS_TOP_ACTORS]],
+        "graphSize": {
+            "nodes": summary.get("nodes", 0),
+            "edges": summary.get("edges", 0),
+            "avgNodes": round(summary.get("nodes", 0) / flows, 1) if flows else 0,
+            "maxNodes": summary.get("max_nodes", 0),
+        },
+        "updatedAt": summary.get("updated_at"),
+    }
+
+
+# Backfill
+
+_SIZE_PIPELINE = [
+    {"$group": {
+        "_id": "$user_id",
+        "flows": {"$sum": 1},
+        "nodes": {"$sum": {"$size": {"$ifNull": ["$react_flow_json.nodes", []]}}},
+        "edges": {"$sum": {"$size": {"$ifNull": ["$react_flow_json.edges", []]}}},
+        "max_nodes": {"$max": {"$size": {"$ifNull": ["$react_flow_json.nodes", []]}}},
+    }},
+]
+
+
+def _count_pipeline(array_path: str, value_path: str) -> list:
+    return [
+        {"$unwind": f"${array_path}"},
+        {"$match": {value_path: {"$nin": [None, ""]}}},
+        {"$group": {"_id": {"user_id": "$user_id", "name": f"${value_path}"}, "count": {"$sum": 1}}},
+    ]
+
+
+async def _backfill_orgview_owners(batch_size: int = 500):
+    # Orgviews stored before user_id was recorded on them get it from their project
+    cursor = db.orgviews.find({"user_id": {"$exists": False}}, {"project_id": 1})
+    orgviews = [o async for o in cursor if ObjectId.is_valid(o.get("project_id", ""))]
+    for i in range(0, len(orgviews), batch_size):
+        batch = orgviews[i:i + batch_size]
+        owners = {
+            str(p["_id"]): p.get("user_id")
+            async for p in db.projects.find({"_id": {"$in": [ObjectId(o["project_id"]) for o in batch]}}, {"user_id": 1})
+        }
+        requests = [
+            UpdateOne({"_id": o["_id"]}, {"$set": {"user_id": owners[o["project_id"]]}})
+            for o in batch if owners.get(o["project_id"])
+        ]
+        if requests:
+            await db.orgviews.bulk_write(requests, ordered=False)
+
+
+async def backfill_analytics(force: bool = False):
+    # Recomputes every flow summary inside Mongo. Writes made while it runs may be
+    # counted twice or not at all; run it again (force=True) to reconcile.
+    if not force:
+        existing = await db.analytics.find_one({"_id": GLOBAL_ID}, {"backfilled_at": 1})
+        if existing and existing.get("backfilled_at"):
+            return 0
+    await _backfill_orgview_owners()
+    summaries: Dict[str, dict] = {}
+
+    def targets(user_id):
+        # The user's summary (orgviews without an owner only count globally) and the global one
+        for target in {summary_id(user_id), GLOBAL_ID}:
+            yield summaries.setdefault(target, {
+                "flows": 0, "nodes": 0, "edges": 0, "max_nodes": 0, "actors": {}, "integration_types": {},
+            })
+
+    async for row in db.orgviews.aggregate(_SIZE_PIPELINE, allowDiskUse=True):
+        for totals in targets(row["_id"]):
+            for field in ("flows", "nodes", "edges"):
+                totals[field] += row[field]
+            totals["max_nodes"] = max(totals["max_nodes"], row["max_nodes"])
+    for field, array_path, value_path in (
+        ("integration_types", "node_list", "node_list.type"),
+        ("actors", "workflow_json.actors", "workflow_json.actors"),
+    ):
+        async for row in db.orgviews.aggregate(_count_pipeline(array_path, value_path), allowDiskUse=True):
+            name = row["_id"].get("name")
+            if name in (None, ""):
+                continue
+            for totals in targets(row["_id"].get("user_id")):
+                totals[field][_key(name)] = totals[field].get(_key(name), 0) + row["count"]
+    now = datetime.utcnow()
+    # LLM usage is not derivable from the orgviews and is left as it is
+    requests = [
+        UpdateOne({"_id": target}, {"$set": {**totals, "updated_at": now}}, upsert=True)
+        for target, totals in summaries.items()
+    ]
+    requests.append(UpdateOne({"_id": GLOBAL_ID}, {"$set": {"backfilled_at": now}}, upsert=True))
+    await db.analytics.bulk_write(requests, ordered=False)
+    users = len(summaries) - (GLOBAL_ID in summaries)
+    print(f"Analytics backfill: {users} users")
+    return users
@@ -1,19 +1,36 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
-from passlib.context import CryptContext
+from typing import Optional
 from datetime import datetime, timedelta
 import jwt
 import os
+import time
+import hashlib
 from backend.models import UserModel
 from backend.db import db
+from backend.cache import TTLCache
+from backend.password_hashing import password_hasher
 from bson import ObjectId
 
 SECRET_KEY = os.getenv("JWT_SECRET", "supersecret")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 1 week
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Principals are cached per worker; changes made by another worker show up within the TTL
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_MAX_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_MAX_TTL_SECONDS", "3600"))
+# Reverse proxies in front of the app that append to X-Forwarded-For. With 0 the
+# header is ignored (anyone can set it) and the peer address is the client.
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+principal_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_MAX_TTL_SECONDS)
+# Average cost of a miss (seconds), used to estimate what cache hits saved
+_auth_costs = {"decode": 0.0, "lookup": 0.0, "saved_seconds": 0.0, "requests": 0}
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -29,12 +46,33 @@ async def get_user_by_email(email: str):
         return UserModel(**user)
     return None
 
-async def authenticate_user(email: str, password: str):
+def client_ip(request: Optional[Request]) -> Optional[str]:
+    if request is None:
+        return None
+    if TRUSTED_PROXY_HOPS:
+        forwarded = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        # The entry added by the outermost trusted proxy; anything before it is client-supplied
+        if len(forwarded) >= TRUSTED_PROXY_HOPS:
+            return forwarded[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else None
+
+def _client_keys(request: Optional[Request], email: str):
+    # (client, account) admission keys for the password hasher
+    host = client_ip(request)
+    return (f"ip:{host}" if host else None, f"email:{email.lower()}")
+
+async def authenticate_user(email: str, password: str, request: Optional[Request] = None):
     user = await get_user_by_email(email)
     if not user:
         return False
-    if not pwd_context.verify(password, user.password_hash):
+    valid, new_hash = await password_hasher.verify_and_update(password, user.password_hash, *_client_keys(request, email))
+    if not valid:
         return False
+    if new_hash:
+        # Cost parameters changed since this hash was made; upgrade it transparently
+        await db.users.update_one({"_id": ObjectId(user.id)}, {"$set": {"password_hash": new_hash}})
+        invalidate_user(user.id)
+        user.password_hash = new_hash
     return user
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
@@ -44,39 +82,90 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 @router.post("/register", response_model=Token)
-async def register(form_data: OAuth2PasswordRequestForm = Depends()):
+async def register(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     existing = await get_user_by_email(form_data.username)
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed = pwd_context.hash(form_data.password)
+    hashed = await password_hasher.hash(form_data.password, *_client_keys(request, form_data.username))
     user = UserModel(email=form_data.username, password_hash=hashed, created_at=datetime.utcnow())
     result = await db.users.insert_one(user.dict(by_alias=True, exclude={"id"}))
     access_token = create_access_token(data={"sub": str(result.inserted_id), "email": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = await authenticate_user(form_data.username, form_data.password)
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await authenticate_user(form_data.username, form_data.password, request)
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect email or password")
     access_token = create_access_token(data={"sub": str(user.id), "email": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
+def invalidate_user(user_id: str):
+    # Call whenever a user document is modified
+    principal_cache.pop(str(user_id))
+
+def _observe_cost(kind: str, seconds: float):
+    previous = _auth_costs[kind]
+    _auth_costs[kind] = seconds if previous == 0.0 else previous * 0.9 + seconds * 0.1
+
+def _decode_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is not None:
+        _auth_costs["saved_seconds"] += _auth_costs["decode"]
+        return payload
+    start = time.perf_counter()
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    _observe_cost("decode", time.perf_counter() - start)
+    # Cached only until the token itself expires
+    remaining = payload["exp"] - time.time() if "exp" in payload else TOKEN_CACHE_MAX_TTL_SECONDS
+    if remaining > 0:
+        token_cache.set(key, payload, ttl=min(remaining, TOKEN_CACHE_MAX_TTL_SECONDS))
+    return payload
+
+async def _load_principal(user_id: str) -> Optional[UserModel]:
+    user = principal_cache.get(user_id)
+    if user is not None:
+        _auth_costs["saved_seconds"] += _auth_costs["lookup"]
+        return user
+    if not ObjectId.is_valid(user_id):
+        return None
+    start = time.perf_counter()
+    doc = await db.users.find_one({"_id": ObjectId(user_id)})
+    _observe_cost("lookup", time.perf_counter() - start)
+    if doc is None:
+        return None
+    doc["_id"] = str(doc["_id"])
+    user = UserModel(**doc)
+    principal_cache.set(user_id, user)
+    return user
+
+def auth_cache_stats() -> dict:
+    requests = _auth_costs["requests"]
+    return {
+        "tokens": token_cache.stats(),
+        "principals": principal_cache.stats(),
+        "avg_decode_ms": _auth_costs["decode"] * 1000,
+        "avg_lookup_ms": _auth_costs["lookup"] * 1000,
+        "saved_ms_total": _auth_costs["saved_seconds"] * 1000,
+        "saved_ms_per_request": _auth_costs["saved_seconds"] * 1000 / requests if requests else 0.0,
+    }
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    _auth_costs["requests"] += 1
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = _decode_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
     except jwt.PyJWTError:
         raise credentials_exception
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
+    user = await _load_principal(user_id)
     if user is None:
         raise credentials_exception
-    user["_id"] = str(user["_id"])
-    return UserModel(**user) 
\ No newline at end of file
+    return user 
\ No newline at end of file
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Dict, List
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from backend.orgview_service import OrgViewService
+from backend.ingest import Attachment
+from backend.llm_gateway import LLM_MAX_CONCURRENCY, set_llm_context, PRIORITY_BULK
+
+# Bulk generation for onboarding: many department contexts in one submission.
+# Items run through the normal (coalesced, cached) generation pipeline with at
+# most BATCH_CONCURRENCY in flight; the LLM gateway still bounds the calls
+# themselves. Finished views are written in groups with insert_many, and each
+# item's result is streamed back as NDJSON as soon as its group is written.
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", str(LLM_MAX_CONCURRENCY)))
+BATCH_FLUSH_SIZE = int(os.getenv("BATCH_FLUSH_SIZE", "10"))
+BATCH_FLUSH_SECONDS = float(os.getenv("BATCH_FLUSH_SECONDS", "0.5"))
+
+logger = logging.getLogger(__name__)
+
+
+class BatchItem(BaseModel):
+    department_function: str
+    team_size: str
+    budget: str
+    description: str
+    # Filenames of files uploaded with the batch
+    images: List[str] = []
+    pdfs: List[str] = []
+
+
+def parse_batch_items(raw: str, attachments: Dict[str, Attachment]) -> List[BatchItem]:
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="items must be a JSON array")
+    if not isinstance(data, list) or not data:
+        raise HTTPException(status_code=400, detail="items must be a non-empty JSON array")
+    if len(data) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"A batch holds at most {BATCH_MAX_ITEMS} items")
+    try:
+        items = [BatchItem(**item) for item in data]
+    except (TypeError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=f"Invalid batch item: {e}")
+    for index, item in enumerate(items):
+        missing = [name for name in item.images + item.pdfs if name not in attachments]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Item {index} refers to files that were not uploaded: {missing}")
+    return items
+
+
+def _line(payload: dict) -> str:
+    return json.dumps(payload, default=str) + "\n"
+
+
+async def run_batch(user_id: str, items: List[BatchItem], attachments: Dict[str, Attachment]):
+    # Yields NDJSON lines: a header, one line per item in completion order, then a summary
+    set_llm_context(user_id, PRIORITY_BULK)
+    service = OrgViewService()
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    built = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def build(index: int, item: BatchItem):
+        async with semaphore:
+            try:
+                view = await service.build_org_view_coalesced(
+                    department_function=item.department_function,
+                    team_size=item.team_size,
+                    budget=item.budget,
+                    description=item.description,
+                    images=[attachments[name] for name in item.images],
+                    pdfs=[attachments[name] for name in item.pdfs],
+                    user_id=user_id,
+                )
+                await built.put((index, view, None))
+            except Exception as e:
+                await built.put((index, None, e))
+
+    tasks = [asyncio.create_task(build(index, item)) for index, item in enumerate(items)]
+    remaining = len(items)
+    pending = []  # (index, view) waiting to be written
+    deadline = 0.0
+    succeeded = failed = 0
+    try:
+        yield _line({"batch": {"items": len(items), "concurrency": BATCH_CONCURRENCY}})
+        while remaining or pending:
+            if remaining and len(pending) < BATCH_FLUSH_SIZE:
+                timeout = max(0.0, deadline - loop.time()) if pending else None
+                try:
+                    index, view, error = await asyncio.wait_for(built.get(), timeout)
+                except asyncio.TimeoutError:
+                    index = None
+                if index is not None:
+                    remaining -= 1
+                    if error is not None:
+                        failed += 1
+                        yield _line({"index": index, "status": "failed", "error": str(error) or type(error).__name__})
+                    else:
+                        if not pending:
+                            deadline = loop.time() + BATCH_FLUSH_SECONDS
+                        pending.append((index, view))
+                    continue
+            # Flush: the group is full, its wait ran out, or nothing else is coming
+            group, pending = pending, []
+            try:
+                results = await service.save_org_views(user_id, [view for _, view in group])
+            except Exception as e:
+                logger.warning("Batch write of %d views failed: %s", len(group), e)
+                failed += len(group)
+                for index, _ in group:
+                    yield _line({"index": index, "status": "failed", "error": f"write failed: {e}"})
+                continue
+            elapsed = round(loop.time() - start, 3)
+            for (index, view), result in zip(group, results):
+                succeeded += 1
+                yield _line({
+                    "index": index,
+                    "status": "done",
+                    "project_id": result["project_id"],
+                    "project_name": view["project_name"],
+                    "reused_from": view.get("reused_from"),
+                    "elapsed_s": elapsed,
+                })
+        yield _line({"summary": {"succeeded": succeeded, "failed": failed, "elapsed_s": round(loop.time() - start, 3)}})
+    finally:
+        # The client went away (or we are done): stop any item still running
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+# Caching primitives shared by the backend: an in-process LRU with TTLs and a
+# SQLite tier that every uvicorn worker on the host can share.
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class SQLiteCache:
+    # Blocking store; call through asyncio.to_thread from async code
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), expires_at, now),
+            )
+            self._writes += 1
+            if self._writes % 50 == 0:
+                self._evict(conn, now)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used rows until back under the cap
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed_at ASC"):
+            doomed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM cache WHERE key = ?", doomed)
+        self.evictions += len(doomed)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def _fingerprint_part(part) -> str:
+    if isinstance(part, str):
+        return "text:" + part
+    if isinstance(part, dict) and "data" in part:
+        data = part["data"]
+        digest = hashlib.sha256(data).hexdigest() if isinstance(data, (bytes, bytearray)) else hashlib.sha256(str(data).encode()).hexdigest()
+        return f"file:{part.get('mime_type')}:{digest}"
+    return "json:" + json.dumps(part, sort_keys=True, default=str)
+
+
+class LLMResponseCache:
+    def __init__(self, enabled: bool = LLM_CACHE_ENABLED):
+        self.enabled = enabled
+        self.memory = TTLCache(LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_TTL_SECONDS)
+        self.disk = SQLiteCache(LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_BYTES)
+
+    def make_key(self, model_name: str, prompt_input, schema=None) -> str:
+        parts = prompt_input if isinstance(prompt_input, list) else [prompt_input]
+        h = hashlib.sha256()
+        h.update(model_name.encode())
+        h.update(b"\0" + (schema.__name__ if schema is not None else "").encode())
+        for part in parts:
+            h.update(b"\0" + _fingerprint_part(part).encode())
+        return h.hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        try:
+            raw = await asyncio.to_thread(self.disk.get, key)
+        except sqlite3.Error as e:
+            print("LLM cache read error:", e)
+            return None
+        if raw is None:
+            return None
+        value = raw.decode()
+        self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: str):
+        if not self.enabled:
+            return
+        self.memory.set(key, value)
+        try:
+            await asyncio.to_thread(self.disk.set, key, value.encode())
+        except sqlite3.Error as e:
+            print("LLM cache write error:", e)
+
+    async def discard(self, key: str):
+        # Used when a cached response turned out to be unparseable
+        self.memory.pop(key)
+        try:
+            await asyncio.to_thread(self.disk.delete, key)
+        except sqlite3.Error as e:
+            print("LLM cache delete error:", e)
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "memory": self.memory.stats(), "disk": self.disk.stats()}
+
+
+llm_cache = LLMResponseCache()
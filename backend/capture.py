@@ -0,0 +1,153 @@
+import asyncio
+import contextvars
+import glob
+import gzip
+import json
+import os
+import random
+import re
+import time
+import uuid
+from collections import deque
+from typing import List, Optional
+
+# Sampled debug capture. Each request gets a trace id (X-Trace-Id); for a
+# sampled request, capture() serializes the artifact into a bounded ring buffer
+# that a background task drains into rotating gzip JSON-lines files under
+# CAPTURE_DIR. Nothing touches the disk on the request path. A request can be
+# force-sampled with the header "X-Capture: 1".
+
+CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", "0.01"))
+CAPTURE_DIR = os.getenv("CAPTURE_DIR", ".cache/captures")
+CAPTURE_BUFFER_SIZE = int(os.getenv("CAPTURE_BUFFER_SIZE", "256"))
+CAPTURE_FLUSH_SECONDS = float(os.getenv("CAPTURE_FLUSH_SECONDS", "1"))
+CAPTURE_FILE_MAX_BYTES = int(os.getenv("CAPTURE_FILE_MAX_BYTES", str(16 * 1024 * 1024)))
+CAPTURE_MAX_FILES = int(os.getenv("CAPTURE_MAX_FILES", "10"))
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_sampled = contextvars.ContextVar("capture_sampled", default=False)
+
+_TRACE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def start_trace(incoming: Optional[str] = None, force: bool = False) -> str:
+    # Called once per request by the middleware; a well-formed incoming id is kept
+    trace_id = incoming if incoming and _TRACE_ID_PATTERN.match(incoming) else uuid.uuid4().hex
+    _trace_id.set(trace_id)
+    _sampled.set(force or (CAPTURE_SAMPLE_RATE > 0 and random.random() < CAPTURE_SAMPLE_RATE))
+    return trace_id
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+class CaptureStore:
+    def __init__(self, directory=CAPTURE_DIR, buffer_size=CAPTURE_BUFFER_SIZE):
+        self.directory = directory
+        self._buffer = deque(maxlen=buffer_size)
+        self._task = None
+        self._file = None
+        self.captured = 0
+        self.dropped = 0
+        self.written = 0
+
+    def capture(self, name: str, payload, user_id: Optional[str] = None):
+        if not _sampled.get():
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            # The writer is behind; the oldest unwritten artifact is lost
+            self.dropped += 1
+        # Serialized now: payloads are often mutated later in the request
+        self._buffer.append(json.dumps({
+            "trace_id": _trace_id.get(),
+            "name": name,
+            "user_id": user_id,
+            "ts": time.time(),
+            "payload": payload,
+        }, default=str))
+        self.captured += 1
+
+    def _drain(self) -> List[str]:
+        lines = list(self._buffer)
+        self._buffer.clear()
+        return lines
+
+    def _files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, "captures-*.jsonl.gz")))
+
+    def _write(self, lines: List[str]):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._file is None or not os.path.exists(self._file) or os.path.getsize(self._file) >= CAPTURE_FILE_MAX_BYTES:
+            self._file = os.path.join(self.directory, f"captures-{time.time_ns()}-{os.getpid()}.jsonl.gz")
+            existing = self._files()
+            for old in existing[:max(0, len(existing) - CAPTURE_MAX_FILES + 1)]:
+                os.remove(old)
+        # Each flush appends a gzip member; gzip readers treat the file as one stream
+        with gzip.open(self._file, "ab") as f:
+            f.write(("\n".join(lines) + "\n").encode())
+
+    async def flush(self):
+        lines = self._drain()
+        if lines:
+            await asyncio.to_thread(self._write, lines)
+            self.written += len(lines)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(CAPTURE_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                print("Capture writer failed:", e)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def _scan_files(self, trace_id: str) -> List[dict]:
+        needle = f'"trace_id": "{trace_id}"'
+        found = []
+        for path in reversed(self._files()):
+            try:
+                with gzip.open(path, "rt") as f:
+                    for line in f:
+                        if needle in line:
+                            found.append(json.loads(line))
+            except (OSError, EOFError, ValueError):
+                continue
+        return found
+
+    async def find(self, trace_id: str, user_id: Optional[str] = None) -> List[dict]:
+        records = [json.loads(line) for line in list(self._buffer) if trace_id in line]
+        records = [r for r in records if r["trace_id"] == trace_id]
+        records += await asyncio.to_thread(self._scan_files, trace_id)
+        if user_id is not None:
+            records = [r for r in records if r.get("user_id") == user_id]
+        return sorted(records, key=lambda r: r["ts"])
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": CAPTURE_SAMPLE_RATE,
+            "buffered": len(self._buffer),
+            "captured": self.captured,
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+
+capture_store = CaptureStore()
+
+
+def capture(name: str, payload, user_id: Optional[str] = None):
+    capture_store.capture(name, payload, user_id)
@@ -1,10 +1,58 @@
+import asyncio
 import os
 from dotenv import load_dotenv
-from motor.motor_asyncio import AsyncIOMotorClient
 
 load_dotenv()
 
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/")
+MONGODB_DB = os.getenv("MONGODB_DB", "ai_architect")
+# Connections opened up front (and kept) per worker; 0 opens them on demand
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_PING_TIMEOUT_SECONDS = float(os.getenv("MONGODB_PING_TIMEOUT_SECONDS", "2"))
 
-mongo_client = AsyncIOMotorClient(MONGODB_URL)
-db = mongo_client["ai_architect"] 
\ No newline at end of file
+_client = None
+_database = None
+
+def get_client():
+    # Created on first use, so importing a module that uses `db` costs no client
+    # (and no motor import) until a worker actually talks to Mongo
+    global _client
+    if _client is None:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        _client = AsyncIOMotorClient(MONGODB_URL, minPoolSize=MONGODB_MIN_POOL_SIZE)
+    return _client
+
+def get_db():
+    global _database
+    if _database is None:
+        _database = get_client()[MONGODB_DB]
+    return _database
+
+class _LazyDatabase:
+    # Stands in for the motor database: `db.orgviews` resolves on access
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+db = _LazyDatabase()
+
+async def ping_db(timeout: float = MONGODB_PING_TIMEOUT_SECONDS):
+    await asyncio.wait_for(db.command("ping"), timeout)
+
+def close_client():
+    global _client, _database
+    if _client is not None:
+        _client.close()
+    _client = None
+    _database = None
+
+async def ensure_indexes():
+    # Run at startup; create_index is a no-op when the index already exists
+    await db.projects.create_index([("user_id", 1), ("created_at", -1), ("_id", -1)])
+    await db.projects.create_index([("user_id", 1), ("integration_types", 1), ("created_at", -1), ("_id", -1)])
+    await db.orgviews.create_index("project_id")
+    await db.orgviews.create_index("updated_at")
+    await db.orgview_revisions.create_index([("orgview_id", 1), ("revision", -1)], unique=True)
+    await db.jobs.create_index([("status", 1), ("created_at", 1)])
@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from pydantic import BaseModel
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from backend.db import db
+
+# Upload ingestion for /orgview/generate: uploads are streamed in chunks into a
+# content-addressed blob store (BLOB_DIR/<sha[:2]>/<sha>), hashed on the way,
+# size-limited and de-duplicated. The pipeline then works with Attachment
+# handles instead of holding every upload in memory.
+#
+# Starlette parses (and spools) the whole multipart body before the endpoint
+# runs, so UploadLimitMiddleware caps the raw body first: by Content-Length up
+# front and by counting bytes as they arrive. Blobs and preprocessing manifests
+# (BLOB_DIR/derived) untouched for BLOB_TTL_SECONDS are deleted unless a queued
+# or running job still needs them; a manifest hit touches the manifest and the
+# blobs it names, and a manifest naming a collected blob is reprocessed.
+
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(50 * 1024 * 1024)))
+# Allowance on top of the upload limit for form fields and multipart framing
+UPLOAD_MAX_BODY_BYTES = int(os.getenv("UPLOAD_MAX_BODY_BYTES", str(UPLOAD_MAX_REQUEST_BYTES + 1024 * 1024)))
+BLOB_DIR = os.getenv("BLOB_DIR", ".cache/blobs")
+BLOB_TTL_SECONDS = int(os.getenv("BLOB_TTL_SECONDS", str(24 * 3600)))
+BLOB_GC_INTERVAL_SECONDS = int(os.getenv("BLOB_GC_INTERVAL_SECONDS", "3600"))
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(BLOB_DIR, sha256[:2], sha256)
+
+
+class Attachment(BaseModel):
+    filename: str
+    content_type: str
+    sha256: str
+    size: int
+    kind: str  # "image" or "pdf"
+
+    @property
+    def path(self) -> str:
+        return blob_path(self.sha256)
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    async def read(self, size: int = -1) -> bytes:
+        # Same interface as UploadFile so the pipeline can treat both alike
+        return await asyncio.to_thread(self.read_bytes)
+
+
+def _write_chunk(f, chunk: bytes):
+    f.write(chunk)
+
+
+def _finalize_blob(tmp_path: str, sha256: str):
+    final = blob_path(sha256)
+    if os.path.exists(final):
+        # Already stored by an earlier upload of the same content; it is in use again
+        os.remove(tmp_path)
+        os.utime(final)
+        return
+    os.makedirs(os.path.dirname(final), exist_ok=True)
+    os.replace(tmp_path, final)
+
+
+async def _stream_to_blob(upload, budget: int) -> Tuple[str, int]:
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    h = hashlib.sha256()
+    size = 0
+    tmp = tempfile.NamedTemporaryFile(dir=BLOB_DIR, prefix=".upload-", delete=False)
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > UPLOAD_MAX_FILE_BYTES:
+                raise HTTPException(status_code=413, detail=f"{upload.filename} exceeds the {UPLOAD_MAX_FILE_BYTES} byte per-file limit")
+            if size > budget:
+                raise HTTPException(status_code=413, detail=f"Uploads exceed the {UPLOAD_MAX_REQUEST_BYTES} byte per-request limit")
+            h.update(chunk)
+            await asyncio.to_thread(_write_chunk, tmp, chunk)
+        tmp.close()
+        sha256 = h.hexdigest()
+        await asyncio.to_thread(_finalize_blob, tmp.name, sha256)
+        return sha256, size
+    except BaseException:
+        tmp.close()
+        if os.path.exists(tmp.name):
+            os.remove(tmp.name)
+        raise
+
+
+async def ingest_uploads(images, pdfs) -> Tuple[List[Attachment], List[Attachment]]:
+    budget = UPLOAD_MAX_REQUEST_BYTES
+    seen = set()
+    result = {"image": [], "pdf": []}
+    for kind, uploads in (("image", images), ("pdf", pdfs)):
+        for upload in uploads or []:
+            sha256, size = await _stream_to_blob(upload, budget)
+            if sha256 in seen:
+                # The same file attached twice is only sent to the LLM once
+                continue
+            seen.add(sha256)
+            budget -= size
+            content_type = upload.content_type or mimetypes.guess_type(upload.filename or "")[0] or "application/octet-stream"
+            result[kind].append(Attachment(
+                filename=upload.filename or sha256,
+                content_type=content_type,
+                sha256=sha256,
+                size=size,
+                kind=kind,
+            ))
+    return result["image"], result["pdf"]
+
+
+async def ingest_named_uploads(files) -> Dict[str, Attachment]:
+    # For batch submissions: items refer to attachments by filename, so a file
+    # shared by several items is uploaded, stored and preprocessed once
+    budget = UPLOAD_MAX_REQUEST_BYTES
+    result = {}
+    for upload in files or []:
+        name = upload.filename or ""
+        if name in result:
+            raise HTTPException(status_code=400, detail=f"Duplicate attachment filename: {name!r}")
+        sha256, size = await _stream_to_blob(upload, budget)
+        budget -= size
+        content_type = upload.content_type or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        kind = "pdf" if content_type == "application/pdf" or name.lower().endswith(".pdf") else "image"
+        result[name] = Attachment(filename=name or sha256, content_type=content_type, sha256=sha256, size=size, kind=kind)
+    return result
+
+
+def load_attachments(stored: Optional[list]) -> List[Attachment]:
+    return [Attachment(**a) for a in stored or []]
+
+
+class UploadLimitMiddleware:
+    def __init__(self, app, max_body_bytes: int = UPLOAD_MAX_BODY_BYTES):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        detail = f"Request body exceeds the {self.max_body_bytes} byte limit"
+        declared = headers.get("content-length", "")
+        if declared.isdigit() and int(declared) > self.max_body_bytes:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    # Raised inside the form parser, before the rest is spooled
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _expired_blobs(keep: Set[str], cutoff: float) -> int:
+    removed = 0
+    derived = os.path.join(BLOB_DIR, "derived")
+    for root, _, files in os.walk(BLOB_DIR):
+        for name in files:
+            # Content blobs, preprocessing manifests, and temp files of uploads that never finished
+            manifest = root == derived and name.endswith(".json")
+            if name in keep or not (len(name) == 64 or manifest or name.startswith(".upload-")):
+                continue
+            path = os.path.join(root, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+async def collect_blobs(ttl: int = BLOB_TTL_SECONDS) -> int:
+    keep = set()
+    async for job in db.jobs.find({"status": {"$in": ["queued", "running"]}}, {"images": 1, "pdfs": 1}):
+        keep.update(a["sha256"] for a in (job.get("images") or []) + (job.get("pdfs") or []))
+    return await asyncio.to_thread(_expired_blobs, keep, time.time() - ttl)
+
+
+class BlobCollector:
+    def __init__(self, interval: int = BLOB_GC_INTERVAL_SECONDS):
+        self.interval = interval
+        self.removed = 0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                self.removed += await collect_blobs()
+            except Exception as e:
+                print("Blob GC failed:", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+blob_collector = BlobCollector()
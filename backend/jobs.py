@@ -0,0 +1,270 @@
+import asyncio
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from backend.db import db
+from backend.orgview_service import OrgViewService
+from backend.ingest import load_attachments
+from backend.llm_gateway import LLMOverloaded, set_llm_context, PRIORITY_BULK
+from backend.llm_resilience import CircuitOpen
+
+# Background generation jobs. Job records live in db.jobs so any worker process
+# can pick them up; a worker holds a lease that it renews while running, and a
+# job whose lease expired (worker crashed/restarted) is claimed again.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+SSE_POLL_SECONDS = float(os.getenv("SSE_POLL_SECONDS", "0.5"))
+SSE_KEEPALIVE_SECONDS = 15
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+async def submit_job(user_id: str, context: dict, images, pdfs) -> str:
+    # images/pdfs are ingested Attachments; only their blob references are stored
+    now = datetime.utcnow()
+    job = {
+        "user_id": user_id,
+        "status": "queued",
+        "stage": None,
+        "context": context,
+        "images": [a.model_dump() for a in images],
+        "pdfs": [a.model_dump() for a in pdfs],
+        "stages": {},
+        "events": [],
+        "attempts": 0,
+        "error": None,
+        "result": None,
+        "lease_until": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    result = await db.jobs.insert_one(job)
+    job_pool.notify()
+    return str(result.inserted_id)
+
+
+async def get_job(job_id: str, user_id: str, projection: Optional[dict] = None):
+    if not ObjectId.is_valid(job_id):
+        return None
+    return await db.jobs.find_one({"_id": ObjectId(job_id), "user_id": user_id}, projection)
+
+
+def job_status(job: dict) -> dict:
+    return {
+        "job_id": str(job["_id"]),
+        "status": job.get("status"),
+        "stage": job.get("stage"),
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "result": job.get("result"),
+        "stages": {
+            name: {k: v for k, v in info.items() if k != "result"}
+            for name, info in (job.get("stages") or {}).items()
+        },
+        "created_at": job.get("created_at"),
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+    }
+
+
+class JobWorkerPool:
+    def __init__(self, size: int = JOB_WORKERS):
+        self.size = size
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.service = OrgViewService()
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.size)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _claim(self):
+        now = datetime.utcnow()
+        return await db.jobs.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "running", "lease_until": {"$lt": now}},
+                ],
+                "attempts": {"$lt": JOB_MAX_ATTEMPTS},
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": WORKER_ID,
+                    "lease_until": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "started_at": now,
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _fail_abandoned(self):
+        # Jobs that kept losing their worker are given up on rather than retried forever.
+        # Queued jobs with no attempts left can't be claimed any more either.
+        now = datetime.utcnow()
+        await db.jobs.update_many(
+            {
+                "$or": [{"status": "running", "lease_until": {"$lt": now}}, {"status": "queued"}],
+                "attempts": {"$gte": JOB_MAX_ATTEMPTS},
+            },
+            {"$set": {"status": "failed", "error": "Job abandoned after repeated worker loss", "finished_at": now, "updated_at": now}},
+        )
+
+    async def _worker(self, index: int):
+        while True:
+            try:
+                job = await self._claim()
+                if job is None:
+                    await self._fail_abandoned()
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job worker {index} error:", e)
+                await asyncio.sleep(JOB_POLL_SECONDS)
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            await db.jobs.update_one(
+                {"_id": job_id, "worker_id": WORKER_ID},
+                {"$set": {"lease_until": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}},
+            )
+
+    async def _run(self, job: dict):
+        job_id = job["_id"]
+        attempt = job["attempts"]
+        started = datetime.utcnow()
+        stage_started = {"at": started}
+
+        async def on_stage(stage, payload):
+            now = datetime.utcnow()
+            await db.jobs.update_one(
+                {"_id": job_id, "worker_id": WORKER_ID},
+                {
+                    "$set": {
+                        "stage": stage,
+                        f"stages.{stage}": {
+                            "finished_at": now,
+                            "elapsed_ms": round((now - started).total_seconds() * 1000),
+                            "since_previous_ms": round((now - stage_started["at"]).total_seconds() * 1000),
+                            "attempt": attempt,
+                            "result": payload,
+                        },
+                        "updated_at": now,
+                    },
+                    "$push": {"events": {"stage": stage, "attempt": attempt, "at": now}},
+                },
+            )
+            stage_started["at"] = now
+
+        set_llm_context(job["user_id"], PRIORITY_BULK)
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            context = job["context"]
+            images = load_attachments(job.get("images"))
+            pdfs = load_attachments(job.get("pdfs"))
+            view = await self.service.build_org_view_coalesced(images=images, pdfs=pdfs, on_stage=on_stage, user_id=job["user_id"], **context)
+            result = await self.service.save_org_view(job["user_id"], view)
+            await on_stage("saved", result)
+            now = datetime.utcnow()
+            await db.jobs.update_one(
+                {"_id": job_id, "worker_id": WORKER_ID},
+                {"$set": {"status": "done", "result": result, "finished_at": now, "updated_at": now, "lease_until": None}},
+            )
+        except asyncio.CancelledError:
+            # Shutting down: release the lease so another worker resumes the job, and
+            # give back the attempt _claim spent (the job did not fail)
+            await db.jobs.update_one(
+                {"_id": job_id, "worker_id": WORKER_ID},
+                {"$set": {"status": "queued", "lease_until": None, "updated_at": datetime.utcnow()}, "$inc": {"attempts": -1}},
+            )
+            raise
+        except (LLMOverloaded, CircuitOpen) as e:
+            # Not the job's fault: put it back without spending an attempt and back off
+            await db.jobs.update_one(
+                {"_id": job_id, "worker_id": WORKER_ID},
+                {"$set": {"status": "queued", "lease_until": None, "updated_at": datetime.utcnow()}, "$inc": {"attempts": -1}},
+            )
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            print("Generation job failed:", e)
+            now = datetime.utcnow()
+            status = "failed" if attempt >= JOB_MAX_ATTEMPTS else "queued"
+            await db.jobs.update_one(
+                {"_id": job_id, "worker_id": WORKER_ID},
+                {"$set": {"status": status, "error": str(e), "finished_at": now if status == "failed" else None,
+                          "updated_at": now, "lease_until": None}},
+            )
+        finally:
+            heartbeat.cancel()
+
+
+job_pool = JobWorkerPool()
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream_job_events(job_id: str, user_id: str, request):
+    # Server-Sent Events: one event per completed stage, then a final "done"/"failed"
+    sent = 0
+    idle = 0.0
+    while True:
+        if await request.is_disconnected():
+            return
+        job = await get_job(job_id, user_id, {"images": 0, "pdfs": 0})
+        if job is None:
+            yield _sse("error", {"error": "Job not found."})
+            return
+        events = job.get("events") or []
+        for event in events[sent:]:
+            stage = event["stage"]
+            info = (job.get("stages") or {}).get(stage, {})
+            yield _sse(stage, {
+                "stage": stage,
+                "attempt": event.get("attempt"),
+                "elapsed_ms": info.get("elapsed_ms"),
+                "result": info.get("result"),
+            })
+            idle = 0.0
+        sent = len(events)
+        if job.get("status") in TERMINAL_STATUSES:
+            yield _sse(job["status"], job_status(job))
+            return
+        await asyncio.sleep(SSE_POLL_SECONDS)
+        idle += SSE_POLL_SECONDS
+        if idle >= SSE_KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            idle = 0.0
@@ -1,11 +1,17 @@
-from pydantic import BaseModel, Field, RootModel
+from pydantic import BaseModel, Field, RootModel, ValidationError
 from typing import List, Optional, Dict, Any, Union
-from langchain.chat_models import init_chat_model
-from langchain.output_parsers import PydanticOutputParser
-from langchain.prompts import PromptTemplate
 from datetime import datetime
-import mimetypes
+import asyncio
 import json
+from collections import deque
+import os
+from backend.cache import llm_cache
+from backend.llm_gateway import estimate_tokens
+from backend.llm_resilience import resilient_llm
+from backend.preprocess import prepare_attachment_parts
+from backend.layout import apply_layout
+from backend.metrics import llm_requests, record_tokens, stage_timer
+from backend.analytics import record_llm_usage
 
 # Pydantic models
 class WorkflowSummary(BaseModel):
@@ -37,13 +43,39 @@ class WorkflowSummaryList(RootModel[List[WorkflowSummary]]):
     pass
 
 # React Flow conversion
-import uuid
-
-def workflowdetail_to_reactflow(workflow):
+import hashlib
+
+def _step_node_id(path: str, actor, action, step_type) -> str:
+    content = f"{path}|{actor or ''}|{action}|{step_type or ''}"
+    return "n" + hashlib.sha1(content.encode()).hexdigest()[:16]
+
+def reactflow_node_id(path: str, step) -> str:
+    # Stable across calls: derived from the step's position in the tree and its content
+    return _step_node_id(path, getattr(step, 'actor', ''), step.action, getattr(step, 'type', None))
+
+def _steps_by_node_id(workflow_json: dict) -> dict:
+    # The node id each step of a stored workflow was drawn with, see _build_reactflow
+    found = {}
+    pending = [(str(index), step) for index, step in enumerate(workflow_json.get('steps') or [])]
+    while pending:
+        path, step = pending.pop()
+        found[_step_node_id(path, step.get('actor'), step.get('action'), step.get('type'))] = step
+        pending.extend((f"{path}.{index}", sub) for index, sub in enumerate(step.get('substeps') or []))
+    return found
+
+def workflowdetail_to_reactflow(workflow, previous: Optional[dict] = None):
+    # With `previous` (an earlier react flow graph) only the changes are returned, see reactflow_delta
+    with stage_timer("react_flow"):
+        graph = _build_reactflow(workflow)
+    if previous is not None:
+        return reactflow_delta(previous, graph)
+    return graph
+
+def _build_reactflow(workflow):
     nodes = []
     edges = []
-    def add_step_nodes(step, parent_id=None, depth=0):
-        step_id = str(uuid.uuid4())
+    def add_step_nodes(step, path, parent_id=None):
+        step_id = reactflow_node_id(path, step)
         node = {
             "id": step_id,
             "type": "default",
@@ -52,7 +84,6 @@ def workflowdetail_to_reactflow(workflow):
                 "nodeType": getattr(step, "type", None),
                 "description": getattr(step, "ai_recommendation", None)
             },
-            "position": {"x": depth * 200, "y": len(nodes) * 100},
         }
         if parent_id:
             node["parentNode"] = parent_id
@@ -61,8 +92,8 @@ def workflowdetail_to_reactflow(workflow):
         last_id = step_id
         if getattr(step, "substeps", None):
             prev_sub_id = None
-            for sub in step.substeps:
-                sub_id = add_step_nodes(sub, parent_id=step_id, depth=depth+1)
+            for index, sub in enumerate(step.substeps):
+                sub_id = add_step_nodes(sub, f"{path}.{index}", parent_id=step_id)
                 if prev_sub_id is None:
                     edges.append({"id": f"e{step_id}-{sub_id}", "source": step_id, "target": sub_id, "type": "default"})
                 else:
@@ -71,54 +102,282 @@ def workflowdetail_to_reactflow(workflow):
             last_id = prev_sub_id
         return step_id
     prev_id = None
-    for step in workflow.steps:
-        step_id = add_step_nodes(step)
+    for index, step in enumerate(workflow.steps):
+        step_id = add_step_nodes(step, str(index))
         if prev_id:
             edges.append({"id": f"e{prev_id}-{step_id}", "source": prev_id, "target": step_id, "type": "default"})
         prev_id = step_id
+    apply_layout(nodes, edges)
+    return {"nodes": nodes, "edges": edges}
+
+def reactflow_delta(previous: dict, current: dict) -> dict:
+    prev_nodes = {n["id"]: n for n in previous.get("nodes", [])}
+    cur_nodes = {n["id"]: n for n in current.get("nodes", [])}
+    prev_edges = {e["id"] for e in previous.get("edges", [])}
+    cur_edges = {e["id"] for e in current.get("edges", [])}
+    return {
+        "added_nodes": [n for node_id, n in cur_nodes.items() if node_id not in prev_nodes],
+        "updated_nodes": [n for node_id, n in cur_nodes.items() if node_id in prev_nodes and prev_nodes[node_id] != n],
+        "removed_node_ids": [node_id for node_id in prev_nodes if node_id not in cur_nodes],
+        "added_edges": [e for e in current.get("edges", []) if e["id"] not in prev_edges],
+        "removed_edge_ids": [e["id"] for e in previous.get("edges", []) if e["id"] not in cur_edges],
+    }
+
+def apply_reactflow_delta(previous: dict, delta: dict) -> dict:
+    # Inverse of reactflow_delta; node order follows `previous`, new nodes appended
+    removed = set(delta.get("removed_node_ids", []))
+    updated = {n["id"]: n for n in delta.get("updated_nodes", [])}
+    nodes = [updated.get(n["id"], n) for n in previous.get("nodes", []) if n["id"] not in removed]
+    nodes += delta.get("added_nodes", [])
+    removed_edges = set(delta.get("removed_edge_ids", []))
+    edges = [e for e in previous.get("edges", []) if e["id"] not in removed_edges]
+    edges += delta.get("added_edges", [])
     return {"nodes": nodes, "edges": edges}
 
-def reactflow_to_workflowdetail(nodes, edges):
-    node_lookup = {node['id']: node for node in nodes}
-    children = {}
+def workflow_reactflow_delta(original: dict, patched: dict) -> Optional[dict]:
+    # Delta between the canonical graphs of two stored workflow_json documents
+    try:
+        previous = workflowdetail_to_reactflow(WorkflowDetail.model_validate(original))
+        return workflowdetail_to_reactflow(WorkflowDetail.model_validate(patched), previous=previous)
+    except ValidationError:
+        return None
+
+def _split_label(label):
+    if not isinstance(label, str):
+        label = "" if label is None else str(label)
+    if ':' in label:
+        actor, action = label.split(':', 1)
+        return actor.strip(), action.strip()
+    return '', label
+
+def _order_siblings(siblings, successors, issues):
+    # Kahn's algorithm over the edges between siblings; ties keep node-list order.
+    # A cycle is broken at its earliest node and reported.
+    indegree = {node_id: 0 for node_id in siblings}
+    for node_id in siblings:
+        for target in successors.get(node_id, ()):
+            indegree[target] += 1
+    ready = deque(node_id for node_id in siblings if indegree[node_id] == 0)
+    ordered = []
+    placed = set()
+    next_unplaced = 0
+    cyclic = []
+    while len(ordered) < len(siblings):
+        if not ready:
+            while siblings[next_unplaced] in placed:
+                next_unplaced += 1
+            cyclic.append(siblings[next_unplaced])
+            ready.append(siblings[next_unplaced])
+        node_id = ready.popleft()
+        if node_id in placed:
+            continue
+        placed.add(node_id)
+        ordered.append(node_id)
+        for target in successors.get(node_id, ()):
+            if target in placed:
+                continue
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                ready.append(target)
+    if cyclic:
+        issues.append({"type": "cycle", "node_ids": cyclic, "message": "Edges between sibling steps form a cycle; it was broken at these steps"})
+    return ordered
+
+def reactflow_to_workflowdetail(nodes, edges, issues: Optional[list] = None, original: Optional[dict] = None):
+    # Iterative and O(N + E): sibling steps are ordered by the edges between them,
+    # nesting follows parentNode. Problems with the graph (duplicate ids, orphans,
+    # dangling edges, cycles) are appended to `issues` and worked around.
+    # With `original` (the stored workflow the diagram was drawn from), nodes that
+    # kept their id get back what the diagram does not show (actor, type, AI
+    # recommendation) and the workflow keeps its name and actor order, so an
+    # unchanged diagram reconstructs to the same workflow.
+    if issues is None:
+        issues = []
+    original_steps = _steps_by_node_id(original) if original else {}
+    node_lookup = {}
+    order = []
     for node in nodes:
-        parent = node.get('parentNode')
-        if parent:
-            children.setdefault(parent, []).append(node['id'])
-    edge_map = {}
+        node_id = node.get('id') if isinstance(node, dict) else None
+        if not isinstance(node_id, str) or not node_id:
+            issues.append({"type": "invalid_node", "node_ids": [], "message": "Node without an id was ignored"})
+            continue
+        if node_id in node_lookup:
+            issues.append({"type": "duplicate_node", "node_ids": [node_id], "message": "Duplicate node id; the first occurrence was kept"})
+            continue
+        node_lookup[node_id] = node
+        order.append(node_id)
+    parent_of = {}
+    orphans = []
+    for node_id in order:
+        parent = node_lookup[node_id].get('parentNode')
+        if parent and parent in node_lookup and parent != node_id:
+            parent_of[node_id] = parent
+        elif parent:
+            orphans.append(node_id)
+    if orphans:
+        issues.append({"type": "orphan", "node_ids": orphans, "message": "Parent node not found; these steps were moved to the top level"})
+    children = {None: []}
+    for node_id in order:
+        children.setdefault(parent_of.get(node_id), []).append(node_id)
+    # Nodes unreachable from the top level have cyclic parentNode chains
+    reachable = set()
+    stack = list(children[None])
+    while stack:
+        node_id = stack.pop()
+        reachable.add(node_id)
+        stack.extend(children.get(node_id, ()))
+    if len(reachable) < len(order):
+        detached = []
+        for node_id in order:
+            if node_id in reachable:
+                continue
+            detached.append(node_id)
+            children[parent_of.pop(node_id)].remove(node_id)
+            children[None].append(node_id)
+            stack = [node_id]
+            while stack:
+                current = stack.pop()
+                reachable.add(current)
+                stack.extend(children.get(current, ()))
+        issues.append({"type": "parent_cycle", "node_ids": detached, "message": "parentNode references form a cycle; these steps were moved to the top level"})
+    successors = {}
+    dangling = []
     for edge in edges:
-        edge_map.setdefault(edge['source'], []).append(edge['target'])
-    def build_step(node_id):
-        node = node_lookup[node_id]
-        label = node['data']['label']
-        if ':' in label:
-            actor, action = label.split(':', 1)
-            actor = actor.strip()
-            action = action.strip()
+        source, target = edge.get('source'), edge.get('target')
+        if source not in node_lookup or target not in node_lookup:
+            dangling.append(edge.get('id'))
+        elif source != target and parent_of.get(source) == parent_of.get(target):
+            successors.setdefault(source, []).append(target)
+    if dangling:
+        issues.append({"type": "dangling_edge", "edge_ids": dangling, "message": "Edges referencing unknown nodes were ignored"})
+    steps = {}
+    for node_id in order:
+        data = node_lookup[node_id].get('data')
+        data = data if isinstance(data, dict) else {}
+        actor, action = _split_label(data.get('label'))
+        if not action:
+            issues.append({"type": "empty_label", "node_ids": [node_id], "message": "Step has no action text"})
+        source = original_steps.get(node_id)
+        if source is not None:
+            steps[node_id] = {
+                'actor': actor or source.get('actor') or '',
+                'action': action,
+                'substeps': None,
+                'ai_recommendation': source.get('ai_recommendation'),
+                'type': source.get('type'),
+            }
         else:
-            actor, action = '', label
-        substeps = [build_step(child_id) for child_id in children.get(node_id, [])]
-        return {
-            'actor': actor,
-            'action': action,
-            'substeps': substeps if substeps else None
-        }
-    top_level = [n['id'] for n in nodes if not n.get('parentNode')]
-    steps = [build_step(node_id) for node_id in top_level]
-    actors = list({step['actor'] for step in steps if step['actor']})
+            steps[node_id] = {
+                'actor': actor,
+                'action': action,
+                'substeps': None,
+                'ai_recommendation': data.get('description'),
+                'type': data.get('nodeType'),
+            }
+    for parent, siblings in children.items():
+        ordered = _order_siblings(siblings, successors, issues)
+        if parent is None:
+            top_level = ordered
+        elif ordered:
+            steps[parent]['substeps'] = [steps[node_id] for node_id in ordered]
+    top_steps = [steps[node_id] for node_id in top_level]
+    # Deterministic: the original's actors first, then new ones in step order
+    actors = list(dict.fromkeys(
+        [a for a in (original or {}).get('actors') or [] if a] + [step['actor'] for step in top_steps if step['actor']]
+    ))
     return {
-        'name': 'Reconstructed Workflow',
+        'name': (original or {}).get('name') or 'Reconstructed Workflow',
         'actors': actors,
-        'steps': steps,
+        'steps': top_steps,
     }
 
-# LangChain Gemini model
-model = init_chat_model("gemini-2.5-flash", model_provider="google_genai")
-
-def extract_workflow_summaries(context: dict, files: List[Any]) -> Optional[WorkflowSummary]:
-    parser = PydanticOutputParser(pydantic_object=WorkflowSummary)
-    prompt = PromptTemplate(
-        template="""
+# LangChain Gemini model. LangChain and the Gemini client are imported on first
+# use rather than at import time: they dominate worker start-up and most
+# requests never reach the model. warm_up_prompts() primes the templates.
+MODEL_NAME = "gemini-2.5-flash"
+_model = None
+
+def get_model():
+    global _model
+    if _model is None:
+        from langchain.chat_models import init_chat_model
+        _model = init_chat_model(MODEL_NAME, model_provider="google_genai")
+    return _model
+
+# name -> (template, input variables, output schema); built into PromptTemplates by get_prompt
+PROMPT_TEMPLATES: Dict[str, tuple] = {}
+_prompts = {}
+_parsers = {}
+
+def register_prompt(name: str, template: str, input_variables: List[str], schema=None):
+    # schema: the pydantic model the response is parsed into with get_parser, if any
+    PROMPT_TEMPLATES[name] = (template, input_variables, schema)
+
+def get_prompt(name: str):
+    prompt = _prompts.get(name)
+    if prompt is None:
+        from langchain.prompts import PromptTemplate
+        template, input_variables, _ = PROMPT_TEMPLATES[name]
+        prompt = _prompts[name] = PromptTemplate(template=template, input_variables=input_variables)
+    return prompt
+
+def get_parser(schema):
+    parser = _parsers.get(schema)
+    if parser is None:
+        from langchain.output_parsers import PydanticOutputParser
+        parser = _parsers[schema] = PydanticOutputParser(pydantic_object=schema)
+    return parser
+
+def warm_up_prompts():
+    for name, (_, _, schema) in PROMPT_TEMPLATES.items():
+        get_prompt(name)
+        if schema is not None:
+            get_parser(schema)
+
+def response_cache_key(prompt_input, schema=None) -> str:
+    return llm_cache.make_key(MODEL_NAME, prompt_input, schema)
+
+def _record_usage(stage, input_tokens: int, output_tokens: int):
+    record_tokens(stage, input_tokens, output_tokens)
+    record_llm_usage(input_tokens, output_tokens)
+
+async def _attempt_model(usage, prompt_input, schema=None, stage=None):
+    # One provider call, made while holding the gateway slot `usage` belongs to
+    if schema is not None:
+        result = await get_model().with_structured_output(schema).ainvoke(prompt_input)
+        # Structured output carries no usage metadata; estimate both sides
+        _record_usage(stage, estimate_tokens(prompt_input), len(result.model_dump_json()) // 4)
+        return result
+    response = await get_model().ainvoke(prompt_input)
+    usage_metadata = getattr(response, "usage_metadata", None)
+    if usage_metadata:
+        usage["tokens"] = usage_metadata.get("total_tokens")
+        _record_usage(stage, usage_metadata.get("input_tokens") or 0, usage_metadata.get("output_tokens") or 0)
+    else:
+        _record_usage(stage, estimate_tokens(prompt_input), len(str(response.content)) // 4)
+    return response
+
+async def invoke_model(prompt_input, schema=None, stage=None):
+    # Every LLM call goes through here. Returns the response text, or an instance
+    # of `schema` when structured output is requested. Responses are cached by
+    # model, prompt and attachment hashes (see backend.cache); misses wait for
+    # admission by the gateway (see backend.llm_gateway), then are retried/hedged
+    # under the stage's deadline, which starts once admitted (see backend.llm_resilience).
+    with stage_timer(stage or "default"):
+        key = response_cache_key(prompt_input, schema)
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            llm_requests.inc(stage=stage or "default", cache="hit")
+            return schema.model_validate_json(cached) if schema is not None else cached
+        llm_requests.inc(stage=stage or "default", cache="miss")
+        result = await resilient_llm.call(stage, lambda usage: _attempt_model(usage, prompt_input, schema, stage), prompt_input)
+        if schema is not None:
+            await llm_cache.set(key, result.model_dump_json())
+            return result
+        await llm_cache.set(key, result.content)
+        return result.content
+
+register_prompt("summary", """
 Given the following business process information, summarize the overall process as a single workflow. Provide its name and a short description. Return the result as a JSON object with 'name' and 'description' fields.
 
 Department Function: {department_function}
@@ -128,29 +387,27 @@ Description: {description}
 (Attached files may include images or PDFs.)
 
 JSON object:
-""",
-        input_variables=["department_function", "team_size", "budget", "description"]
-    )
+""", ["department_function", "team_size", "budget", "description"], WorkflowSummary)
+
+async def extract_workflow_summaries(context: dict, attachment_parts: List[Any]) -> Optional[WorkflowSummary]:
+    # attachment_parts: prompt parts from backend.preprocess.prepare_attachment_parts
+    parser = get_parser(WorkflowSummary)
+    prompt = get_prompt("summary")
     multimodal_input = []
     formatted_prompt = prompt.format(**context)
     multimodal_input.append(formatted_prompt)
-    for f in files:
-        content = f.file.read()
-        mime = f.content_type or mimetypes.guess_type(f.filename)[0] or "application/octet-stream"
-        multimodal_input.append({"mime_type": mime, "data": content})
-    response = model.invoke(multimodal_input)
+    multimodal_input.extend(attachment_parts)
+    content = await invoke_model(multimodal_input, stage="summary")
     try:
-        summary = parser.parse(response.content)
+        summary = parser.parse(content)
         return summary
     except Exception as e:
         print("Error parsing workflow summary:", e)
-        print("Raw response was:\n", response.content)
+        print("Raw response was:\n", content)
+        await llm_cache.discard(response_cache_key(multimodal_input))
         return None
 
-def extract_workflow_details(summary: WorkflowSummary, context: str = "") -> WorkflowDetail:
-    parser = PydanticOutputParser(pydantic_object=WorkflowDetail)
-    prompt = PromptTemplate(
-        template="""
+register_prompt("detail", """
 Given the following workflow summary, provide a detailed workflow structure as a JSON object with the following fields:
 - name: string
 - actors: list of strings (roles or people involved)
@@ -170,19 +427,21 @@ Description: {description}
 {context}
 
 JSON object:
-""",
-        input_variables=["name", "description", "context"]
-    )
+""", ["name", "description", "context"], WorkflowDetail)
+
+async def extract_workflow_details(summary: WorkflowSummary, context: str = "") -> WorkflowDetail:
+    parser = get_parser(WorkflowDetail)
+    prompt = get_prompt("detail")
     formatted_prompt = prompt.format(name=summary.name, description=summary.description, context=context)
-    response = model.invoke(formatted_prompt)
+    content = await invoke_model(formatted_prompt, stage="detail")
     try:
-        detail = parser.parse(response.content)
+        detail = parser.parse(content)
     except Exception as e:
         # Fallback: try to fill missing 'actor' in substeps
         import json as pyjson
         import copy
         try:
-            data = pyjson.loads(response.content.strip('`\n '))
+            data = pyjson.loads(content.strip('`\n '))
             def fill_actors(steps, parent_actor=None):
                 for step in steps:
                     if 'actor' not in step or not step['actor']:
@@ -193,15 +452,28 @@ JSON object:
                 fill_actors(data['steps'])
             detail = WorkflowDetail(**data)
         except Exception as e2:
+            await llm_cache.discard(response_cache_key(formatted_prompt))
             detail = WorkflowDetail(name=summary.name, actors=[], steps=[])
     return detail
 
-def multimodal_pipeline(context: dict, images: List[Any], pdfs: List[Any]):
+async def emit_stage(on_stage, stage: str, payload: Any):
+    # on_stage is an optional async callback used to report progress (see backend.jobs)
+    if on_stage is not None:
+        await on_stage(stage, payload)
+
+async def multimodal_pipeline(context: dict, images: List[Any], pdfs: List[Any], on_stage=None, examples: str = ""):
+    # examples: outlines of similar past workflows for the detail prompt (see backend.similarity)
     files = (images or []) + (pdfs or [])
-    summary = extract_workflow_summaries(context, files)
+    attachment_parts, preprocess_report = await prepare_attachment_parts(files)
+    if files:
+        await emit_stage(on_stage, "preprocess", preprocess_report)
+    summary = await extract_workflow_summaries(context, attachment_parts)
     if summary:
-        detail = extract_workflow_details(summary)
+        await emit_stage(on_stage, "summary", summary.model_dump())
+        detail = await extract_workflow_details(summary, examples)
+        await emit_stage(on_stage, "detail", detail.model_dump())
         reactflow = workflowdetail_to_reactflow(detail)
+        await emit_stage(on_stage, "react_flow", reactflow)
         return detail, reactflow
     return None, {"nodes": [], "edges": []}
 
@@ -217,10 +489,69 @@ class CompactWorkflow(BaseModel):
     actors: List[str]
     steps: List[CompactStep]
 
-def group_and_automate_workflow(workflow_json: dict, icon_list: Optional[list] = None) -> CompactWorkflow:
-    # icon_list is not used in the prompt anymore, but kept for compatibility
-    prompt = PromptTemplate(
-        template="""
+# Bump whenever the group/automate prompt changes so cached AI graphs are recomputed
+AUTOMATE_PROMPT_VERSION = "1"
+
+# Workflows whose JSON is estimated above this many tokens are automated in chunks
+AUTOMATE_CHUNK_TOKENS = int(os.getenv("AUTOMATE_CHUNK_TOKENS", "6000"))
+
+def estimate_json_tokens(value) -> int:
+    return len(json.dumps(value, separators=(",", ":"), default=str)) // 4
+
+def split_workflow(workflow_json: dict, token_budget: int = AUTOMATE_CHUNK_TOKENS) -> List[dict]:
+    # Packs consecutive top-level steps, then subworkflows, into partial workflows
+    # that each stay under token_budget. A single oversized unit gets its own chunk.
+    units = [("steps", step) for step in workflow_json.get("steps") or []]
+    units += [("subworkflows", sub) for sub in workflow_json.get("subworkflows") or []]
+    chunks = []
+    current = {"steps": [], "subworkflows": []}
+    current_tokens = 0
+    for field, unit in units:
+        tokens = estimate_json_tokens(unit)
+        if current_tokens and current_tokens + tokens > token_budget:
+            chunks.append(current)
+            current = {"steps": [], "subworkflows": []}
+            current_tokens = 0
+        current[field].append(unit)
+        current_tokens += tokens
+    if current["steps"] or current["subworkflows"]:
+        chunks.append(current)
+    name = workflow_json.get("name", "Workflow")
+    return [
+        {
+            "name": f"{name} (part {i + 1} of {len(chunks)})",
+            "actors": workflow_json.get("actors") or [],
+            "steps": chunk["steps"],
+            "subworkflows": chunk["subworkflows"] or None,
+        }
+        for i, chunk in enumerate(chunks)
+    ]
+
+def merge_compact_workflows(name: str, parts: List[CompactWorkflow]) -> CompactWorkflow:
+    actors = []
+    seen = set()
+    steps = []
+    for part in parts:
+        for actor in part.actors:
+            if actor not in seen:
+                seen.add(actor)
+                actors.append(actor)
+        steps.extend(part.steps)
+    return CompactWorkflow(name=name, actors=actors, steps=steps)
+
+async def group_and_automate_workflow(workflow_json: dict, icon_list: Optional[list] = None, chunked: Optional[bool] = None) -> CompactWorkflow:
+    # icon_list is not used in the prompt anymore, but kept for compatibility.
+    # chunked: None decides by size; chunks are automated concurrently and merged in order.
+    if chunked is None:
+        chunked = estimate_json_tokens(workflow_json) > AUTOMATE_CHUNK_TOKENS
+    if chunked:
+        chunks = split_workflow(workflow_json)
+        if len(chunks) > 1:
+            parts = await asyncio.gather(*[_automate_workflow(chunk) for chunk in chunks])
+            return merge_compact_workflows(workflow_json.get("name", "Workflow"), parts)
+    return await _automate_workflow(workflow_json)
+
+register_prompt("automate", """
 Available Node Types
 Use ONLY these specific types for the 'type' field in each AI pipeline node:
 
@@ -277,11 +608,10 @@ Keeps manual steps separate only if they cannot be automated
 
 Workflow:
 {workflow_json}
-""",
-        input_variables=["workflow_json"]
-    )
+""", ["workflow_json"])
+
+async def _automate_workflow(workflow_json: dict) -> CompactWorkflow:
+    prompt = get_prompt("automate")
     formatted_prompt = prompt.format(workflow_json=json.dumps(workflow_json, indent=2))
     # Use LangChain's with_structured_output for parsing
-    structured_model = model.with_structured_output(CompactWorkflow)
-    response = structured_model.invoke(formatted_prompt)
-    return response 
\ No newline at end of file
+    return await invoke_model(formatted_prompt, schema=CompactWorkflow, stage="automate") 
\ No newline at end of file
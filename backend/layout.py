@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from backend.cache import TTLCache
+
+# Layered (Sugiyama-style) layout for the React Flow graphs we generate. Each
+# container (the canvas, or a step with substeps) is laid out on its own:
+#   1. ranks     longest path from the sources in Kahn order; cycles are broken
+#                at the earliest unplaced node
+#   2. ordering  barycenter sweeps (down, then up) over neighbour positions
+#   3. coords    per-layer cumulative widths/heights, vectorized with NumPy
+# Containers are processed deepest first, so a group node is sized to the
+# bounding box of its children. Child positions are relative to the parent,
+# which is what React Flow expects for nodes with a parentNode.
+
+LAYOUT_NODE_WIDTH = int(os.getenv("LAYOUT_NODE_WIDTH", "180"))
+LAYOUT_NODE_HEIGHT = int(os.getenv("LAYOUT_NODE_HEIGHT", "60"))
+LAYOUT_NODE_GAP = int(os.getenv("LAYOUT_NODE_GAP", "40"))
+LAYOUT_RANK_GAP = int(os.getenv("LAYOUT_RANK_GAP", "60"))
+LAYOUT_GROUP_PADDING = int(os.getenv("LAYOUT_GROUP_PADDING", "20"))
+LAYOUT_GROUP_HEADER = int(os.getenv("LAYOUT_GROUP_HEADER", "40"))
+LAYOUT_SWEEPS = int(os.getenv("LAYOUT_SWEEPS", "4"))
+LAYOUT_CACHE_ENTRIES = int(os.getenv("LAYOUT_CACHE_ENTRIES", "512"))
+LAYOUT_CACHE_TTL_SECONDS = int(os.getenv("LAYOUT_CACHE_TTL_SECONDS", "3600"))
+
+# graph hash -> {node id: (x, y, width, height, is_group)}
+layout_cache = TTLCache(LAYOUT_CACHE_ENTRIES, LAYOUT_CACHE_TTL_SECONDS)
+
+Box = Tuple[float, float, float, float, bool]
+
+
+def assign_ranks(count: int, sources: List[int], targets: List[int]) -> np.ndarray:
+    out = [[] for _ in range(count)]
+    indegree = [0] * count
+    for s, t in zip(sources, targets):
+        out[s].append(t)
+        indegree[t] += 1
+    rank = [0] * count
+    done = [False] * count
+    ready = deque(i for i in range(count) if indegree[i] == 0)
+    placed = 0
+    next_unplaced = 0
+    while placed < count:
+        if not ready:
+            # Only cycles remain; their unprocessed in-edges are treated as back edges
+            while done[next_unplaced]:
+                next_unplaced += 1
+            ready.append(next_unplaced)
+        v = ready.popleft()
+        if done[v]:
+            continue
+        done[v] = True
+        placed += 1
+        for w in out[v]:
+            if done[w]:
+                continue
+            rank[w] = max(rank[w], rank[v] + 1)
+            indegree[w] -= 1
+            if indegree[w] == 0:
+                ready.append(w)
+    return np.asarray(rank, dtype=np.int64)
+
+
+def order_layers(rank: np.ndarray, sources: np.ndarray, targets: np.ndarray, sweeps: int = LAYOUT_SWEEPS) -> np.ndarray:
+    # Returns the node indices sorted by (rank, position within rank)
+    count = len(rank)
+    order = np.lexsort((np.arange(count), rank))
+    sizes = np.bincount(rank)
+    if not len(sources) or sizes.max() <= 1:
+        return order
+    layers = np.split(order, np.cumsum(sizes)[:-1])
+    slot = np.empty(count, dtype=np.int64)
+    pos = np.empty(count)
+    for nodes in layers:
+        slot[nodes] = np.arange(len(nodes))
+        pos[nodes] = (slot[nodes] + 0.5) / len(nodes)
+    for sweep in range(sweeps):
+        # Down sweeps pull nodes towards their predecessors, up sweeps towards their successors
+        down = sweep % 2 == 0
+        here, there = (targets, sources) if down else (sources, targets)
+        by_layer = np.argsort(rank[here], kind="stable")
+        here, there = here[by_layer], there[by_layer]
+        bounds = np.searchsorted(rank[here], np.arange(len(sizes) + 1))
+        for layer in (range(len(sizes)) if down else reversed(range(len(sizes)))):
+            nodes = layers[layer]
+            lo, hi = bounds[layer], bounds[layer + 1]
+            if len(nodes) < 2 or lo == hi:
+                continue
+            local = slot[here[lo:hi]]
+            weight = np.bincount(local, minlength=len(nodes))
+            total = np.bincount(local, weights=pos[there[lo:hi]], minlength=len(nodes))
+            barycenter = np.where(weight > 0, total / np.maximum(weight, 1), pos[nodes])
+            nodes = nodes[np.argsort(barycenter, kind="stable")]
+            layers[layer] = nodes
+            slot[nodes] = np.arange(len(nodes))
+            pos[nodes] = (slot[nodes] + 0.5) / len(nodes)
+    return np.concatenate(layers)
+
+
+def assign_coordinates(rank: np.ndarray, order: np.ndarray, widths: np.ndarray, heights: np.ndarray) -> Tuple[np.ndarray, np.ndarray, float, float]:
+    # Layers stack top to bottom; nodes in a layer sit side by side, centered on the widest layer
+    count = len(rank)
+    ranks = rank[order]
+    span = widths[order] + LAYOUT_NODE_GAP
+    starts = np.flatnonzero(np.r_[True, ranks[1:] != ranks[:-1]])
+    sizes = np.diff(np.r_[starts, count])
+    ends = np.cumsum(span)
+    left = ends - span - np.repeat(ends[starts] - span[starts], sizes)
+    layer_width = np.add.reduceat(span, starts) - LAYOUT_NODE_GAP
+    total_width = float(layer_width.max())
+    left += np.repeat((total_width - layer_width) / 2, sizes)
+    node_heights = heights[order]
+    layer_height = np.maximum.reduceat(node_heights, starts)
+    layer_top = np.r_[0, np.cumsum(layer_height + LAYOUT_RANK_GAP)[:-1]]
+    top = np.repeat(layer_top, sizes) + (np.repeat(layer_height, sizes) - node_heights) / 2
+    x = np.empty(count)
+    y = np.empty(count)
+    x[order] = left
+    y[order] = top
+    return x, y, total_width, float(layer_top[-1] + layer_height[-1])
+
+
+def graph_key(nodes: List[dict], edges: List[dict]) -> str:
+    # Node ids are derived from step content, so structure alone identifies a layout
+    structure = [
+        [(n["id"], n.get("parentNode")) for n in nodes],
+        [(e["source"], e["target"]) for e in edges],
+        [LAYOUT_NODE_WIDTH, LAYOUT_NODE_HEIGHT, LAYOUT_NODE_GAP, LAYOUT_RANK_GAP, LAYOUT_GROUP_PADDING, LAYOUT_GROUP_HEADER, LAYOUT_SWEEPS],
+    ]
+    return hashlib.sha1(json.dumps(structure, separators=(",", ":")).encode()).hexdigest()
+
+
+def _compute_layout(nodes: List[dict], edges: List[dict]) -> Dict[str, Box]:
+    count = len(nodes)
+    index = {n["id"]: i for i, n in enumerate(nodes)}
+    parent = [index.get(n.get("parentNode")) for n in nodes]
+    members: Dict[Optional[int], List[int]] = {}
+    for i in range(count):
+        members.setdefault(parent[i], []).append(i)
+    # Only edges between siblings take part in a container's layout
+    container_edges: Dict[Optional[int], List[Tuple[int, int]]] = {}
+    for e in edges:
+        s, t = index.get(e["source"]), index.get(e["target"])
+        if s is not None and t is not None and s != t and parent[s] == parent[t]:
+            container_edges.setdefault(parent[s], []).append((s, t))
+    depth = [0] * count
+    for i in range(count):
+        # Parents precede their children in the node list
+        if parent[i] is not None:
+            depth[i] = depth[parent[i]] + 1
+    widths = np.full(count, float(LAYOUT_NODE_WIDTH))
+    heights = np.full(count, float(LAYOUT_NODE_HEIGHT))
+    x = np.zeros(count)
+    y = np.zeros(count)
+    containers = sorted((c for c in members if c is not None), key=lambda c: -depth[c])
+    for container in containers + [None]:
+        ids = np.asarray(members[container])
+        local = {g: l for l, g in enumerate(members[container])}
+        pairs = container_edges.get(container, [])
+        sources = np.asarray([local[s] for s, _ in pairs], dtype=np.int64)
+        targets = np.asarray([local[t] for _, t in pairs], dtype=np.int64)
+        rank = assign_ranks(len(ids), sources.tolist(), targets.tolist())
+        order = order_layers(rank, sources, targets)
+        cx, cy, width, height = assign_coordinates(rank, order, widths[ids], heights[ids])
+        if container is None:
+            x[ids], y[ids] = cx, cy
+        else:
+            x[ids] = cx + LAYOUT_GROUP_PADDING
+            y[ids] = cy + LAYOUT_GROUP_HEADER
+            widths[container] = max(width + 2 * LAYOUT_GROUP_PADDING, LAYOUT_NODE_WIDTH)
+            heights[container] = height + LAYOUT_GROUP_HEADER + LAYOUT_GROUP_PADDING
+    xs, ys = x.round(1).tolist(), y.round(1).tolist()
+    ws, hs = widths.tolist(), heights.tolist()
+    return {
+        n["id"]: (xs[i], ys[i], ws[i], hs[i], (i in members))
+        for i, n in enumerate(nodes)
+    }
+
+
+def layout_graph(nodes: List[dict], edges: List[dict]) -> Dict[str, Box]:
+    if not nodes:
+        return {}
+    key = graph_key(nodes, edges)
+    boxes = layout_cache.get(key)
+    if boxes is None:
+        boxes = _compute_layout(nodes, edges)
+        layout_cache.set(key, boxes)
+    return boxes
+
+
+def apply_layout(nodes: List[dict], edges: List[dict]) -> List[dict]:
+    boxes = layout_graph(nodes, edges)
+    for node in nodes:
+        x, y, width, height, is_group = boxes[node["id"]]
+        node["position"] = {"x": x, "y": y}
+        if is_group:
+            node["style"] = {"width": width, "height": height}
+    return nodes
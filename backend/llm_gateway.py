@@ -0,0 +1,212 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Optional
+
+# Central admission control for LLM calls: bounded concurrency, a tokens-per-
+# minute budget, per-user round-robin queues and priority for interactive work.
+# When the queue is full callers get LLMOverloaded straight away (-> HTTP 429).
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "200"))
+LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "1500"))
+
+PRIORITY_INTERACTIVE = 0  # retrieve / patch
+PRIORITY_BULK = 1  # generation
+
+# Gemini bills roughly this many tokens per image / PDF page
+ATTACHMENT_TOKENS = 258
+
+_llm_context: ContextVar[tuple] = ContextVar("llm_context", default=("anonymous", PRIORITY_BULK))
+
+
+def set_llm_context(user_id: Optional[str], priority: int = PRIORITY_BULK):
+    # Tags LLM calls made from the current task (and tasks it spawns) with a user and priority
+    _llm_context.set((user_id or "anonymous", priority))
+
+
+def current_llm_user() -> str:
+    return _llm_context.get()[0]
+
+
+def estimate_tokens(prompt_input) -> int:
+    parts = prompt_input if isinstance(prompt_input, list) else [prompt_input]
+    tokens = LLM_EXPECTED_OUTPUT_TOKENS
+    for part in parts:
+        if isinstance(part, str):
+            tokens += len(part) // 4
+        elif isinstance(part, dict) and isinstance(part.get("text"), str):
+            tokens += len(part["text"]) // 4
+        else:
+            tokens += ATTACHMENT_TOKENS
+    return tokens
+
+
+class LLMOverloaded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"LLM queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("future", "tokens", "enqueued_at")
+
+    def __init__(self, future, tokens):
+        self.future = future
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+
+
+class LLMGateway:
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, tokens_per_minute=LLM_TOKENS_PER_MINUTE, max_queue=LLM_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.max_queue = max_queue
+        # priority -> user -> FIFO of waiters; users are served round-robin
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {
+            PRIORITY_INTERACTIVE: OrderedDict(),
+            PRIORITY_BULK: OrderedDict(),
+        }
+        self._queued = 0
+        self._active = 0
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._refill_timer = None
+        self._wait_times: Deque[float] = deque(maxlen=1000)
+        self._service_times: Deque[float] = deque(maxlen=200)
+        self.admitted = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+
+    def _refill(self):
+        # tokens_per_minute <= 0 disables the budget
+        if self.tokens_per_minute <= 0:
+            return
+        now = time.monotonic()
+        rate = self.tokens_per_minute / 60.0
+        self._tokens = min(float(self.tokens_per_minute), self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in (PRIORITY_INTERACTIVE, PRIORITY_BULK):
+            users = self._queues[priority]
+            while users:
+                user, waiters = next(iter(users.items()))
+                while waiters and waiters[0].future.done():
+                    # Cancelled while queued
+                    waiters.popleft()
+                    self._queued -= 1
+                if not waiters:
+                    del users[user]
+                    continue
+                return waiters[0]
+        return None
+
+    def _pop_waiter(self, waiter: _Waiter):
+        for users in self._queues.values():
+            for user, waiters in users.items():
+                if waiters and waiters[0] is waiter:
+                    waiters.popleft()
+                    self._queued -= 1
+                    # Move the user to the back so others get a turn
+                    users.move_to_end(user)
+                    if not waiters:
+                        del users[user]
+                    return
+
+    def _dispatch(self):
+        self._refill_timer = None
+        self._refill()
+        while self._active < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            # A single call larger than the whole budget is let through once the bucket is full
+            needed = min(waiter.tokens, self.tokens_per_minute)
+            if self.tokens_per_minute > 0 and self._tokens < needed:
+                delay = (needed - self._tokens) / (self.tokens_per_minute / 60.0)
+                if self._refill_timer is None:
+                    self._refill_timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            self._pop_waiter(waiter)
+            self._tokens -= waiter.tokens
+            self._active += 1
+            self._wait_times.append(time.monotonic() - waiter.enqueued_at)
+            self.admitted += 1
+            waiter.future.set_result(None)
+
+    def _retry_after(self) -> int:
+        service = sum(self._service_times) / len(self._service_times) if self._service_times else 10.0
+        return max(1, int(self._queued / max(1, self.max_concurrency) * service))
+
+    async def acquire(self, tokens: int):
+        user_id, priority = _llm_context.get()
+        if self._queued >= self.max_queue:
+            self.rejected += 1
+            raise LLMOverloaded(self._retry_after())
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tokens)
+        self._queues[priority].setdefault(user_id, deque()).append(waiter)
+        self._queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._queued)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as we were cancelled; give the slot back
+                self.release(tokens, tokens, 0.0)
+            raise
+
+    def release(self, estimated_tokens: int, actual_tokens: Optional[int], elapsed: float):
+        self._active -= 1
+        if actual_tokens is not None:
+            # Settle the estimate against what the provider reported
+            self._tokens += estimated_tokens - actual_tokens
+        if elapsed:
+            self._service_times.append(elapsed)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, prompt_input):
+        tokens = estimate_tokens(prompt_input)
+        await self.acquire(tokens)
+        usage = {"tokens": None}
+        start = time.monotonic()
+        try:
+            yield usage
+        finally:
+            self.release(tokens, usage["tokens"], time.monotonic() - start)
+
+    def has_capacity(self) -> bool:
+        return self._active < self.max_concurrency and self._queued == 0
+
+    def queue_depth(self) -> Dict[str, int]:
+        return {
+            "interactive": sum(len(w) for w in self._queues[PRIORITY_INTERACTIVE].values()),
+            "bulk": sum(len(w) for w in self._queues[PRIORITY_BULK].values()),
+        }
+
+    def stats(self) -> dict:
+        waits = sorted(self._wait_times)
+
+        def pct(p):
+            return waits[min(len(waits) - 1, int(p / 100 * len(waits)))] if waits else 0.0
+
+        self._refill()
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "queue_depth": self.queue_depth(),
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "tokens_available": int(self._tokens),
+            "wait_seconds": {"p50": pct(50), "p95": pct(95), "p99": pct(99), "max": waits[-1] if waits else 0.0},
+        }
+
+
+llm_gateway = LLMGateway()
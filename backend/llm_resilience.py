@@ -0,0 +1,245 @@
+import asyncio
+import math
+import os
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+from backend.llm_gateway import LLMOverloaded, llm_gateway
+
+# Resilient invocation around the chat model: per-stage deadlines, retries with
+# jittered exponential backoff on transient errors, optional hedged requests and
+# a circuit breaker that fails fast while the provider is down. Admission by the
+# gateway comes first: the deadline, the latency samples the hedge delay is
+# derived from and the breaker only see time spent with the provider, not time
+# queued behind other callers.
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+# Seconds; override with e.g. LLM_DEADLINE_DETAIL_SECONDS=90
+STAGE_DEADLINES = {
+    "name": 30.0,
+    "summary": 120.0,
+    "detail": 120.0,
+    "automate": 120.0,
+}
+DEFAULT_DEADLINE = 120.0
+
+TRANSIENT_ERROR_NAMES = {
+    "ResourceExhausted",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "TooManyRequests",
+    "ServerError",
+    "RemoteProtocolError",
+    "ReadTimeout",
+    "ConnectTimeout",
+}
+
+
+def stage_deadline(stage: Optional[str]) -> float:
+    default = STAGE_DEADLINES.get(stage, DEFAULT_DEADLINE)
+    if not stage:
+        return default
+    return float(os.getenv(f"LLM_DEADLINE_{stage.upper()}_SECONDS", default))
+
+
+def is_transient(error: BaseException) -> bool:
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int) and (status == 429 or status >= 500):
+        return True
+    return type(error).__name__ in TRANSIENT_ERROR_NAMES
+
+
+class LLMDeadlineExceeded(Exception):
+    def __init__(self, stage: Optional[str], deadline: float):
+        super().__init__(f"LLM stage '{stage}' exceeded its {deadline:.0f}s deadline")
+        self.stage = stage
+
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"LLM provider unavailable, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, reset_seconds=LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self._probing):
+            remaining = self.reset_seconds - (time.monotonic() - self.opened_at)
+            raise CircuitOpen(max(1, int(remaining)))
+        if state == "half_open":
+            # Let a single probe through; everyone else keeps failing fast
+            self._probing = True
+
+    def release_probe(self):
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, stage: str, seconds: float):
+        self._samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, stage: str, pct: float) -> Optional[float]:
+        samples = self._samples.get(stage)
+        if not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        # Nearest-rank percentile
+        return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class ResilientInvoker:
+    def __init__(self, hedging: bool = LLM_HEDGING, max_retries: int = LLM_MAX_RETRIES):
+        self.hedging = hedging
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+
+    async def _hedge(self, prompt_input, attempt: Callable[[dict], Awaitable]):
+        # A duplicate request is a real provider call, so it holds a slot of its own
+        async with llm_gateway.slot(prompt_input) as usage:
+            return await attempt(usage)
+
+    async def _hedged(self, stage: str, attempt: Callable[[dict], Awaitable], usage: dict, prompt_input):
+        delay = self.latency.percentile(stage, LLM_HEDGE_PERCENTILE) if self.hedging else None
+        if delay is None:
+            return await attempt(usage)
+        primary = asyncio.create_task(attempt(usage))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and llm_gateway.has_capacity():
+                # The primary is slower than p95; race a duplicate and keep whichever finishes first
+                self.hedges += 1
+                tasks.append(asyncio.create_task(self._hedge(prompt_input, attempt)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(self, stage: Optional[str], attempt: Callable[[dict], Awaitable], prompt_input=None):
+        # attempt(usage) makes one provider call; usage is the gateway slot's
+        # (see LLMGateway.slot), for reporting the tokens actually used
+        stage = stage or "default"
+        self.breaker.before_call()
+        try:
+            # The slot is held across retries, so backing off doesn't requeue
+            async with llm_gateway.slot(prompt_input) as usage:
+                return await self._call_admitted(stage, attempt, usage, prompt_input)
+        except (LLMOverloaded, asyncio.CancelledError):
+            # Rejected or cancelled while queued for admission; the provider is fine
+            self.breaker.release_probe()
+            raise
+
+    async def _call_admitted(self, stage: str, attempt: Callable[[dict], Awaitable], usage: dict, prompt_input):
+        loop = asyncio.get_running_loop()
+        deadline = stage_deadline(stage)
+        expires_at = loop.time() + deadline
+        retry = 0
+        while True:
+            remaining = expires_at - loop.time()
+            started = loop.time()
+            try:
+                result = await asyncio.wait_for(self._hedged(stage, attempt, usage, prompt_input), remaining)
+            except LLMOverloaded:
+                # A hedge was refused admission; the provider is fine
+                self.breaker.release_probe()
+                raise
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if loop.time() >= expires_at:
+                    self.deadline_exceeded += 1
+                    self.breaker.record_failure()
+                    raise LLMDeadlineExceeded(stage, deadline) from e
+                if not is_transient(e):
+                    # The provider answered, it just rejected this request
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                backoff = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** retry))
+                if retry >= self.max_retries or loop.time() + backoff >= expires_at:
+                    raise
+                retry += 1
+                self.retries += 1
+                print(f"Transient LLM error in stage '{stage}' ({type(e).__name__}), retry {retry} in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                self.breaker.before_call()
+                continue
+            self.breaker.record_success()
+            self.latency.observe(stage, loop.time() - started)
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "hedging": self.hedging,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "deadline_exceeded": self.deadline_exceeded,
+            "breaker": {"state": self.breaker.state, "failures": self.breaker.failures, "trips": self.breaker.trips},
+        }
+
+
+resilient_llm = ResilientInvoker()
@@ -1,18 +1,92 @@
+import asyncio
 import logging
-from fastapi import FastAPI, UploadFile, File, Form, Depends, Body, Request
+import os
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, Depends, Body, Request, BackgroundTasks, Response, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
 from typing import List, Optional
-from backend.auth import router as auth_router, get_current_user
-from backend.orgview_service import OrgViewService
-from backend.langchain_pipeline import reactflow_to_workflowdetail, group_and_automate_workflow, workflowdetail_to_reactflow
-from backend.db import db
+from backend.auth import router as auth_router, get_current_user, auth_cache_stats
+from backend.password_hashing import password_hasher
+from backend.orgview_service import OrgViewService, generation_flight
+from backend.langchain_pipeline import reactflow_to_workflowdetail, workflow_reactflow_delta, warm_up_prompts, get_model
+from backend.ai_cache import workflow_hash, resolve_ai_graph, refresh_orgview_ai_graph
+from backend.db import db, ensure_indexes, ping_db, close_client
+from backend.projects import list_projects_page, backfill_project_integration_types, DEFAULT_PAGE_SIZE
+from backend.cache import llm_cache
+from backend.llm_gateway import llm_gateway, LLMOverloaded, set_llm_context, PRIORITY_BULK
+from backend.llm_resilience import resilient_llm, CircuitOpen, LLMDeadlineExceeded
+from backend.ingest import ingest_uploads, ingest_named_uploads, blob_collector, UploadLimitMiddleware
+from backend.batch import parse_batch_items, run_batch
+from backend.preprocess import preprocess_totals, shutdown_pool
+from backend.layout import layout_cache
+from backend.capture import capture, capture_store, start_trace
+from backend.metrics import http_request_duration, loop_lag_monitor, render_metrics, server_timing, stage_timer, start_spans
+from backend.responses import FastJSONResponse, CompressionMiddleware, compression_stats, make_etag, etag_matches, not_modified
+from backend.similarity import similarity_index
+from backend.analytics import usage_buffer, record_change, get_analytics, backfill_analytics
+from backend.versioning import RevisionConflict, commit_revision, load_revision, list_revisions
+from backend.jobs import job_pool, submit_job, get_job, job_status, stream_job_events
 import uuid
 from bson import ObjectId
 from datetime import datetime
 import json
 from pydantic import BaseModel
 
-app = FastAPI()
+# Bounds the CPU time a single /orgview/patch can take (see benchmarks/bench_reconstruct.py)
+PATCH_MAX_NODES = int(os.getenv("PATCH_MAX_NODES", "50000"))
+
+# Warm-up runs once the server is listening: /health (liveness) answers at once,
+# /ready only after Mongo is reachable and the prompt templates are built. With
+# WARMUP_MODEL=1 the LLM client is created then too, instead of on the first call.
+WARMUP_MODEL = os.getenv("WARMUP_MODEL", "0") == "1"
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+
+warmup_state = {"ready": False, "error": None, "seconds": None}
+
+async def warm_up():
+    start = time.perf_counter()
+    while True:
+        try:
+            await ping_db()
+            await ensure_indexes()
+            break
+        except Exception as e:
+            warmup_state["error"] = str(e) or type(e).__name__
+            print("Warm-up: Mongo not reachable, retrying:", warmup_state["error"])
+            await asyncio.sleep(WARMUP_RETRY_SECONDS)
+    job_pool.start()
+    similarity_index.start()
+    usage_buffer.start()
+    blob_collector.start()
+    asyncio.create_task(backfill_project_integration_types())
+    asyncio.create_task(backfill_analytics())
+    # Importing LangChain is slow, blocking work; keep it off the event loop
+    await asyncio.to_thread(warm_up_prompts)
+    if WARMUP_MODEL:
+        await asyncio.to_thread(get_model)
+    warmup_state.update(ready=True, error=None, seconds=time.perf_counter() - start)
+    print(f"Warm-up finished in {warmup_state['seconds']:.2f}s")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup = asyncio.create_task(warm_up())
+    capture_store.start()
+    loop_lag_monitor.start()
+    yield
+    warmup.cancel()
+    await job_pool.stop()
+    await similarity_index.stop()
+    await usage_buffer.stop()
+    await blob_collector.stop()
+    await capture_store.stop()
+    await loop_lag_monitor.stop()
+    shutdown_pool()
+    password_hasher.shutdown()
+    close_client()
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Allow CORS for local dev
 app.add_middleware(
@@ -21,38 +95,138 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Trace-Id", "Server-Timing", "ETag"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(UploadLimitMiddleware)
 
 app.include_router(auth_router)
 
 # logger = logging.getLogger("uvicorn.access")
+logger = logging.getLogger(__name__)
+
+@app.exception_handler(LLMOverloaded)
+async def llm_overloaded_handler(request: Request, exc: LLMOverloaded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(CircuitOpen)
+async def llm_circuit_open_handler(request: Request, exc: CircuitOpen):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(RevisionConflict)
+async def revision_conflict_handler(request: Request, exc: RevisionConflict):
+    return JSONResponse(status_code=409, content={"detail": str(exc), "revision": exc.current})
+
+@app.exception_handler(LLMDeadlineExceeded)
+async def llm_deadline_handler(request: Request, exc: LLMDeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    print(f"Request: {request.method} {request.url.path}")
+    trace_id = start_trace(request.headers.get("X-Trace-Id"), request.headers.get("X-Capture") == "1")
+    logger.debug("Request: %s %s trace=%s", request.method, request.url.path, trace_id)
+    spans = start_spans()
+    start = time.perf_counter()
     response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    # Label by route template, not raw path, to keep label cardinality bounded
+    route = request.scope.get("route")
+    http_request_duration.observe(
+        elapsed, method=request.method, route=getattr(route, "path", "unmatched"), status=response.status_code
+    )
+    response.headers["X-Trace-Id"] = trace_id
+    if spans is not None:
+        response.headers["Server-Timing"] = server_timing(spans, elapsed)
     return response
 
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
+@app.get("/ready")
+async def ready():
+    if not warmup_state["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "error": warmup_state["error"]})
+    try:
+        await ping_db()
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "error": str(e) or type(e).__name__})
+    return {"status": "ready", "warmup_seconds": warmup_state["seconds"]}
+
+@app.get("/metrics")
+async def metrics():
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/stats")
+async def stats():
+    return {
+        "llm_cache": llm_cache.stats(),
+        "generation_coalescing": generation_flight.stats(),
+        "llm_gateway": llm_gateway.stats(),
+        "llm_resilience": resilient_llm.stats(),
+        "attachment_preprocessing": preprocess_totals,
+        "auth": auth_cache_stats(),
+        "password_hashing": password_hasher.stats(),
+        "layout_cache": layout_cache.stats(),
+        "debug_capture": capture_store.stats(),
+        "compression": compression_stats,
+        "similarity": similarity_index.stats(),
+        "blob_gc": {"removed": blob_collector.removed}
+    }
+
+@app.get("/analytics")
+async def analytics(
+    scope: str = Query("user", pattern="^(user|global)$"),
+    user=Depends(get_current_user)
+):
+    # Read from the precomputed summary document, not by scanning orgviews
+    return {"success": True, "data": await get_analytics(user.id if scope == "user" else None)}
+
+@app.get("/debug/captures/{trace_id}")
+async def get_captures(trace_id: str, user=Depends(get_current_user)):
+    artifacts = await capture_store.find(trace_id, user.id)
+    if not artifacts:
+        return {"error": "No captured artifacts for this trace id."}
+    return {"trace_id": trace_id, "artifacts": artifacts}
+
+def _project_summary(p):
+    return {
+        "project_id": str(p.get("_id", p.get("id"))),
+        "name": p.get("name"),
+        "description": p.get("description")
+    }
+
 @app.get("/projects")
-async def list_projects(user=Depends(get_current_user)):
-    # TODO: implement project listing for user
-    return {"projects": []}
+async def list_projects(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+    cursor: Optional[str] = None,
+    integration_type: Optional[str] = None,
+    user=Depends(get_current_user)
+):
+    projects, next_cursor = await list_projects_page(user.id, limit, cursor, integration_type)
+    return {"projects": [_project_summary(p) for p in projects], "next_cursor": next_cursor}
 
 @app.get("/flows")
-async def list_user_projects(user=Depends(get_current_user)):
-    projects = await db.projects.find({"user_id": user.id}).to_list(length=100)
-    return [
-        {
-            "project_id": str(p.get("_id", p.get("id"))),
-            "name": p.get("name"),
-            "description": p.get("description")
-        }
-        for p in projects
-    ]
+async def list_user_projects(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1),
+    cursor: Optional[str] = None,
+    integration_type: Optional[str] = None,
+    user=Depends(get_current_user)
+):
+    # Body stays a plain list for existing clients; the next page is in X-Next-Cursor
+    projects, next_cursor = await list_projects_page(user.id, limit, cursor, integration_type)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [_project_summary(p) for p in projects]
 
 @app.post("/orgview/generate")
 async def generate_orgview(
@@ -64,6 +238,8 @@ async def generate_orgview(
     pdfs: Optional[List[UploadFile]] = File(None),
     user=Depends(get_current_user)
 ):
+    set_llm_context(user.id, PRIORITY_BULK)
+    attachments_images, attachments_pdfs = await ingest_uploads(images, pdfs)
     service = OrgViewService()
     result = await service.generate_org_view(
         user_id=user.id,
@@ -71,17 +247,78 @@ async def generate_orgview(
         team_size=team_size,
         budget=budget,
         description=description,
-        images=images or [],
-        pdfs=pdfs or []
+        images=attachments_images,
+        pdfs=attachments_pdfs
     )
     return result
 
+@app.post("/orgview/batch")
+async def generate_orgview_batch(
+    items: str = Form(..., description="JSON array of {department_function, team_size, budget, description, images?, pdfs?}"),
+    files: Optional[List[UploadFile]] = File(None),
+    user=Depends(get_current_user)
+):
+    # images/pdfs in each item name files uploaded in `files`; results stream back as NDJSON
+    attachments = await ingest_named_uploads(files)
+    batch_items = parse_batch_items(items, attachments)
+    return StreamingResponse(
+        run_batch(user.id, batch_items, attachments),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/orgview/jobs")
+async def submit_orgview_job(
+    department_function: str = Form(...),
+    team_size: str = Form(...),
+    budget: str = Form(...),
+    description: str = Form(...),
+    images: Optional[List[UploadFile]] = File(None),
+    pdfs: Optional[List[UploadFile]] = File(None),
+    user=Depends(get_current_user)
+):
+    context = {
+        "department_function": department_function,
+        "team_size": team_size,
+        "budget": budget,
+        "description": description
+    }
+    attachments_images, attachments_pdfs = await ingest_uploads(images, pdfs)
+    job_id = await submit_job(user.id, context, attachments_images, attachments_pdfs)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/orgview/jobs/{job_id}")
+async def get_orgview_job(
+    job_id: str,
+    user=Depends(get_current_user)
+):
+    job = await get_job(job_id, user.id, {"images": 0, "pdfs": 0})
+    if not job:
+        return {"error": "Job not found."}
+    return job_status(job)
+
+@app.get("/orgview/jobs/{job_id}/events")
+async def stream_orgview_job(
+    job_id: str,
+    request: Request,
+    user=Depends(get_current_user)
+):
+    return StreamingResponse(
+        stream_job_events(job_id, user.id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/orgview/patch")
 async def patch_orgview(
+    background_tasks: BackgroundTasks,
     project_id: str = Body(...),
     react_flow_json: dict = Body(...),
+    revision: Optional[int] = Body(None),
     user=Depends(get_current_user)
 ):
+    if len(react_flow_json.get("nodes", [])) > PATCH_MAX_NODES:
+        raise HTTPException(status_code=413, detail=f"Diagrams are limited to {PATCH_MAX_NODES} nodes")
     service = OrgViewService()
     # Fetch the latest orgview for this project and user
     orgview = await db.orgviews.find_one({"project_id": project_id})
@@ -90,39 +327,113 @@ async def patch_orgview(
     original = orgview.get("workflow_json")
     if not original:
         return {"error": "No original workflow_json found in OrgView."}
-    # Dump incoming react_flow_json
-    with open("debug_incoming_react_flow.json", "w") as f:
-        json.dump(react_flow_json, f, indent=2)
-    from backend.langchain_pipeline import reactflow_to_workflowdetail
-    reconstructed = reactflow_to_workflowdetail(react_flow_json["nodes"], react_flow_json["edges"])
-    # Dump reconstructed workflow
-    with open("debug_reconstructed_workflow.json", "w") as f:
-        json.dump(reconstructed, f, indent=2)
+    capture("incoming_react_flow", react_flow_json, user.id)
+    warnings = []
+    reconstructed = reactflow_to_workflowdetail(
+        react_flow_json.get("nodes", []), react_flow_json.get("edges", []), warnings, original
+    )
+    capture("reconstructed_workflow", reconstructed, user.id)
     patched = service.patch_workflow_detail(original, reconstructed)
-    # Dump patched workflow
-    with open("debug_patched_workflow.json", "w") as f:
-        json.dump(patched, f, indent=2)
-    # Update the orgview in the database
-    await db.orgviews.update_one(
-        {"_id": orgview["_id"]},
-        {"$set": {"workflow_json": patched, "react_flow_json": react_flow_json, "updated_at": datetime.utcnow()}}
+    capture("patched_workflow", patched, user.id)
+    previous_key = orgview.get("workflow_hash") or workflow_hash(original)
+    patched_key = workflow_hash(patched)
+    delta = workflow_reactflow_delta(original, patched)
+    # Only the changed paths are written; the JSON patch goes to the revision log
+    with stage_timer("db_write"):
+        committed = await commit_revision(
+            orgview,
+            {"workflow_json": patched, "react_flow_json": react_flow_json},
+            {"workflow_hash": patched_key, "updated_at": datetime.utcnow()},
+            expected_revision=revision,
+            user_id=user.id,
+        )
+    # Only a real change to the workflow invalidates the AI graph
+    if patched_key != previous_key:
+        similarity_index.update_content(str(orgview["_id"]), patched)
+        background_tasks.add_task(refresh_orgview_ai_graph, orgview["_id"], patched, patched_key, user.id)
+    # commit_revision only wrote if the stored revision was still orgview's, so
+    # orgview is exactly the state this patch replaced
+    background_tasks.add_task(
+        record_change, orgview.get("user_id") or user.id, orgview,
+        {**orgview, "workflow_json": patched, "react_flow_json": react_flow_json},
     )
-    return {"patched": patched}
+    # Node ids are deterministic, so clients can apply just the changed nodes/edges
+    return {"patched": patched, "react_flow_delta": delta, "warnings": warnings, "revision": committed["revision"]}
+
 
 
+RETRIEVE_FIELDS = ("react_flow_json", "ai_react_flow_json")
+# Everything the retrieve ETag is derived from: each patch bumps the revision,
+# and the AI graph is identified by the workflow hash it was generated from
+RETRIEVE_ETAG_PROJECTION = {"revision": 1, "workflow_hash": 1, "ai_workflow_hash": 1}
+
+def retrieve_etag(orgview: dict, fields) -> str:
+    return make_etag(
+        str(orgview["_id"]), orgview.get("revision") or 0,
+        orgview.get("workflow_hash"), orgview.get("ai_workflow_hash"), sorted(fields)
+    )
 
 @app.get("/orgview/retrieve/{project_id}")
 async def retrieve_orgviews(
     project_id: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    fields: Optional[str] = Query(None, description="Comma-separated subset of react_flow_json,ai_react_flow_json"),
+    user=Depends(get_current_user)
+):
+    selected = set(RETRIEVE_FIELDS) if not fields else {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = selected - set(RETRIEVE_FIELDS)
+    if unknown or not selected:
+        raise HTTPException(status_code=400, detail=f"fields must be a subset of {', '.join(RETRIEVE_FIELDS)}")
+    # Revalidation only reads the ETag inputs, not the graphs
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        head = await db.orgviews.find_one({"project_id": project_id}, RETRIEVE_ETAG_PROJECTION)
+        if head and etag_matches(if_none_match, retrieve_etag(head, selected)):
+            return not_modified({"ETag": retrieve_etag(head, selected), "Cache-Control": "private, no-cache"})
+    projection = dict(RETRIEVE_ETAG_PROJECTION)
+    if "react_flow_json" in selected:
+        projection["react_flow_json"] = 1
+    if "ai_react_flow_json" in selected:
+        # created_at/updated_at tell resolve_ai_graph whether a legacy AI graph can be trusted
+        projection.update({"workflow_json": 1, "ai_workflow_json": 1, "ai_react_flow_json": 1, "created_at": 1, "updated_at": 1})
+    orgview = await db.orgviews.find_one({"project_id": project_id}, projection)
+    if not orgview:
+        return {"error": "OrgView not found for this project."}
+    etag = retrieve_etag(orgview, selected)
+    content = {"revision": orgview.get("revision") or 0}
+    if "react_flow_json" in selected:
+        content["react_flow_json"] = orgview.get("react_flow_json")
+    if "ai_react_flow_json" in selected:
+        # Served from the stored/cached AI graph; a stale one is refreshed in the background
+        content["ai_react_flow_json"], content["ai_stale"] = await resolve_ai_graph(orgview, background_tasks, user.id)
+    # Returned as a response object so FastAPI skips jsonable_encoder on the graphs
+    return FastJSONResponse(content, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+@app.get("/orgview/revisions/{project_id}")
+async def get_orgview_revisions(
+    project_id: str,
+    limit: int = Query(100, ge=1, le=1000),
     user=Depends(get_current_user)
 ):
     orgview = await db.orgviews.find_one({"project_id": project_id})
     if not orgview:
         return {"error": "OrgView not found for this project."}
-    return {
-        "react_flow_json": orgview.get("react_flow_json"),
-        "ai_react_flow_json": workflowdetail_to_reactflow(group_and_automate_workflow(orgview.get("workflow_json"))) if orgview.get("workflow_json") else {"nodes": [], "edges": []}
-    }
+    return {"revision": orgview.get("revision") or 0, "revisions": await list_revisions(orgview, limit)}
+
+@app.get("/orgview/revisions/{project_id}/{revision}")
+async def get_orgview_revision(
+    project_id: str,
+    revision: int,
+    user=Depends(get_current_user)
+):
+    orgview = await db.orgviews.find_one({"project_id": project_id})
+    if not orgview:
+        return {"error": "OrgView not found for this project."}
+    state = await load_revision(orgview, revision)
+    if state is None:
+        return {"error": f"Revision {revision} not found."}
+    return {"revision": revision, **state}
 
 @app.get("/orgview/integrations/{project_id}")
 async def get_integration_nodes(
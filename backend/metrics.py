@@ -0,0 +1,232 @@
+import asyncio
+import contextvars
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# In-process Prometheus metrics (text exposition format on /metrics): route and
+# pipeline-stage histograms, token/cost/attachment counters and an event-loop
+# lag gauge. Updates are a dict lookup and a bisect, cheap enough to leave on.
+# With METRICS_SERVER_TIMING=1, stage timings of each request are also returned
+# as a Server-Timing header.
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "0") == "1"
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+# USD per million tokens, defaults are gemini-2.5-flash list prices
+LLM_INPUT_COST_PER_MTOK = float(os.getenv("LLM_INPUT_COST_PER_MTOK", "0.30"))
+LLM_OUTPUT_COST_PER_MTOK = float(os.getenv("LLM_OUTPUT_COST_PER_MTOK", "2.50"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_spans = contextvars.ContextVar("metric_spans", default=None)
+
+_registry: List["_Metric"] = []
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+stage_duration = Histogram(
+    "pipeline_stage_duration_seconds", "Time spent per pipeline stage", ("stage",))
+llm_requests = Counter(
+    "llm_requests_total", "LLM requests by stage and response-cache outcome", ("stage", "cache"))
+llm_tokens = Counter(
+    "llm_tokens_total", "LLM tokens by stage and direction (input/output)", ("stage", "direction"))
+llm_cost = Counter(
+    "llm_cost_usd_total", "Estimated LLM spend in USD", ("stage",))
+attachment_bytes = Counter(
+    "attachment_bytes_total", "Attachment bytes received and sent to the LLM after preprocessing", ("direction",))
+similarity_lookups = Counter(
+    "similarity_lookups_total", "Generation requests by similarity-index outcome (reused/seeded/miss)", ("outcome",))
+loop_lag = Gauge(
+    "event_loop_lag_seconds", "Most recent event-loop scheduling delay")
+loop_lag_max = Gauge(
+    "event_loop_lag_max_seconds", "Largest event-loop scheduling delay since the last scrape")
+
+
+def llm_cost_usd(input_tokens: int, output_tokens: int) -> float:
+    return (input_tokens * LLM_INPUT_COST_PER_MTOK + output_tokens * LLM_OUTPUT_COST_PER_MTOK) / 1_000_000
+
+
+def record_tokens(stage: Optional[str], input_tokens: int, output_tokens: int):
+    stage = stage or "default"
+    llm_tokens.inc(input_tokens, stage=stage, direction="input")
+    llm_tokens.inc(output_tokens, stage=stage, direction="output")
+    llm_cost.inc(llm_cost_usd(input_tokens, output_tokens), stage=stage)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage=stage)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+
+def start_spans() -> Optional[list]:
+    # Called by the request middleware; spans recorded by stage_timer during the request land here
+    if not METRICS_SERVER_TIMING:
+        return None
+    spans = []
+    _spans.set(spans)
+    return spans
+
+
+def server_timing(spans: list, total: float) -> str:
+    entries = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in spans]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task = None
+        self._max = 0.0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            loop_lag.set(lag)
+            self._max = max(self._max, lag)
+            loop_lag_max.set(self._max)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def reset_max(self):
+        self._max = 0.0
+
+
+loop_lag_monitor = LoopLagMonitor()
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    loop_lag_monitor.reset_max()
+    return "\n".join(lines) + "\n"
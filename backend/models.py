@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, Any, Dict
+from typing import Optional, Any, Dict, List
 from datetime import datetime
 
 class UserModel(BaseModel):
@@ -14,14 +14,21 @@ class ProjectModel(BaseModel):
     name: str
     description: Optional[str] = None  # New field for project description
     created_by: Optional[str] = None   # New field for user id
+    integration_types: Optional[List[str]] = None  # Distinct node types from the orgview's node_list, for filtering
     created_at: Optional[datetime] = None
 
 class OrgViewModel(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
     project_id: str
+    user_id: Optional[str] = None
+    source_context: Optional[Dict[str, Any]] = None  # Generation request it was built from (see backend.similarity)
     react_flow_json: Dict[str, Any]
     workflow_json: Optional[Dict[str, Any]] = None
     ai_workflow_json: Optional[Dict[str, Any]] = None  # New field for AI-augmented workflow
+    ai_react_flow_json: Optional[Dict[str, Any]] = None
+    workflow_hash: Optional[str] = None  # Content hash of workflow_json (see backend.ai_cache)
+    ai_workflow_hash: Optional[str] = None  # workflow_hash the AI graph was computed from
     node_list: Optional[list] = None  # List of integration nodes (name, type, description)
+    revision: Optional[int] = None  # Bumped on every patch; history lives in orgview_revisions (see backend.versioning)
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None 
\ No newline at end of file
@@ -2,24 +2,28 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime
 from backend.db import db
 from backend.models import ProjectModel, OrgViewModel
-from backend.langchain_pipeline import multimodal_pipeline, workflowdetail_to_reactflow, group_and_automate_workflow
-import copy
-from langchain.prompts import PromptTemplate
+from backend.langchain_pipeline import multimodal_pipeline, workflowdetail_to_reactflow, group_and_automate_workflow, emit_stage, register_prompt, get_prompt, get_parser
+from backend.ai_cache import workflow_hash, store_ai_graph, store_ai_graphs, integration_node_list, integration_types
+from backend.singleflight import SingleFlight
+from backend.versioning import record_revision, revision_entry, versioned_state
+from backend.metrics import stage_timer
+from backend.analytics import record_orgviews
+from backend.similarity import similarity_index, lookup, record_outcome, example_prompt_context
+from bson import ObjectId
+import asyncio
+import hashlib
+import logging
+import re
 import json as pyjson
 from pydantic import BaseModel
-from langchain.output_parsers import PydanticOutputParser
+
+logger = logging.getLogger(__name__)
 
 class ProjectNameDesc(BaseModel):
     name: str
     description: str
 
-class OrgViewService:
-    def __init__(self):
-        pass
-
-    async def suggest_project_name_and_description(self, department_function, team_size, budget, description):
-        prompt = PromptTemplate(
-            template="""
+register_prompt("name", """
 Given the following business context, suggest a concise, descriptive project name and a one-sentence project description for an AI workflow automation project. Output as a JSON object with 'name' and 'description' fields.
 
 Department Function: {department_function}
@@ -28,70 +32,249 @@ Budget: {budget}
 Description: {description}
 
 JSON object:
-""",
-            input_variables=["department_function", "team_size", "budget", "description"]
-        )
+""", ["department_function", "team_size", "budget", "description"], ProjectNameDesc)
+
+# Identical generations in flight at the same time share one pipeline run
+generation_flight = SingleFlight()
+
+def _normalize_field(value) -> str:
+    return re.sub(r"\s+", " ", str(value)).strip()
+
+async def _upload_digest(upload) -> str:
+    # Ingested attachments already carry their content hash
+    if getattr(upload, "sha256", None):
+        return upload.sha256
+    digest = hashlib.sha256(await upload.read()).hexdigest()
+    # The pipeline reads the upload again later
+    if hasattr(upload, "seek"):
+        await upload.seek(0)
+    return digest
+
+async def generation_key(context: dict, images, pdfs, examples: str = "") -> str:
+    h = hashlib.sha256()
+    for field in ("department_function", "team_size", "budget", "description"):
+        h.update(_normalize_field(context.get(field, "")).encode() + b"\0")
+    # Examples come from the requesting user's own workflows (see backend.similarity);
+    # only requests seeded with the same examples may share a run
+    h.update(b"examples:" + hashlib.sha256(examples.encode()).digest())
+    for kind, uploads in (("image", images), ("pdf", pdfs)):
+        for upload in uploads or []:
+            h.update(f"{kind}:{await _upload_digest(upload)}\0".encode())
+    return h.hexdigest()
+
+class OrgViewService:
+    def __init__(self):
+        pass
+
+    async def suggest_project_name_and_description(self, department_function, team_size, budget, description):
+        prompt = get_prompt("name")
         formatted_prompt = prompt.format(
             department_function=department_function,
             team_size=team_size,
             budget=budget,
             description=description
         )
-        from backend.langchain_pipeline import model
-        parser = PydanticOutputParser(pydantic_object=ProjectNameDesc)
-        response = model.invoke(formatted_prompt)
+        from backend.langchain_pipeline import invoke_model, response_cache_key
+        from backend.cache import llm_cache
+        parser = get_parser(ProjectNameDesc)
+        content = await invoke_model(formatted_prompt, stage="name")
         try:
-            result = parser.parse(response.content)
+            result = parser.parse(content)
             return result.name, result.description
         except Exception as e:
             print("Pydantic parse error:", e)
-            print("Raw response was:\n", response.content)
+            print("Raw response was:\n", content)
+            await llm_cache.discard(response_cache_key(formatted_prompt))
             return 'AI Project', ''
 
-    async def generate_org_view(self, user_id, department_function, team_size, budget, description, images, pdfs):
+    async def _suggest_name(self, context, on_stage=None):
+        name, desc = await self.suggest_project_name_and_description(**context)
+        await emit_stage(on_stage, "name", {"name": name, "description": desc})
+        return name, desc
+
+    async def _workflow_chain(self, context, images, pdfs, on_stage=None, examples=""):
+        # summary -> detail -> react flow, then the AI graph that depends on the detail
+        workflow_detail, react_flow_json = await multimodal_pipeline(context, images, pdfs, on_stage, examples)
+        workflow_json = workflow_detail.model_dump() if workflow_detail else None
+        ai_workflow_detail = await group_and_automate_workflow(workflow_json) if workflow_json else None
+        return workflow_json, react_flow_json, ai_workflow_detail
+
+    async def build_org_view(self, department_function, team_size, budget, description, images, pdfs, on_stage=None, examples=""):
         context = {
             "department_function": department_function,
             "team_size": team_size,
             "budget": budget,
             "description": description
         }
-        # Suggest project name/description if not provided
-        project_name, project_desc = await self.suggest_project_name_and_description(department_function, team_size, budget, description)
-        print(project_name, project_desc)
- 
-        workflow_detail, react_flow_json = multimodal_pipeline(context, images, pdfs)
-        workflow_json = workflow_detail.model_dump() if workflow_detail else None
-        ai_workflow_detail = group_and_automate_workflow(workflow_json) if workflow_json else None
+        # The name suggestion does not depend on the workflow, so run both branches concurrently
+        (project_name, project_desc), (workflow_json, react_flow_json, ai_workflow_detail) = await asyncio.gather(
+            self._suggest_name(context, on_stage),
+            self._workflow_chain(context, images, pdfs, on_stage, examples),
+        )
+        logger.debug("Suggested project: %s (%s)", project_name, project_desc)
         ai_workflow_json = ai_workflow_detail.model_dump() if ai_workflow_detail else None
         ai_react_flow_json = workflowdetail_to_reactflow(ai_workflow_detail) if ai_workflow_detail else {"nodes": [], "edges": []}
+        await emit_stage(on_stage, "ai_graph", ai_react_flow_json)
+        workflow_key = workflow_hash(workflow_json) if workflow_json else None
         # Extract node_list from ai_react_flow_json
-        node_list = []
-        for node in ai_react_flow_json.get("nodes", []):
-            data = node.get("data", {})
-            node_type = data.get("nodeType")
-            if node_type is None:
-                node_type = "default"
-            node_list.append({
-                "name": data.get("label"),
-                "type": node_type,
-                "description": data.get("description")
-            })
-        project = ProjectModel(user_id=user_id, name=project_name, description=project_desc, created_by=user_id, created_at=datetime.utcnow())
-        project_dict = project.dict(by_alias=True, exclude={"id"})
-        project_result = await db.projects.insert_one(project_dict)
-        project_id = str(project_result.inserted_id)
+        node_list = integration_node_list(ai_react_flow_json)
+        return {
+            "project_name": project_name,
+            "project_desc": project_desc,
+            "workflow_json": workflow_json,
+            "react_flow_json": react_flow_json,
+            "ai_workflow_json": ai_workflow_json,
+            "ai_react_flow_json": ai_react_flow_json,
+            "workflow_hash": workflow_key,
+            "node_list": node_list,
+            "source_context": context,
+        }
+
+    async def _reuse_view(self, orgview_id, context):
+        # A stored result for a near-identical request, shaped like build_org_view's
+        orgview = await db.orgviews.find_one({"_id": ObjectId(orgview_id)})
+        if not orgview or not orgview.get("workflow_json"):
+            return None
+        project = await db.projects.find_one({"_id": ObjectId(orgview["project_id"])}, {"name": 1, "description": 1}) or {}
+        # An AI graph that lags behind a patch is left for retrieve to refresh
+        ai_fresh = orgview.get("ai_workflow_json") and orgview.get("ai_workflow_hash") == orgview.get("workflow_hash")
+        ai_react_flow_json = orgview.get("ai_react_flow_json") if ai_fresh else {"nodes": [], "edges": []}
+        return {
+            "project_name": project.get("name") or "AI Project",
+            "project_desc": project.get("description") or "",
+            "workflow_json": orgview["workflow_json"],
+            "react_flow_json": orgview["react_flow_json"],
+            "ai_workflow_json": orgview["ai_workflow_json"] if ai_fresh else None,
+            "ai_react_flow_json": ai_react_flow_json,
+            "workflow_hash": orgview.get("workflow_hash") or workflow_hash(orgview["workflow_json"]),
+            "node_list": (orgview.get("node_list") or []) if ai_fresh else [],
+            "source_context": context,
+            "reused_from": orgview["project_id"],
+        }
+
+    async def build_org_view_coalesced(self, department_function, team_size, budget, description, images, pdfs, on_stage=None, user_id=None):
+        context = {
+            "department_function": department_function,
+            "team_size": team_size,
+            "budget": budget,
+            "description": description
+        }
+        # A near-duplicate of an earlier request (without attachments, which the
+        # index does not see) reuses that result; otherwise the closest past
+        # workflows are passed to the detail prompt as examples
+        match = await lookup(user_id, context)
+        if match["reuse"] and not images and not pdfs:
+            view = await self._reuse_view(match["reuse"][0], context)
+            if view is not None:
+                record_outcome("reused")
+                await emit_stage(on_stage, "name", {"name": view["project_name"], "description": view["project_desc"]})
+                await emit_stage(on_stage, "detail", view["workflow_json"])
+                await emit_stage(on_stage, "react_flow", view["react_flow_json"])
+                await emit_stage(on_stage, "ai_graph", view["ai_react_flow_json"])
+                return view
+        examples = await example_prompt_context(match["examples"])
+        record_outcome("seeded" if examples else "miss")
+        key = await generation_key(context, images, pdfs, examples)
+        follower = generation_flight.in_flight(key)
+        view = await generation_flight.do(
+            key, lambda: self.build_org_view(images=images, pdfs=pdfs, on_stage=on_stage, examples=examples, **context)
+        )
+        if follower:
+            # Progress callbacks only ran for the leader; replay the stages we can from the result
+            await emit_stage(on_stage, "name", {"name": view["project_name"], "description": view["project_desc"]})
+            if view["workflow_json"]:
+                await emit_stage(on_stage, "detail", view["workflow_json"])
+            await emit_stage(on_stage, "react_flow", view["react_flow_json"])
+            await emit_stage(on_stage, "ai_graph", view["ai_react_flow_json"])
+        return view
+
+    async def generate_org_view(self, user_id, department_function, team_size, budget, description, images, pdfs):
+        # Each caller gets its own project even when the pipeline run was shared
+        view = await self.build_org_view_coalesced(department_function, team_size, budget, description, images, pdfs, user_id=user_id)
+        result = await self.save_org_view(user_id, view)
+        if view.get("reused_from"):
+            result["reused_from"] = view["reused_from"]
+        return result
+
+    async def save_org_view(self, user_id, view):
+        with stage_timer("db_write"):
+            return await self._insert_org_view(user_id, view)
+
+    def _project_document(self, user_id, view):
+        project = ProjectModel(
+            user_id=user_id,
+            name=view["project_name"],
+            description=view["project_desc"],
+            created_by=user_id,
+            integration_types=integration_types(view["node_list"]),
+            created_at=datetime.utcnow()
+        )
+        return project.dict(by_alias=True, exclude={"id"})
+
+    def _org_view_document(self, user_id, project_id, view):
+        workflow_key = view["workflow_hash"]
         org_view = OrgViewModel(
             project_id=project_id,
-            react_flow_json=react_flow_json,
-            workflow_json=workflow_json,
-            ai_workflow_json=ai_workflow_json,
-            node_list=node_list,
+            user_id=user_id,
+            source_context=view.get("source_context"),
+            react_flow_json=view["react_flow_json"],
+            workflow_json=view["workflow_json"],
+            ai_workflow_json=view["ai_workflow_json"],
+            ai_react_flow_json=view["ai_react_flow_json"],
+            workflow_hash=workflow_key,
+            ai_workflow_hash=workflow_key if view["ai_workflow_json"] else None,
+            node_list=view["node_list"],
+            revision=0,
             created_at=datetime.utcnow(),
             updated_at=datetime.utcnow()
         )
-        org_view_dict = org_view.dict(by_alias=True, exclude={"id"})
-        org_view_result = await db.orgviews.insert_one(org_view_dict)
+        return org_view.dict(by_alias=True, exclude={"id"})
+
+    async def save_org_views(self, user_id, views):
+        # Bulk form of save_org_view: one round trip per collection for the whole list
+        with stage_timer("db_write"):
+            await store_ai_graphs({
+                view["workflow_hash"]: (view["ai_workflow_json"], view["ai_react_flow_json"])
+                for view in views if view["workflow_hash"] and view["ai_workflow_json"]
+            })
+            project_dicts = [self._project_document(user_id, view) for view in views]
+            project_result = await db.projects.insert_many(project_dicts)
+            project_ids = [str(inserted_id) for inserted_id in project_result.inserted_ids]
+            org_view_dicts = [self._org_view_document(user_id, project_id, view) for project_id, view in zip(project_ids, views)]
+            try:
+                await db.orgviews.insert_many(org_view_dicts)
+            except BaseException:
+                # No project without its orgview; an ordered insert may have stored some of them
+                await db.orgviews.delete_many({"project_id": {"$in": project_ids}})
+                await db.projects.delete_many({"_id": {"$in": project_result.inserted_ids}})
+                raise
+            for org_view_dict in org_view_dicts:
+                similarity_index.upsert(str(org_view_dict["_id"]), user_id, org_view_dict["source_context"], org_view_dict["workflow_json"])
+            await record_orgviews(user_id, org_view_dicts)
+            await db.orgview_revisions.insert_many([
+                revision_entry(org_view_dict, 0, None, versioned_state(org_view_dict), user_id)
+                for org_view_dict in org_view_dicts
+            ])
+        return [{"project_id": project_id} for project_id in project_ids]
+
+    async def _insert_org_view(self, user_id, view):
+        workflow_key = view["workflow_hash"]
+        ai_workflow_json = view["ai_workflow_json"]
+        if workflow_key and ai_workflow_json:
+            await store_ai_graph(workflow_key, ai_workflow_json, view["ai_react_flow_json"])
+        project_dict = self._project_document(user_id, view)
+        project_result = await db.projects.insert_one(project_dict)
+        project_id = str(project_result.inserted_id)
+        org_view_dict = self._org_view_document(user_id, project_id, view)
+        try:
+            org_view_result = await db.orgviews.insert_one(org_view_dict)
+        except BaseException:
+            await db.projects.delete_one({"_id": project_result.inserted_id})
+            raise
+        similarity_index.upsert(str(org_view_result.inserted_id), user_id, org_view_dict["source_context"], org_view_dict["workflow_json"])
+        await record_orgviews(user_id, [org_view_dict])
         org_view_id = str(org_view_result.inserted_id)
+        await record_revision(org_view_dict, 0, None, versioned_state(org_view_dict), user_id)
         return {
             "project_id": project_id,
             # "org_view_id": org_view_id,
@@ -100,11 +283,17 @@ JSON object:
         }
 
     def patch_workflow_detail(self, original, updated):
-        patched = copy.deepcopy(updated)
+        # Fills `updated` in place: it is freshly reconstructed and owned by the caller
+        patched = updated
         for key in ['inputs', 'outputs', 'connections', 'extra', 'subworkflows']:
             if not patched.get(key):
                 patched[key] = original.get(key)
-        def patch_steps(orig_steps, upd_steps):
+        # Iterative so deeply nested diagrams don't hit the recursion limit
+        pending = []
+        if original.get('steps') and patched.get('steps'):
+            pending.append((original['steps'], patched['steps']))
+        while pending:
+            orig_steps, upd_steps = pending.pop()
             orig_map = {(s['actor'], s['action']): s for s in orig_steps}
             for upd in upd_steps:
                 key = (upd['actor'], upd['action'])
@@ -114,8 +303,6 @@ JSON object:
                         if not upd.get(k) and orig.get(k):
                             upd[k] = orig[k]
                     if upd.get('substeps') and orig.get('substeps'):
-                        patch_steps(orig['substeps'], upd['substeps'])
-        if original.get('steps') and patched.get('steps'):
-            patch_steps(original['steps'], patched['steps'])
+                        pending.append((orig['substeps'], upd['substeps']))
         return patched 
 
@@ -0,0 +1,129 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+# bcrypt is deliberately slow, so hashing/verification runs on a small dedicated
+# thread pool (bcrypt releases the GIL) instead of the event loop. Admission is
+# bounded overall, so a login burst is rejected with 429 rather than queueing
+# without limit. Attempts on the same account queue behind each other instead of
+# being rejected, so nobody can lock an account out by keeping bogus attempts in
+# flight. A per-client (IP) cap is opt-in: many users can share one proxy or NAT
+# address.
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+# Concurrent attempts per client address; 0 disables the cap
+PASSWORD_HASH_MAX_PER_CLIENT = int(os.getenv("PASSWORD_HASH_MAX_PER_CLIENT", "0"))
+# Attempts per account hashed at once; the rest wait their turn
+PASSWORD_HASH_MAX_PER_ACCOUNT = int(os.getenv("PASSWORD_HASH_MAX_PER_ACCOUNT", "1"))
+
+# min_rounds makes hashes created with a lower cost "need update", which
+# triggers the transparent rehash on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+
+class _AccountSlot:
+    __slots__ = ("semaphore", "users")
+
+    def __init__(self, limit: int):
+        self.semaphore = asyncio.Semaphore(limit)
+        self.users = 0
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        workers=PASSWORD_HASH_WORKERS,
+        max_pending=PASSWORD_HASH_MAX_PENDING,
+        max_per_client=PASSWORD_HASH_MAX_PER_CLIENT,
+        max_per_account=PASSWORD_HASH_MAX_PER_ACCOUNT,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_per_client = max_per_client
+        self.max_per_account = max_per_account
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._pending = 0
+        self._per_client: Dict[str, int] = {}
+        self._accounts: Dict[str, _AccountSlot] = {}
+        self.rejected = 0
+        self.queued = 0
+        self.completed = 0
+
+    @asynccontextmanager
+    async def _admit(self, client: Optional[str], account: Optional[str]):
+        # Waiting attempts count towards max_pending, so queues stay bounded overall
+        over_client_cap = self.max_per_client and client and self._per_client.get(client, 0) >= self.max_per_client
+        if self._pending >= self.max_pending or over_client_cap:
+            self.rejected += 1
+            raise HTTPException(status_code=429, detail="Too many concurrent login attempts", headers={"Retry-After": "1"})
+        self._pending += 1
+        if client:
+            self._per_client[client] = self._per_client.get(client, 0) + 1
+        slot = None
+        if account:
+            slot = self._accounts.get(account)
+            if slot is None:
+                slot = self._accounts[account] = _AccountSlot(self.max_per_account)
+            slot.users += 1
+        try:
+            if slot is None:
+                yield
+            else:
+                if slot.semaphore.locked():
+                    self.queued += 1
+                async with slot.semaphore:
+                    yield
+        finally:
+            self._pending -= 1
+            if client:
+                remaining = self._per_client[client] - 1
+                if remaining:
+                    self._per_client[client] = remaining
+                else:
+                    del self._per_client[client]
+            if slot is not None:
+                slot.users -= 1
+                if not slot.users:
+                    del self._accounts[account]
+            self.completed += 1
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def hash(self, password: str, client: Optional[str] = None, account: Optional[str] = None) -> str:
+        async with self._admit(client, account):
+            return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(
+        self, password: str, hashed: str, client: Optional[str] = None, account: Optional[str] = None
+    ) -> Tuple[bool, Optional[str]]:
+        # Returns (valid, new_hash); new_hash is set when the stored hash uses outdated parameters
+        async with self._admit(client, account):
+            return await self._run(pwd_context.verify_and_update, password, hashed)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Optional, Tuple
+from backend.ingest import BLOB_DIR, blob_path
+from backend.metrics import attachment_bytes, stage_duration
+
+# Attachment preprocessing before the summary prompt, run in a process pool so
+# image decoding and PDF parsing stay off the event loop:
+#   images -> resized to IMAGE_MAX_DIMENSION and recompressed (Pillow)
+#   PDFs   -> text layer only when it has enough text (pypdf), otherwise page
+#             images (pypdfium2), otherwise the original PDF
+# Results are cached on disk per source hash + settings. Pillow, pypdf and
+# pypdfium2 are optional; without them attachments pass through unchanged.
+
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_ENABLED", "1") == "1"
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", "2"))
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1536"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+PDF_MIN_TEXT_CHARS_PER_PAGE = int(os.getenv("PDF_MIN_TEXT_CHARS_PER_PAGE", "200"))
+PDF_PAGE_IMAGE_DPI = int(os.getenv("PDF_PAGE_IMAGE_DPI", "100"))
+PDF_MAX_PAGE_IMAGES = int(os.getenv("PDF_MAX_PAGE_IMAGES", "10"))
+
+DERIVED_DIR = os.path.join(BLOB_DIR, "derived")
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+preprocess_totals = {"requests": 0, "files": 0, "bytes_in": 0, "bytes_out": 0, "cache_hits": 0, "seconds": 0.0}
+
+
+def _settings() -> dict:
+    return {
+        "image_max_dimension": IMAGE_MAX_DIMENSION,
+        "image_jpeg_quality": IMAGE_JPEG_QUALITY,
+        "pdf_min_text_chars_per_page": PDF_MIN_TEXT_CHARS_PER_PAGE,
+        "pdf_page_image_dpi": PDF_PAGE_IMAGE_DPI,
+        "pdf_max_page_images": PDF_MAX_PAGE_IMAGES,
+    }
+
+
+def _manifest_path(sha256: str, settings: dict) -> str:
+    settings_hash = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+    return os.path.join(DERIVED_DIR, f"{sha256}-{settings_hash}.json")
+
+
+def _store_blob(data: bytes) -> str:
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = blob_path(sha256)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return sha256
+
+
+def _blob_part(data: bytes, mime_type: str) -> dict:
+    return {"type": "blob", "sha256": _store_blob(data), "mime_type": mime_type, "size": len(data)}
+
+
+def _passthrough(sha256: str, mime_type: str, size: int) -> List[dict]:
+    return [{"type": "blob", "sha256": sha256, "mime_type": mime_type, "size": size}]
+
+
+def _encode_image(image, settings: dict) -> Tuple[bytes, str]:
+    out = io.BytesIO()
+    if image.mode in ("RGBA", "LA", "P"):
+        image.save(out, format="PNG", optimize=True)
+        return out.getvalue(), "image/png"
+    image.convert("RGB").save(out, format="JPEG", quality=settings["image_jpeg_quality"], optimize=True)
+    return out.getvalue(), "image/jpeg"
+
+
+def _preprocess_image(sha256: str, mime_type: str, size: int, settings: dict) -> List[dict]:
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return _passthrough(sha256, mime_type, size)
+    with Image.open(blob_path(sha256)) as image:
+        image = ImageOps.exif_transpose(image)
+        max_dim = settings["image_max_dimension"]
+        image.thumbnail((max_dim, max_dim))
+        data, new_mime = _encode_image(image, settings)
+    if len(data) >= size:
+        # Already small and well compressed; keep the original
+        return _passthrough(sha256, mime_type, size)
+    return [_blob_part(data, new_mime)]
+
+
+def _render_pdf_pages(path: str, settings: dict) -> Optional[List[dict]]:
+    try:
+        import pypdfium2
+    except ImportError:
+        return None
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        parts = []
+        for index in range(min(len(pdf), settings["pdf_max_page_images"])):
+            image = pdf[index].render(scale=settings["pdf_page_image_dpi"] / 72).to_pil()
+            data, mime = _encode_image(image, settings)
+            parts.append(_blob_part(data, mime))
+        return parts
+    finally:
+        pdf.close()
+
+
+def _preprocess_pdf(sha256: str, mime_type: str, size: int, settings: dict, filename: str) -> List[dict]:
+    path = blob_path(sha256)
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        PdfReader = None
+    if PdfReader is not None:
+        reader = PdfReader(path)
+        pages = [page.extract_text() or "" for page in reader.pages]
+        text = "\n\n".join(p.strip() for p in pages if p.strip())
+        if pages and len(text) / len(pages) >= settings["pdf_min_text_chars_per_page"]:
+            return [{"type": "text", "text": f"Contents of attached PDF '{filename}':\n{text}", "size": len(text.encode())}]
+    # Scanned (or unreadable) PDF: send page images instead, or the PDF itself
+    rendered = _render_pdf_pages(path, settings)
+    if rendered and sum(p["size"] for p in rendered) < size:
+        return rendered
+    return _passthrough(sha256, mime_type, size)
+
+
+def preprocess_file(sha256: str, mime_type: str, size: int, kind: str, filename: str, settings: dict) -> List[dict]:
+    # Runs in a worker process. Returns the parts that replace this attachment.
+    manifest = _manifest_path(sha256, settings)
+    try:
+        if kind == "image" or mime_type.startswith("image/"):
+            parts = _preprocess_image(sha256, mime_type, size, settings)
+        elif kind == "pdf" or mime_type == "application/pdf":
+            parts = _preprocess_pdf(sha256, mime_type, size, settings, filename)
+        else:
+            parts = _passthrough(sha256, mime_type, size)
+    except Exception as e:
+        logger.warning("Preprocessing %s failed, sending original: %s", filename, e)
+        return _passthrough(sha256, mime_type, size)
+    os.makedirs(DERIVED_DIR, exist_ok=True)
+    tmp = f"{manifest}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(parts, f)
+    os.replace(tmp, manifest)
+    return parts
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that runs an event loop and Mongo client is unsafe
+        _pool = ProcessPoolExecutor(max_workers=PREPROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _load_manifest(path: str) -> Optional[List[dict]]:
+    try:
+        with open(path) as f:
+            parts = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # Keeps the manifest and its blobs away from the blob GC (see backend.ingest);
+    # if one was collected already the attachment is processed again
+    try:
+        for part in parts:
+            if part["type"] == "blob":
+                os.utime(blob_path(part["sha256"]))
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return parts
+
+
+async def _parts_for(attachment, settings: dict) -> Tuple[List[dict], bool]:
+    manifest = _manifest_path(attachment.sha256, settings)
+    cached = await asyncio.to_thread(_load_manifest, manifest)
+    if cached is not None:
+        return cached, True
+    if not PREPROCESS_ENABLED:
+        return _passthrough(attachment.sha256, attachment.content_type, attachment.size), False
+    loop = asyncio.get_running_loop()
+    parts = await loop.run_in_executor(
+        _get_pool(), preprocess_file,
+        attachment.sha256, attachment.content_type, attachment.size, attachment.kind, attachment.filename, settings,
+    )
+    return parts, False
+
+
+def _read_blob(sha256: str) -> bytes:
+    with open(blob_path(sha256), "rb") as f:
+        return f.read()
+
+
+async def prepare_attachment_parts(attachments) -> Tuple[List[Any], dict]:
+    # Turns ingested attachments into multimodal prompt parts; returns (parts, report)
+    start = time.perf_counter()
+    settings = _settings()
+    results = await asyncio.gather(*[_parts_for(a, settings) for a in attachments])
+    prompt_parts = []
+    bytes_out = 0
+    cache_hits = 0
+    for parts, cached in results:
+        cache_hits += cached
+        for part in parts:
+            bytes_out += part["size"]
+            if part["type"] == "text":
+                prompt_parts.append(part["text"])
+            else:
+                data = await asyncio.to_thread(_read_blob, part["sha256"])
+                prompt_parts.append({"mime_type": part["mime_type"], "data": data})
+    bytes_in = sum(a.size for a in attachments)
+    report = {
+        "files": len(attachments),
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "bytes_saved": bytes_in - bytes_out,
+        "cache_hits": cache_hits,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+    if attachments:
+        preprocess_totals["requests"] += 1
+        preprocess_totals["files"] += len(attachments)
+        preprocess_totals["bytes_in"] += bytes_in
+        preprocess_totals["bytes_out"] += bytes_out
+        preprocess_totals["cache_hits"] += cache_hits
+        preprocess_totals["seconds"] += report["elapsed_ms"] / 1000
+        attachment_bytes.inc(bytes_in, direction="in")
+        attachment_bytes.inc(bytes_out, direction="out")
+        stage_duration.observe(report["elapsed_ms"] / 1000, stage="preprocess")
+        logger.debug("Attachment preprocessing: %s", report)
+    return prompt_parts, report
@@ -0,0 +1,82 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from fastapi import HTTPException
+from backend.db import db
+from backend.ai_cache import integration_types
+
+# Keyset pagination over a user's projects, newest first. The cursor encodes the
+# (created_at, _id) of the last item returned, so every page is one index range
+# scan on projects(user_id, created_at, _id) no matter how deep it is.
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 200
+
+PROJECT_LIST_PROJECTION = {"name": 1, "description": 1, "created_at": 1}
+
+
+def encode_cursor(project: dict) -> str:
+    created_at = project.get("created_at")
+    raw = json.dumps({"t": created_at.isoformat() if created_at else None, "id": str(project["_id"])})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        created_at = datetime.fromisoformat(data["t"]) if data["t"] else None
+        return created_at, ObjectId(data["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def list_projects_page(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, integration_type: Optional[str] = None):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = {"user_id": user_id}
+    if integration_type:
+        query["integration_types"] = integration_type
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}},
+        ]
+    projects = await (
+        db.projects.find(query, PROJECT_LIST_PROJECTION)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+    next_cursor = encode_cursor(projects[limit - 1]) if len(projects) > limit else None
+    return projects[:limit], next_cursor
+
+
+async def backfill_project_integration_types(batch_size: int = 500):
+    # Projects created before integration_types existed get it from their orgview's node_list
+    updated = 0
+    cursor = db.projects.find({"integration_types": {"$exists": False}}, {"_id": 1})
+    batch = []
+    async for project in cursor:
+        batch.append(project["_id"])
+        if len(batch) >= batch_size:
+            updated += await _backfill_batch(batch)
+            batch = []
+    if batch:
+        updated += await _backfill_batch(batch)
+    return updated
+
+
+async def _backfill_batch(project_ids) -> int:
+    orgviews = await db.orgviews.find(
+        {"project_id": {"$in": [str(pid) for pid in project_ids]}}, {"project_id": 1, "node_list": 1}
+    ).to_list(length=None)
+    types_by_project = {o["project_id"]: integration_types(o.get("node_list")) for o in orgviews}
+    for pid in project_ids:
+        await db.projects.update_one(
+            {"_id": pid},
+            {"$set": {"integration_types": types_by_project.get(str(pid), [])}},
+        )
+    return len(project_ids)
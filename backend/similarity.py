@@ -0,0 +1,359 @@
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+import zlib
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+from bson import ObjectId
+from backend.db import db
+from backend.metrics import similarity_lookups, stage_timer
+
+# Similarity index over stored workflows, so a generation request that matches
+# an earlier one can reuse its result (no LLM calls) or use the closest past
+# workflows as examples in the detail prompt. Each orgview is represented by
+# two MinHash signatures (NumPy uint32 rows): one of the request context it was
+# generated from, one of its workflow's name, actors and actions. A lookup
+# compares the request context against every row at once; the share of equal
+# signature slots estimates Jaccard similarity of the word/bigram sets.
+#
+# The index is updated in place on insert and patch, synced from Mongo
+# (orgviews.updated_at) for writes made by other workers, and saved to
+# SIMILARITY_DIR so a restart only syncs what changed since.
+
+SIMILARITY_ENABLED = os.getenv("SIMILARITY_ENABLED", "1") == "1"
+SIMILARITY_DIR = os.getenv("SIMILARITY_DIR", ".cache/similarity")
+SIMILARITY_PERMUTATIONS = int(os.getenv("SIMILARITY_PERMUTATIONS", "64"))
+# Estimated Jaccard similarity of the request context at which a past result is reused as is
+SIMILARITY_REUSE_THRESHOLD = float(os.getenv("SIMILARITY_REUSE_THRESHOLD", "0.9"))
+SIMILARITY_EXAMPLE_THRESHOLD = float(os.getenv("SIMILARITY_EXAMPLE_THRESHOLD", "0.25"))
+SIMILARITY_EXAMPLES = int(os.getenv("SIMILARITY_EXAMPLES", "2"))
+SIMILARITY_EXAMPLE_MAX_LINES = int(os.getenv("SIMILARITY_EXAMPLE_MAX_LINES", "40"))
+# "user" only matches a user's own workflows; "global" matches across all users
+SIMILARITY_SCOPE = os.getenv("SIMILARITY_SCOPE", "user")
+SIMILARITY_SYNC_SECONDS = float(os.getenv("SIMILARITY_SYNC_SECONDS", "30"))
+# Lookups comparing more rows than this run in a worker thread instead of on the event loop
+SIMILARITY_THREAD_ROWS = int(os.getenv("SIMILARITY_THREAD_ROWS", "20000"))
+
+# A reused result skips the name, summary, detail and automate calls
+GENERATION_LLM_CALLS = 4
+
+_PRIME = 4294967291  # largest prime below 2**32, so hashed values fit in uint32
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("a an and are as at be by for from in into is it of on or our the their to we with".split())
+_CONTEXT_FIELDS = ("department_function", "team_size", "budget", "description")
+
+
+def context_text(context: dict) -> str:
+    return " ".join(str(context.get(field) or "") for field in _CONTEXT_FIELDS)
+
+
+def workflow_text(workflow_json: Optional[dict]) -> str:
+    if not workflow_json:
+        return ""
+    parts = []
+    pending = [workflow_json]
+    while pending:
+        workflow = pending.pop()
+        parts.append(str(workflow.get("name") or ""))
+        parts.extend(str(actor) for actor in workflow.get("actors") or [])
+        steps = list(workflow.get("steps") or [])
+        while steps:
+            step = steps.pop()
+            parts.append(f"{step.get('actor') or ''} {step.get('action') or ''}")
+            steps.extend(step.get("substeps") or [])
+        pending.extend(workflow.get("subworkflows") or [])
+    return " ".join(parts)
+
+
+def shingles(text: str) -> set:
+    words = [w for w in _WORD.findall(text.lower()) if w not in _STOPWORDS]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+class SimilarityIndex:
+    def __init__(self, directory: str = SIMILARITY_DIR, permutations: int = SIMILARITY_PERMUTATIONS, seed: int = 1):
+        self.directory = directory
+        self.permutations = permutations
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 31, size=permutations, dtype=np.uint64)
+        self._b = rng.integers(0, 2 ** 31, size=permutations, dtype=np.uint64)
+        self._size = 0
+        self._context = np.zeros((0, permutations), dtype=np.uint32)
+        self._content = np.zeros((0, permutations), dtype=np.uint32)
+        self._has_context = np.zeros(0, dtype=bool)
+        self._has_content = np.zeros(0, dtype=bool)
+        self._users = np.zeros(0, dtype=np.int32)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._user_codes: Dict[str, int] = {}
+        self.watermark = None  # latest orgviews.updated_at seen by sync
+        self._dirty = False
+        self._task = None
+        self._latencies = deque(maxlen=1024)
+        self.counts = {"lookups": 0, "reused": 0, "seeded": 0, "llm_calls_avoided": 0}
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        tokens = shingles(text)
+        if not tokens:
+            return None
+        hashes = np.fromiter((zlib.crc32(t.encode()) for t in tokens), dtype=np.uint64, count=len(tokens))
+        return ((hashes[:, None] * self._a + self._b) % _PRIME).min(axis=0).astype(np.uint32)
+
+    def _grow(self):
+        capacity = max(1024, 2 * len(self._users))
+        extra = capacity - len(self._users)
+        self._context = np.vstack([self._context, np.zeros((extra, self.permutations), dtype=np.uint32)])
+        self._content = np.vstack([self._content, np.zeros((extra, self.permutations), dtype=np.uint32)])
+        self._has_context = np.concatenate([self._has_context, np.zeros(extra, dtype=bool)])
+        self._has_content = np.concatenate([self._has_content, np.zeros(extra, dtype=bool)])
+        self._users = np.concatenate([self._users, np.full(extra, -1, dtype=np.int32)])
+
+    def _user_code(self, user_id: Optional[str]) -> int:
+        if user_id is None:
+            return -1
+        return self._user_codes.setdefault(user_id, len(self._user_codes))
+
+    def signatures(self, context: Optional[dict], workflow_json: Optional[dict]) -> tuple:
+        # Pure, so sync can compute these in a worker thread; rows are only written on the event loop
+        context_sig = self.signature(context_text(context)) if context else None
+        return context_sig, self.signature(workflow_text(workflow_json))
+
+    def upsert(self, orgview_id: str, user_id: Optional[str], context: Optional[dict], workflow_json: Optional[dict]):
+        self._store(orgview_id, user_id, *self.signatures(context, workflow_json))
+
+    def _store(self, orgview_id: str, user_id: Optional[str], context_sig, content_sig):
+        row = self._rows.get(orgview_id)
+        if row is None:
+            if self._size == len(self._users):
+                self._grow()
+            row = self._rows[orgview_id] = self._size
+            self._ids.append(orgview_id)
+            self._size += 1
+        self._users[row] = self._user_code(user_id)
+        self._has_context[row] = context_sig is not None
+        if context_sig is not None:
+            self._context[row] = context_sig
+        self._has_content[row] = content_sig is not None
+        if content_sig is not None:
+            self._content[row] = content_sig
+        self._dirty = True
+
+    def update_content(self, orgview_id: str, workflow_json: Optional[dict]):
+        # On patch: the workflow changed, the request it was generated from did not
+        row = self._rows.get(orgview_id)
+        if row is None:
+            # Not indexed by this worker yet; the next sync picks it up
+            return
+        content_sig = self.signature(workflow_text(workflow_json))
+        self._has_content[row] = content_sig is not None
+        if content_sig is not None:
+            self._content[row] = content_sig
+        self._dirty = True
+
+    def query(self, user_id: Optional[str], context: dict, examples: int = SIMILARITY_EXAMPLES) -> dict:
+        # -> {"reuse": (orgview id, score) or None, "examples": [(orgview id, score), ...]}
+        start = time.perf_counter()
+        result = {"reuse": None, "examples": []}
+        q = self.signature(context_text(context))
+        n = self._size
+        if q is not None and n:
+            # Only rows in scope are compared (a user's own rows are a small slice of the index)
+            if SIMILARITY_SCOPE == "global":
+                rows = np.arange(n)
+            else:
+                rows = np.flatnonzero(self._users[:n] == self._user_codes.get(user_id, -2))
+            if len(rows):
+                context_scores = np.where(self._has_context[rows], (self._context[rows] == q).mean(axis=1), 0.0)
+                content_scores = np.where(self._has_content[rows], (self._content[rows] == q).mean(axis=1), 0.0)
+                best = int(context_scores.argmax())
+                if context_scores[best] >= SIMILARITY_REUSE_THRESHOLD:
+                    result["reuse"] = (self._ids[rows[best]], float(context_scores[best]))
+                scores = np.maximum(context_scores, content_scores)
+                top = np.argsort(-scores)[:examples]
+                result["examples"] = [
+                    (self._ids[rows[i]], float(scores[i])) for i in top if scores[i] >= SIMILARITY_EXAMPLE_THRESHOLD
+                ]
+        self._latencies.append(time.perf_counter() - start)
+        return result
+
+    def __len__(self):
+        return self._size
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, "index.npz")
+
+    def save(self):
+        n = self._size
+        meta = {
+            "permutations": self.permutations,
+            "ids": self._ids[:n],
+            "user_codes": dict(self._user_codes),
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        # Unique per writer: workers (and a shutdown save racing the periodic one)
+        # must not interleave writes into one temp file; np.savez wants the .npz suffix
+        tmp = f"{self._path()}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp.npz"
+        try:
+            np.savez(
+                tmp,
+                context=self._context[:n], content=self._content[:n],
+                has_context=self._has_context[:n], has_content=self._has_content[:n],
+                users=self._users[:n], meta=np.array(json.dumps(meta)),
+            )
+            os.replace(tmp, self._path())
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def load(self) -> bool:
+        try:
+            with np.load(self._path(), allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta["permutations"] != self.permutations:
+                    return False
+                self._context = data["context"].copy()
+                self._content = data["content"].copy()
+                self._has_context = data["has_context"].copy()
+                self._has_content = data["has_content"].copy()
+                self._users = data["users"].copy()
+        except (OSError, KeyError, ValueError):
+            return False
+        self._ids = meta["ids"]
+        self._rows = {orgview_id: row for row, orgview_id in enumerate(self._ids)}
+        self._user_codes = meta["user_codes"]
+        self._size = len(self._ids)
+        self.watermark = datetime.fromisoformat(meta["watermark"]) if meta["watermark"] else None
+        return True
+
+    async def sync(self, batch_size: int = 500):
+        # Indexes orgviews created or patched since the watermark (all of them on the first run)
+        query = {"updated_at": {"$gte": self.watermark}} if self.watermark else {}
+        cursor = db.orgviews.find(
+            query, {"workflow_json": 1, "source_context": 1, "user_id": 1, "project_id": 1, "updated_at": 1}
+        ).sort("updated_at", 1)
+        batch = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                await self._index_docs(batch)
+                batch = []
+        if batch:
+            await self._index_docs(batch)
+
+    async def _index_docs(self, docs: List[dict]):
+        # Seen by the previous sync ($gte keeps writes sharing the watermark's timestamp)
+        docs = [d for d in docs if not (d.get("updated_at") == self.watermark and str(d["_id"]) in self._rows)]
+        # Orgviews stored before user_id was recorded on them get it from their project
+        missing = [ObjectId(d["project_id"]) for d in docs if not d.get("user_id") and ObjectId.is_valid(d.get("project_id", ""))]
+        owners = {}
+        if missing:
+            async for project in db.projects.find({"_id": {"$in": missing}}, {"user_id": 1}):
+                owners[str(project["_id"])] = project.get("user_id")
+        signatures = await asyncio.to_thread(
+            lambda: [self.signatures(d.get("source_context"), d.get("workflow_json")) for d in docs]
+        )
+        for doc, (context_sig, content_sig) in zip(docs, signatures):
+            user_id = doc.get("user_id") or owners.get(doc.get("project_id"))
+            self._store(str(doc["_id"]), user_id, context_sig, content_sig)
+        updated = [d["updated_at"] for d in docs if d.get("updated_at")]
+        if updated:
+            self.watermark = max(updated + ([self.watermark] if self.watermark else []))
+
+    async def _run(self):
+        if not await asyncio.to_thread(self.load):
+            print("Similarity index: no saved index, building from Mongo")
+        while True:
+            try:
+                await self.sync()
+                if self._dirty:
+                    self._dirty = False
+                    await asyncio.to_thread(self.save)
+            except Exception as e:
+                print("Similarity index sync failed:", e)
+            await asyncio.sleep(SIMILARITY_SYNC_SECONDS)
+
+    def start(self):
+        if SIMILARITY_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            if self._dirty:
+                await asyncio.to_thread(self.save)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "enabled": SIMILARITY_ENABLED,
+            "entries": self._size,
+            "scope": SIMILARITY_SCOPE,
+            **self.counts,
+            "query_ms_p50": round(latencies[len(latencies) // 2] * 1000, 3) if latencies else None,
+            "query_ms_p95": round(latencies[int(len(latencies) * 0.95)] * 1000, 3) if latencies else None,
+        }
+
+
+similarity_index = SimilarityIndex()
+
+
+async def lookup(user_id: Optional[str], context: dict) -> dict:
+    if not SIMILARITY_ENABLED or not len(similarity_index):
+        return {"reuse": None, "examples": []}
+    with stage_timer("similarity"):
+        if SIMILARITY_SCOPE == "global" and len(similarity_index) > SIMILARITY_THREAD_ROWS:
+            # Rows written meanwhile on the loop are at worst compared half-updated
+            result = await asyncio.to_thread(similarity_index.query, user_id, context)
+        else:
+            result = similarity_index.query(user_id, context)
+    similarity_index.counts["lookups"] += 1
+    return result
+
+
+def record_outcome(outcome: str):
+    # outcome: "reused", "seeded" or "miss"
+    similarity_lookups.inc(outcome=outcome)
+    if outcome in similarity_index.counts:
+        similarity_index.counts[outcome] += 1
+    if outcome == "reused":
+        similarity_index.counts["llm_calls_avoided"] += GENERATION_LLM_CALLS
+
+
+def _outline(workflow_json: dict, max_lines: int) -> List[str]:
+    lines = [f"Workflow: {workflow_json.get('name', '')}"]
+    pending = [(step, 0) for step in reversed(workflow_json.get("steps") or [])]
+    while pending and len(lines) < max_lines:
+        step, depth = pending.pop()
+        lines.append(f"{'  ' * depth}- {step.get('actor', '')}: {step.get('action', '')}")
+        pending.extend((sub, depth + 1) for sub in reversed(step.get("substeps") or []))
+    return lines
+
+
+async def example_prompt_context(examples: List[tuple]) -> str:
+    # Outlines of the closest past workflows, for the {context} slot of the detail prompt
+    if not examples:
+        return ""
+    ids = [ObjectId(orgview_id) for orgview_id, _ in examples if ObjectId.is_valid(orgview_id)]
+    docs = {str(d["_id"]): d async for d in db.orgviews.find({"_id": {"$in": ids}}, {"workflow_json": 1})}
+    outlines = []
+    for orgview_id, _ in examples:
+        workflow_json = (docs.get(orgview_id) or {}).get("workflow_json")
+        if workflow_json:
+            outlines.append("\n".join(_outline(workflow_json, SIMILARITY_EXAMPLE_MAX_LINES)))
+    if not outlines:
+        return ""
+    return (
+        "Workflows from similar past processes, as examples of the expected structure and level of detail "
+        "(adapt them to this process, do not copy them):\n\n" + "\n\n".join(outlines)
+    )
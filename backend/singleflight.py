@@ -0,0 +1,37 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+# Request coalescing: concurrent calls with the same key share one execution.
+# The execution runs in its own task, so cancelling any caller (the one that
+# started it included) leaves it running for the others.
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            self.executions += 1
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark retrieved so a failure every caller abandoned does not log a warning
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"executions": self.executions, "coalesced": self.coalesced, "in_flight": len(self._calls)}
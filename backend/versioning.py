@@ -0,0 +1,292 @@
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from pymongo.errors import DuplicateKeyError
+from backend.db import db
+
+# Version log for orgview edits. Each patch stores an RFC 6902 JSON patch
+# (add/remove/replace) between consecutive revisions of
+#   {"workflow_json": ..., "react_flow_json": ...}
+# in db.orgview_revisions, with a full snapshot every VERSION_SNAPSHOT_INTERVAL
+# revisions. A past revision is rebuilt from the nearest snapshot at or before
+# it plus the patches after that. The orgview itself is updated with $set/$unset
+# on just the changed paths, guarded by its revision number.
+#
+# The log entry is written first, under the unique (orgview_id, revision) index,
+# so the orgview is never ahead of its log. An entry ahead of the orgview belongs
+# to a writer still between its two writes, or to one that died there (its edit
+# never landed); the latter is replaced once older than VERSION_PENDING_SECONDS.
+
+VERSION_SNAPSHOT_INTERVAL = int(os.getenv("VERSION_SNAPSHOT_INTERVAL", "20"))
+VERSION_PENDING_SECONDS = int(os.getenv("VERSION_PENDING_SECONDS", "30"))
+
+VERSIONED_FIELDS = ("workflow_json", "react_flow_json")
+
+
+class RevisionConflict(Exception):
+    def __init__(self, expected: Optional[int], current: int):
+        super().__init__(f"OrgView is at revision {current}, not {expected}")
+        self.expected = expected
+        self.current = current
+
+
+def _escape(token) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def json_diff(old: Any, new: Any) -> List[dict]:
+    # Iterative, so deep workflows don't hit the recursion limit. Lists are
+    # compared after trimming their common prefix and suffix, so inserting or
+    # deleting a step produces one op instead of shifting every later element.
+    ops = []
+    stack = [("", old, new)]
+    while stack:
+        path, a, b = stack.pop()
+        if a == b:
+            continue
+        if isinstance(a, dict) and isinstance(b, dict):
+            for key in a:
+                if key not in b:
+                    ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+            for key, value in b.items():
+                if key not in a:
+                    ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+                else:
+                    stack.append((f"{path}/{_escape(key)}", a[key], value))
+        elif isinstance(a, list) and isinstance(b, list):
+            prefix = 0
+            while prefix < len(a) and prefix < len(b) and a[prefix] == b[prefix]:
+                prefix += 1
+            suffix = 0
+            while suffix < len(a) - prefix and suffix < len(b) - prefix and a[-1 - suffix] == b[-1 - suffix]:
+                suffix += 1
+            mid_a = len(a) - prefix - suffix
+            mid_b = len(b) - prefix - suffix
+            common = min(mid_a, mid_b)
+            # Removals/insertions happen after the element-wise diffs, so these indices stay valid
+            for i in range(prefix, prefix + common):
+                stack.append((f"{path}/{i}", a[i], b[i]))
+            for _ in range(mid_a - common):
+                ops.append({"op": "remove", "path": f"{path}/{prefix + common}"})
+            for i in range(prefix + common, prefix + mid_b):
+                ops.append({"op": "add", "path": f"{path}/{i}", "value": b[i]})
+        else:
+            ops.append({"op": "replace", "path": path, "value": b})
+    return ops
+
+
+def _resolve(doc: Any, path: str):
+    # Returns (container, last token) for a JSON pointer
+    tokens = [_unescape(t) for t in path.split("/")[1:]]
+    container = doc
+    for token in tokens[:-1]:
+        container = container[int(token)] if isinstance(container, list) else container[token]
+    return container, tokens[-1]
+
+
+def apply_patch(doc: Any, ops: List[dict]) -> Any:
+    # Applies ops in place and returns the (possibly replaced) document
+    for op in ops:
+        if op["path"] == "":
+            if op["op"] == "remove":
+                doc = None
+            else:
+                doc = op["value"]
+            continue
+        container, token = _resolve(doc, op["path"])
+        if isinstance(container, list):
+            if op["op"] == "add":
+                container.insert(len(container) if token == "-" else int(token), op["value"])
+            elif op["op"] == "remove":
+                del container[int(token)]
+            else:
+                container[int(token)] = op["value"]
+        elif op["op"] == "remove":
+            del container[token]
+        else:
+            container[token] = op["value"]
+    return doc
+
+
+def mongo_update(ops: List[dict], doc: dict) -> dict:
+    # Turns ops against `doc` (already patched) into a $set/$unset on the changed
+    # paths only. Length changes of an array rewrite that array, since Mongo has
+    # no positional insert/delete.
+    sets = {}
+    unsets = set()
+    for op in ops:
+        tokens = [_unescape(t) for t in op["path"].split("/")[1:]]
+        container = doc
+        parent_is_list = False
+        for depth, token in enumerate(tokens):
+            parent_is_list = isinstance(container, list)
+            if depth == len(tokens) - 1:
+                break
+            container = container[int(token)] if parent_is_list else container[token]
+        if parent_is_list and op["op"] != "replace":
+            tokens = tokens[:-1]
+            unset = False
+        else:
+            unset = op["op"] == "remove"
+        # Keys Mongo can't address with dot notation fall back to their nearest safe ancestor
+        for depth, token in enumerate(tokens):
+            if "." in token or token.startswith("$"):
+                tokens = tokens[:depth]
+                unset = False
+                break
+        if not tokens:
+            tokens = [_unescape(op["path"].split("/")[1])]
+            unset = False
+        path = ".".join(tokens)
+        if unset:
+            unsets.add(path)
+        else:
+            sets[path] = None
+    # A write to a parent makes writes to its descendants redundant (and Mongo rejects the overlap)
+    paths = set(sets) | unsets
+    kept = []
+    for path in sorted(paths, key=lambda p: p.count(".")):
+        tokens = path.split(".")
+        if any(".".join(tokens[:depth]) in paths for depth in range(1, len(tokens))):
+            continue
+        kept.append(path)
+    update = {}
+    for path in kept:
+        if path in unsets and path not in sets:
+            update.setdefault("$unset", {})[path] = ""
+        else:
+            update.setdefault("$set", {})[path] = _lookup(doc, path.split("."))
+    return update
+
+
+def _lookup(doc: Any, tokens: List[str]):
+    for token in tokens:
+        doc = doc[int(token)] if isinstance(doc, list) else doc[token]
+    return doc
+
+
+def versioned_state(orgview: dict) -> dict:
+    return {field: orgview.get(field) for field in VERSIONED_FIELDS}
+
+
+def revision_entry(orgview: dict, revision: int, ops: Optional[List[dict]], state: dict, user_id: Optional[str] = None) -> dict:
+    entry = {
+        "orgview_id": orgview["_id"],
+        "project_id": orgview.get("project_id"),
+        "revision": revision,
+        "ops": ops or [],
+        "user_id": user_id,
+        "created_at": datetime.utcnow(),
+    }
+    if ops is None or revision % VERSION_SNAPSHOT_INTERVAL == 0:
+        entry["snapshot"] = state
+    return entry
+
+async def record_revision(orgview: dict, revision: int, ops: Optional[List[dict]], state: dict, user_id: Optional[str] = None):
+    entry = revision_entry(orgview, revision, ops, state, user_id)
+    try:
+        await db.orgview_revisions.insert_one(entry)
+    except DuplicateKeyError:
+        if revision != 0:
+            raise
+        # A concurrent first patch already recorded the base snapshot
+
+
+async def _current_revision(orgview: dict) -> int:
+    latest = await db.orgviews.find_one({"_id": orgview["_id"]}, {"revision": 1})
+    return (latest or {}).get("revision") or 0
+
+
+async def _reserve_revision(orgview: dict, entry: dict, expected: int):
+    try:
+        await db.orgview_revisions.insert_one(entry)
+        return
+    except DuplicateKeyError:
+        pass
+    current = await _current_revision(orgview)
+    existing = await db.orgview_revisions.find_one({"orgview_id": orgview["_id"], "revision": entry["revision"]}, {"created_at": 1})
+    abandoned = existing and existing["created_at"] < datetime.utcnow() - timedelta(seconds=VERSION_PENDING_SECONDS)
+    if current >= entry["revision"] or not abandoned:
+        raise RevisionConflict(expected, current)
+    await db.orgview_revisions.delete_one({"_id": existing["_id"]})
+    try:
+        await db.orgview_revisions.insert_one(entry)
+    except DuplicateKeyError:
+        raise RevisionConflict(expected, current)
+
+
+async def commit_revision(orgview: dict, new_state: dict, extra_set: dict, expected_revision: Optional[int] = None, user_id: Optional[str] = None) -> dict:
+    # Writes new_state as the next revision of `orgview`. Raises RevisionConflict
+    # when expected_revision (or a concurrent writer) disagrees with the stored one.
+    current = orgview.get("revision")
+    if expected_revision is not None and expected_revision != (current or 0):
+        raise RevisionConflict(expected_revision, current or 0)
+    old_state = versioned_state(orgview)
+    if not current:
+        # Orgviews created before versioning (or whose creation stopped short of
+        # the base snapshot) get their current state as revision 0
+        await record_revision(orgview, 0, None, old_state, user_id)
+        current = 0
+    expected = expected_revision if expected_revision is not None else current
+    ops = json_diff(old_state, new_state)
+    entry = revision_entry(orgview, current + 1, ops, new_state, user_id)
+    await _reserve_revision(orgview, entry, expected)
+    update = mongo_update(ops, new_state) if ops else {}
+    update.setdefault("$set", {}).update(extra_set)
+    update["$set"]["revision"] = current + 1
+    match = {"_id": orgview["_id"], "revision": orgview["revision"] if "revision" in orgview else {"$exists": False}}
+    result = await db.orgviews.update_one(match, update)
+    if result.matched_count == 0:
+        # Our entry describes an edit that did not land
+        await db.orgview_revisions.delete_one({"_id": entry["_id"]})
+        raise RevisionConflict(expected, await _current_revision(orgview))
+    return {"revision": current + 1, "ops": len(ops)}
+
+
+async def load_revision(orgview: dict, revision: int) -> Optional[dict]:
+    current = orgview.get("revision") or 0
+    if revision == current:
+        return versioned_state(orgview)
+    if revision < 0 or revision > current:
+        return None
+    snapshot = await db.orgview_revisions.find_one(
+        {"orgview_id": orgview["_id"], "revision": {"$lte": revision}, "snapshot": {"$exists": True}},
+        sort=[("revision", -1)],
+    )
+    if not snapshot:
+        return None
+    state = snapshot["snapshot"]
+    replayed = snapshot["revision"]
+    cursor = db.orgview_revisions.find(
+        {"orgview_id": orgview["_id"], "revision": {"$gt": snapshot["revision"], "$lte": revision}},
+        {"ops": 1, "revision": 1},
+    ).sort("revision", 1)
+    async for entry in cursor:
+        if entry["revision"] != replayed + 1:
+            # A missing patch (logs written before entries went in first) can't be skipped
+            return None
+        state = apply_patch(state, entry["ops"])
+        replayed += 1
+    return state if replayed == revision else None
+
+
+async def list_revisions(orgview: dict, limit: int = 100) -> List[dict]:
+    # Entries ahead of the orgview are writes still in flight (or abandoned)
+    cursor = db.orgview_revisions.find(
+        {"orgview_id": orgview["_id"], "revision": {"$lte": orgview.get("revision") or 0}},
+        {"revision": 1, "user_id": 1, "created_at": 1, "ops": 1, "snapshot": 1},
+    ).sort("revision", -1).limit(limit)
+    return [
+        {
+            "revision": entry["revision"],
+            "user_id": entry.get("user_id"),
+            "created_at": entry.get("created_at"),
+            "ops": len(entry.get("ops") or []),
+            "snapshot": "snapshot" in entry,
+        }
+        async for entry in cursor
+    ]
@@ -0,0 +1,137 @@
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from benchmarks.common import offline_env, format_ms, summarize
+
+offline_env()
+
+import httpx  # noqa: E402
+from bson import ObjectId  # noqa: E402
+
+from backend.analytics import GLOBAL_ID, backfill_analytics, get_analytics, summary_id  # noqa: E402
+from backend.llm_gateway import llm_gateway  # noqa: E402
+from backend.main import app  # noqa: E402
+from benchmarks.fake_model import FakeChatModel, install_fake_model  # noqa: E402
+from benchmarks.fake_mongo import FakeDatabase, install_fake_db  # noqa: E402
+
+# /analytics served from the summary documents versus computing the same numbers
+# per request by scanning a user's orgviews, on a store seeded with orgviews
+# that predate the aggregates (so the backfill is timed too). Then checks that
+# the incrementally maintained summaries after generate, patch and AI-graph
+# refresh match a full rebuild.
+
+TYPES = ["default", "default", "hubspot", "gmail", "slack", "googleSheets", "notion", "chatgpt"]
+ACTORS = ["Sales Rep", "Manager", "Finance", "Customer", "Support Agent", "Legal", "Ops"]
+
+
+def seed(db, orgviews, users, nodes, rng):
+    user_ids = [str(ObjectId()) for _ in range(users)]
+    for _ in range(orgviews):
+        project_id = ObjectId()
+        size = rng.randint(nodes // 2, nodes * 2)
+        db.projects._docs[project_id] = {"_id": project_id, "user_id": rng.choice(user_ids), "name": "Seeded"}
+        orgview_id = ObjectId()
+        db.orgviews._docs[orgview_id] = {
+            "_id": orgview_id,
+            "project_id": str(project_id),
+            "workflow_json": {"name": "Seeded", "actors": rng.sample(ACTORS, 3), "steps": []},
+            "react_flow_json": {
+                "nodes": [{"id": str(i)} for i in range(size)],
+                "edges": [{"id": f"e{i}"} for i in range(size - 1)],
+            },
+            "node_list": [{"name": f"Step {i}", "type": rng.choice(TYPES)} for i in range(size // 2)],
+        }
+    return user_ids
+
+
+async def scan_analytics(db, user_id):
+    # What /analytics would cost without the summaries
+    project_ids = [str(p["_id"]) async for p in db.projects.find({"user_id": user_id}, {"_id": 1})]
+    flows = nodes = 0
+    types, actors = Counter(), Counter()
+    async for orgview in db.orgviews.find({"project_id": {"$in": project_ids}}):
+        flows += 1
+        nodes += len(orgview["react_flow_json"]["nodes"])
+        types.update(n["type"] for n in orgview.get("node_list") or [])
+        actors.update(orgview["workflow_json"].get("actors") or [])
+    return {"flows": flows, "nodes": nodes, "types": types, "actors": actors}
+
+
+async def timed(fn, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def flow_summary(doc):
+    return {
+        field: doc.get(field, 0) if field in ("flows", "nodes", "edges")
+        else {k: v for k, v in (doc.get(field) or {}).items() if v}
+        for field in ("flows", "nodes", "edges", "actors", "integration_types")
+    }
+
+
+async def check_consistency(db, args):
+    install_fake_model(FakeChatModel(latency=lambda: 0.0, seed=args.seed))
+    llm_gateway.tokens_per_minute = 0
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        r = await client.post("/auth/register", data={"username": "analytics@example.com", "password": "correct horse battery"})
+        headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+        project_ids = []
+        for i in range(3):
+            r = await client.post("/orgview/generate", headers=headers, data={
+                "department_function": "Sales", "team_size": str(5 + i), "budget": "$10k",
+                "description": f"Process {i}: qualify leads, send quotes, follow up",
+            })
+            project_ids.append(r.json()["project_id"])
+        # Drop the last node of one diagram; the patch also schedules an AI-graph refresh
+        graph = (await client.get(f"/orgview/retrieve/{project_ids[0]}", headers=headers)).json()["react_flow_json"]
+        dropped = graph["nodes"].pop()["id"]
+        graph["edges"] = [e for e in graph["edges"] if dropped not in (e["source"], e["target"])]
+        r = await client.post("/orgview/patch", headers=headers, json={"project_id": project_ids[0], "react_flow_json": graph})
+        r.raise_for_status()
+        data = (await client.get("/analytics", headers=headers)).json()["data"]
+        print(f"after 3 generations and a patch: {data}")
+    incremental = {doc["_id"]: flow_summary(doc) for doc in await db.analytics.find({}).to_list(None)}
+    await backfill_analytics(force=True)
+    rebuilt = {doc["_id"]: flow_summary(doc) for doc in await db.analytics.find({}).to_list(None)}
+    mismatched = [key for key in rebuilt if incremental.get(key) != rebuilt[key]]
+    print(f"incremental vs rebuilt summaries: {'match' if not mismatched else f'MISMATCH in {mismatched}'}")
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    db = install_fake_db(FakeDatabase())
+    user_ids = seed(db, args.orgviews, args.users, args.nodes, rng)
+    start = time.perf_counter()
+    users = await backfill_analytics()
+    print(f"backfill of {args.orgviews} orgviews ({users} users): {time.perf_counter() - start:.2f}s")
+    user_id = user_ids[0]
+    scanned = await scan_analytics(db, user_id)
+    served = await get_analytics(user_id)
+    assert scanned["flows"] == served["totalFlows"] and scanned["nodes"] == served["graphSize"]["nodes"]
+    print(f"per-request scan ({scanned['flows']} orgviews): {format_ms(await timed(lambda: scan_analytics(db, user_id), args.repeat))}")
+    print(f"summary document:               {format_ms(await timed(lambda: get_analytics(user_id), args.repeat))}")
+    global_doc = await db.analytics.find_one({"_id": GLOBAL_ID})
+    assert global_doc["flows"] == args.orgviews and await db.analytics.find_one({"_id": summary_id(user_id)})
+    await check_consistency(db, args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orgviews", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--nodes", type=int, default=40, help="typical diagram size")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.common import offline_env
+
+offline_env()
+
+import httpx  # noqa: E402
+
+from backend.llm_gateway import llm_gateway  # noqa: E402
+from backend.main import app  # noqa: E402
+from benchmarks.fake_model import FakeChatModel, install_fake_model  # noqa: E402
+from benchmarks.fake_mongo import FakeDatabase, install_fake_db  # noqa: E402
+
+# Onboarding N departments: one blocking /orgview/generate per department
+# (what the client did before) versus a single /orgview/batch submission, with
+# the fake model and the in-memory Mongo stand-in. The app is served by an
+# in-process uvicorn so the NDJSON results really stream. The ideal batch time
+# is about N * (LLM calls per item) * latency / LLM_MAX_CONCURRENCY.
+
+DEPARTMENTS = ["Sales", "Finance", "Support", "Operations", "HR", "Legal", "Marketing", "IT"]
+
+
+def department(i, rng):
+    return {
+        "department_function": DEPARTMENTS[i % len(DEPARTMENTS)],
+        "team_size": str(rng.randint(2, 50)),
+        "budget": f"${rng.randint(1, 100)}k",
+        "description": f"Onboarding department {i}",
+    }
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    db = install_fake_db(FakeDatabase())
+    fake = install_fake_model(FakeChatModel(latency=lambda: args.llm_latency, seed=args.seed))
+    llm_gateway.tokens_per_minute = 0
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=None) as client:
+            r = await client.post("/auth/register", data={"username": "batch@example.com", "password": "correct horse battery"})
+            headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+            items = [department(i, rng) for i in range(args.items)]
+            if not args.skip_sequential:
+                calls, ops = fake.calls, db.operations
+                start = time.perf_counter()
+                for item in items:
+                    (await client.post("/orgview/generate", data={**item, "description": item["description"] + " (seq)"}, headers=headers)).raise_for_status()
+                elapsed = time.perf_counter() - start
+                print(f"sequential: {elapsed:.2f}s for {args.items} departments, llm_calls={fake.calls - calls} db_ops={db.operations - ops}")
+
+            calls, ops = fake.calls, db.operations
+            start = time.perf_counter()
+            first = None
+            done = 0
+            async with client.stream("POST", "/orgview/batch", data={"items": json.dumps(items)}, headers=headers) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    record = json.loads(line)
+                    if record.get("status") == "done":
+                        done += 1
+                        first = first or time.perf_counter() - start
+                    elif "summary" in record:
+                        summary = record["summary"]
+            elapsed = time.perf_counter() - start
+            per_item = (fake.calls - calls) / max(1, args.items)
+            ideal = args.items * per_item * args.llm_latency / llm_gateway.max_concurrency
+            print(
+                f"batch:      {elapsed:.2f}s for {args.items} departments ({done} done, {summary['failed']} failed), "
+                f"first result {first or 0:.2f}s, llm_calls={fake.calls - calls} db_ops={db.operations - ops}"
+            )
+            print(f"ideal at LLM concurrency {llm_gateway.max_concurrency}: {ideal:.2f}s")
+    finally:
+        server.should_exit = True
+        await serving
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--skip-sequential", action="store_true")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import asyncio
+import random
+
+from benchmarks.common import LoopLagProbe, format_ms, offline_env, summarize, timed
+
+offline_env()
+
+from backend.orgview_service import OrgViewService  # noqa: E402
+from benchmarks.fake_model import FakeChatModel, install_fake_model  # noqa: E402
+
+# Drives N concurrent OrgViewService.build_org_view calls against a fake model
+# and reports per-generation latency and event-loop lag while they run.
+
+
+async def health_pings(stop, interval=0.05):
+    # Stand-in for /health traffic: how long a trivial coroutine waits for the loop
+    latencies = []
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(0)
+        latencies.append(loop.time() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run(concurrency, mean_latency, seed):
+    rng = random.Random(seed)
+    fake = install_fake_model(FakeChatModel(latency=lambda: rng.expovariate(1 / mean_latency), seed=seed))
+    service = OrgViewService()
+    probe = LoopLagProbe()
+    probe.start()
+    stop = asyncio.Event()
+    pings = asyncio.create_task(health_pings(stop))
+    results = await asyncio.gather(*[
+        timed(service.build_org_view("Sales", "10", "$10k", "Lead qualification", [], []))
+        for _ in range(concurrency)
+    ])
+    stop.set()
+    ping_latencies = await pings
+    lag = await probe.stop()
+    latencies = [elapsed for elapsed, _ in results]
+    print(f"concurrency={concurrency} llm_calls={fake.calls}")
+    print("  generation latency:", format_ms(summarize(latencies)))
+    print("  health latency:    ", format_ms(summarize(ping_latencies)))
+    print("  event-loop lag:    ", format_ms(lag))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--mean-latency", type=float, default=0.5, help="mean fake LLM latency in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for n in args.concurrency:
+        asyncio.run(run(n, args.mean_latency, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import time
+
+from benchmarks.common import offline_env
+
+offline_env()
+
+from backend.langchain_pipeline import WorkflowDetail, workflowdetail_to_reactflow  # noqa: E402
+from backend.layout import layout_cache, layout_graph  # noqa: E402
+from benchmarks.synthetic import synthetic_dag, synthetic_workflow  # noqa: E402
+
+# Times the server-side layered layout on nested workflow graphs and on flat
+# DAGs with random edges (the crossing-minimisation worst case), cold and cached.
+
+
+def measure(graph, repeat):
+    cold = []
+    for _ in range(repeat):
+        layout_cache.clear()
+        start = time.perf_counter()
+        layout_graph(graph["nodes"], graph["edges"])
+        cold.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    layout_graph(graph["nodes"], graph["edges"])
+    warm = time.perf_counter() - start
+    return min(cold), warm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for n in args.nodes:
+        workflow = WorkflowDetail(**synthetic_workflow(nodes=n, seed=args.seed))
+        nested = workflowdetail_to_reactflow(workflow)
+        groups = sum(1 for node in nested["nodes"] if "style" in node)
+        cold, warm = measure(nested, args.repeat)
+        print(f"workflow nodes={len(nested['nodes'])} groups={groups}: cold={cold * 1000:.1f}ms cached={warm * 1000:.1f}ms")
+        dag = synthetic_dag(nodes=n, layers=max(2, n // 20), seed=args.seed)
+        cold, warm = measure(dag, args.repeat)
+        print(f"dag      nodes={n} edges={len(dag['edges'])}: cold={cold * 1000:.1f}ms cached={warm * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
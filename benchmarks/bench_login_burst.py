@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+
+from benchmarks.common import LoopLagProbe, format_ms, summarize
+
+from fastapi import HTTPException
+
+from backend.password_hashing import PasswordHasher, pwd_context
+
+# Fires a burst of bcrypt verifications the way /auth/login performs them and
+# measures how long a /health-style coroutine waits for the event loop meanwhile.
+# "inline" is the old behaviour (pwd_context.verify on the loop). The pooled
+# scenarios use the default admission limits: "pool" spreads logins over many
+# clients and accounts, "nat" sends every login from one shared address and
+# "account" aims every attempt at one email (they queue; none is rejected).
+
+SCENARIOS = {
+    "pool": lambda i: (f"ip:10.0.0.{i % 250}", f"email:user{i}@example.com"),
+    "nat": lambda i: ("ip:203.0.113.7", f"email:user{i}@example.com"),
+    "account": lambda i: (f"ip:10.0.0.{i % 250}", "email:target@example.com"),
+}
+
+
+async def health_pings(stop, interval=0.01):
+    latencies = []
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(0)
+        latencies.append(loop.time() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+async def run(mode, logins, password_hash):
+    # Only the global cap is raised; per-client and per-account limits stay at their defaults
+    hasher = PasswordHasher(max_pending=logins)
+
+    async def inline_login(i):
+        return pwd_context.verify("correct horse", password_hash)
+
+    async def pooled_login(i):
+        try:
+            valid, _ = await hasher.verify_and_update("correct horse", password_hash, *SCENARIOS[mode](i))
+        except HTTPException:
+            return False
+        return valid
+
+    login = inline_login if mode == "inline" else pooled_login
+    probe = LoopLagProbe()
+    probe.start()
+    stop = asyncio.Event()
+    pings = asyncio.create_task(health_pings(stop))
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    results = await asyncio.gather(*[login(i) for i in range(logins)])
+    elapsed = loop.time() - start
+    stop.set()
+    health = await pings
+    lag = await probe.stop()
+    hasher.shutdown()
+    print(f"{mode}: logins={logins} ok={sum(results)} rejected={hasher.rejected} queued={hasher.queued} wall={elapsed:.2f}s")
+    print("  health latency:", format_ms(summarize(health)))
+    print("  event-loop lag:", format_ms(lag))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=100)
+    args = parser.parse_args()
+    password_hash = pwd_context.hash("correct horse")
+    for mode in ("inline", *SCENARIOS):
+        asyncio.run(run(mode, args.logins, password_hash))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import copy
+import time
+
+from benchmarks.common import offline_env
+
+offline_env()
+
+from backend.langchain_pipeline import reactflow_to_workflowdetail  # noqa: E402
+from backend.orgview_service import OrgViewService  # noqa: E402
+from benchmarks.synthetic import synthetic_deep_reactflow, synthetic_reactflow  # noqa: E402
+
+# Measures the CPU side of /orgview/patch on large diagrams: rebuilding the
+# workflow from React Flow JSON (node list shuffled, so sibling order comes
+# from the edges) and merging it into the stored workflow.
+
+
+def best_of(repeat, fn):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--depth", type=int, default=5000, help="nesting depth for the deep-chain case")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    service = OrgViewService()
+    for n in args.nodes:
+        graph = synthetic_reactflow(nodes=n, seed=args.seed)
+        ordered = reactflow_to_workflowdetail(**synthetic_reactflow(nodes=n, seed=args.seed, shuffle=False))
+        issues = []
+        elapsed, reconstructed = best_of(args.repeat, lambda: reactflow_to_workflowdetail(graph["nodes"], graph["edges"], issues))
+        assert reconstructed == ordered and not issues, "shuffled node order changed the reconstruction"
+        patch_elapsed, _ = best_of(args.repeat, lambda: service.patch_workflow_detail(ordered, copy.deepcopy(reconstructed)))
+        per_node = elapsed / n * 1e6
+        print(f"nodes={n:>6} edges={len(graph['edges']):>6}: reconstruct={elapsed * 1000:8.1f}ms ({per_node:.2f}us/node) patch={patch_elapsed * 1000:8.1f}ms")
+    deep = synthetic_deep_reactflow(args.depth)
+    elapsed, _ = best_of(args.repeat, lambda: reactflow_to_workflowdetail(deep["nodes"], deep["edges"]))
+    print(f"nested depth={args.depth}: reconstruct={elapsed * 1000:.1f}ms")
+    cyclic = synthetic_reactflow(nodes=1000, seed=args.seed)
+    cyclic["edges"].append({"id": "back", "source": cyclic["edges"][-1]["target"], "target": cyclic["edges"][0]["source"]})
+    issues = []
+    reactflow_to_workflowdetail(cyclic["nodes"], cyclic["edges"], issues)
+    print("cycle issues:", [issue["type"] for issue in issues])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import offline_env, format_ms, summarize
+
+offline_env()
+
+import backend.similarity as similarity  # noqa: E402
+from backend.llm_gateway import llm_gateway  # noqa: E402
+from backend.orgview_service import OrgViewService  # noqa: E402
+from benchmarks.fake_model import FakeChatModel, install_fake_model  # noqa: E402
+from benchmarks.fake_mongo import FakeDatabase, install_fake_db  # noqa: E402
+
+# 1. Query latency of the MinHash index at a few sizes (one user owning 1% of
+#    the rows, so the per-user scope mask is exercised as well).
+# 2. A stream of generation requests in which some are repeats of earlier ones
+#    with trivial edits (case, punctuation, filler words), some are new
+#    processes in an already seen department and some are unrelated, run once
+#    with the index disabled and once enabled, counting fake model calls.
+
+DEPARTMENTS = ["Sales", "Finance", "Support", "Operations", "HR", "Legal", "Marketing", "IT"]
+VERBS = ["review", "approve", "reconcile", "escalate", "schedule", "invoice", "onboard", "audit", "triage", "report"]
+OBJECTS = ["leads", "contracts", "tickets", "expenses", "vendors", "campaigns", "hires", "licenses", "orders", "refunds"]
+
+
+def random_context(rng, department=None):
+    words = []
+    for _ in range(rng.randint(4, 8)):
+        words += [rng.choice(VERBS), rng.choice(OBJECTS)]
+    return {
+        "department_function": department or rng.choice(DEPARTMENTS),
+        "team_size": str(rng.randint(2, 50)),
+        "budget": f"${rng.randint(1, 100)}k",
+        "description": "We " + " and ".join(" ".join(words[i:i + 2]) for i in range(0, len(words), 2)),
+    }
+
+
+def trivial_edit(context, rng):
+    edited = dict(context)
+    edit = rng.choice(["upper", "punctuation", "filler"])
+    if edit == "upper":
+        edited["description"] = edited["description"].upper()
+    elif edit == "punctuation":
+        edited["description"] = edited["description"].replace(" and ", ", and ") + "."
+    else:
+        edited["description"] = "In our team, " + edited["description"].lower() + " for the company"
+    return edited
+
+
+def bench_queries(sizes, queries, seed):
+    rng = random.Random(seed)
+    for size in sizes:
+        index = similarity.SimilarityIndex(directory="/tmp/bench-similarity-unused")
+        users = [f"user-{i}" for i in range(100)]
+        for i in range(size):
+            context = random_context(rng)
+            index.upsert(f"{i:024x}", rng.choice(users), context, None)
+        durations = []
+        for _ in range(queries):
+            start = time.perf_counter()
+            index.query(users[0], random_context(rng))
+            durations.append(time.perf_counter() - start)
+        print(f"query over {size:>6} entries: {format_ms(summarize(durations))}")
+
+
+def request_stream(count, rng):
+    seen = []
+    stream = []
+    for _ in range(count):
+        roll = rng.random()
+        if seen and roll < 0.3:
+            stream.append(("repeat", trivial_edit(rng.choice(seen), rng)))
+        else:
+            kind = "related" if seen and roll < 0.6 else "new"
+            department = rng.choice(seen)["department_function"] if kind == "related" else None
+            context = random_context(rng, department)
+            seen.append(context)
+            stream.append((kind, context))
+    return stream
+
+
+async def bench_generation(args, enabled):
+    similarity.SIMILARITY_ENABLED = enabled
+    similarity.similarity_index = similarity.SimilarityIndex(directory="/tmp/bench-similarity-unused")
+    # orgview_service imported the index by name
+    import backend.orgview_service as orgview_service
+    orgview_service.similarity_index = similarity.similarity_index
+    fake = install_fake_model(FakeChatModel(latency=lambda: args.llm_latency, seed=args.seed))
+    llm_gateway.tokens_per_minute = 0
+    service = OrgViewService()
+    stream = request_stream(args.requests, random.Random(args.seed))
+    kinds = {}
+    start = time.perf_counter()
+    for kind, context in stream:
+        view = await service.build_org_view_coalesced(images=[], pdfs=[], user_id="bench-user", **context)
+        await service.save_org_view("bench-user", view)
+        outcome = "reused" if view.get("reused_from") else "generated"
+        kinds[(kind, outcome)] = kinds.get((kind, outcome), 0) + 1
+    elapsed = time.perf_counter() - start
+    label = "enabled " if enabled else "disabled"
+    print(f"index {label}: {elapsed:.2f}s for {len(stream)} requests, llm_calls={fake.calls}")
+    if enabled:
+        print("  " + ", ".join(f"{kind}/{outcome}={n}" for (kind, outcome), n in sorted(kinds.items())))
+        print(f"  {similarity.similarity_index.stats()}")
+    return fake.calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--llm-latency", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    bench_queries([int(s) for s in args.sizes.split(",")], args.queries, args.seed)
+    # Both runs share one store; the second index only knows what it indexes itself
+    install_fake_db(FakeDatabase())
+    without = asyncio.run(bench_generation(args, enabled=False))
+    with_index = asyncio.run(bench_generation(args, enabled=True))
+    print(f"llm calls avoided: {without - with_index} of {without} ({(without - with_index) / max(1, without):.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Cold-start cost of one API worker: time to import backend.main, RSS after the
+# import, time until /ready answers 200 (startup plus warm-up, against the
+# in-memory Mongo stand-in) and RSS after that. Each sample is a fresh interpreter:
+#
+#   python -m benchmarks.bench_startup --runs 5
+
+HEAVY_MODULES = ("langchain", "langchain_google_genai", "google.genai", "motor", "pymongo", "numpy", "fitz", "PIL")
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def child():
+    from benchmarks.common import offline_env
+    offline_env()
+    import asyncio
+    base_rss = _rss_mb()
+    start = time.perf_counter()
+    from backend.main import app
+    import_seconds = time.perf_counter() - start
+    import_rss = _rss_mb()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    async def startup():
+        import httpx
+        from benchmarks.fake_mongo import FakeDatabase, install_fake_db
+        install_fake_db(FakeDatabase())
+        start = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://startup") as client:
+                # Trees without a readiness endpoint are ready once startup returns
+                while (await client.get("/ready")).status_code not in (200, 404):
+                    await asyncio.sleep(0.005)
+            elapsed = time.perf_counter() - start
+            ready_rss = _rss_mb()
+        return elapsed, ready_rss
+
+    startup_seconds, ready_rss = asyncio.run(startup())
+    print(json.dumps({
+        "import_s": import_seconds,
+        "ready_s": startup_seconds,
+        "base_rss_mb": base_rss,
+        "import_rss_mb": import_rss,
+        "ready_rss_mb": ready_rss,
+        "loaded_at_import": loaded,
+        "loaded_when_ready": [name for name in HEAVY_MODULES if name in sys.modules],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+    samples = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    for key in ("import_s", "ready_s"):
+        values = [s[key] for s in samples]
+        print(f"{key:<14} median={statistics.median(values) * 1000:7.1f}ms min={min(values) * 1000:7.1f}ms")
+    for key in ("import_rss_mb", "ready_rss_mb"):
+        values = [s[key] for s in samples]
+        print(f"{key:<14} median={statistics.median(values):7.1f}MB")
+    print("heavy modules loaded at import:", ", ".join(samples[-1]["loaded_at_import"]) or "none")
+    print("heavy modules loaded when ready:", ", ".join(samples[-1]["loaded_when_ready"]) or "none")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import random
+
+from benchmarks.common import format_ms, offline_env, summarize, timed
+
+offline_env()
+
+import backend.langchain_pipeline as pipeline  # noqa: E402
+from backend.llm_gateway import llm_gateway  # noqa: E402
+from backend.llm_resilience import ResilientInvoker  # noqa: E402
+from benchmarks.fake_model import FakeChatModel, install_fake_model, latency_distribution  # noqa: E402
+
+# Compares LLM call latency percentiles with and without hedging/retries
+# against a fake model with a configurable latency distribution.
+
+
+async def run(label, invoker, args):
+    rng = random.Random(args.seed)
+    fake = install_fake_model(FakeChatModel(
+        latency=latency_distribution(args.distribution, args.mean, rng=rng, sigma=args.sigma, p_slow=args.p_slow),
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    ))
+    pipeline.resilient_llm = invoker
+    # Thousands of back-to-back calls would otherwise be paced by the tokens-per-minute budget
+    llm_gateway.tokens_per_minute = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            try:
+                return await timed(pipeline.invoke_model(f"prompt {i}", stage="detail"))
+            except Exception:
+                failures += 1
+                return None
+
+    results = [r for r in await asyncio.gather(*[one(i) for i in range(args.requests)]) if r]
+    print(f"{label}: calls={fake.calls} failures={failures} {invoker.stats()}")
+    print("  latency:", format_ms(summarize([elapsed for elapsed, _ in results])))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--distribution", default="bimodal",
+                        choices=["constant", "exponential", "lognormal", "pareto", "bimodal"])
+    parser.add_argument("--mean", type=float, default=0.02, help="base latency in seconds")
+    parser.add_argument("--sigma", type=float, default=0.5)
+    parser.add_argument("--p-slow", type=float, default=0.03)
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run("baseline (no retries, no hedging)", ResilientInvoker(hedging=False, max_retries=0), args))
+    asyncio.run(run("retries only", ResilientInvoker(hedging=False), args))
+    asyncio.run(run("retries + hedging", ResilientInvoker(hedging=True), args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import time
+
+# Shared helpers for the offline benchmarks. Run them from the repo root,
+# e.g. `python -m benchmarks.bench_generate_concurrency`.
+
+
+def offline_env():
+    # The live model client (created lazily, or at warm-up) wants a key
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    # Measure the pipeline itself, not replays from the response cache
+    os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "n": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def format_ms(stats):
+    return " ".join(
+        f"{k}={v * 1000:.1f}ms" if k != "n" else f"n={v}" for k, v in stats.items()
+    )
+
+
+class LoopLagProbe:
+    # Measures how late a periodic sleep wakes up; blocking work on the loop shows up as lag
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return summarize(self.samples)
+
+
+async def timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return time.perf_counter() - start, result
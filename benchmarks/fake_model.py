@@ -0,0 +1,148 @@
+import asyncio
+import json
+import math
+import random
+import time
+
+# Offline stand-in for the Gemini chat model used by backend.langchain_pipeline.
+# Answers each pipeline prompt with plausible JSON after a simulated latency.
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeTransientError(ConnectionError):
+    pass
+
+
+def latency_distribution(name="lognormal", mean=0.5, rng=None, **params):
+    # Returns a callable producing one latency sample in seconds.
+    #   constant     always `mean`
+    #   exponential  memoryless, mean `mean`
+    #   lognormal    median `mean`, spread `sigma` (default 0.5)
+    #   pareto       heavy tail with shape `alpha` (default 2.5), scaled so the minimum is mean/2
+    #   bimodal      `mean` most of the time, `slow` seconds with probability `p_slow`
+    rng = rng or random.Random(params.pop("seed", None))
+    if name == "constant":
+        return lambda: mean
+    if name == "exponential":
+        return lambda: rng.expovariate(1 / mean)
+    if name == "lognormal":
+        sigma = params.get("sigma", 0.5)
+        return lambda: rng.lognormvariate(math.log(mean), sigma)
+    if name == "pareto":
+        alpha = params.get("alpha", 2.5)
+        return lambda: (mean / 2) * rng.paretovariate(alpha)
+    if name == "bimodal":
+        p_slow = params.get("p_slow", 0.05)
+        slow = params.get("slow", mean * 20)
+        return lambda: slow if rng.random() < p_slow else mean
+    raise ValueError(f"Unknown latency distribution: {name}")
+
+
+def _size(value):
+    return max(1, int(value())) if callable(value) else value
+
+
+def _fake_detail(rng, steps, substeps):
+    steps, substeps = _size(steps), _size(substeps)
+    actors = [f"Actor {i}" for i in range(max(2, steps // 3))]
+    return {
+        "name": "Fake Workflow",
+        "actors": actors,
+        "steps": [
+            {
+                "actor": rng.choice(actors),
+                "action": f"Step {i}",
+                "substeps": [
+                    {"actor": rng.choice(actors), "action": f"Step {i}.{j}"}
+                    for j in range(rng.randint(0, substeps))
+                ] or None,
+            }
+            for i in range(steps)
+        ],
+    }
+
+
+def _fake_compact(rng, steps):
+    steps = _size(steps)
+    types = ["notion", "hubspot", "googleSheets", "gmail", "slack", "chatgpt", "default"]
+    return {
+        "name": "Fake AI Workflow",
+        "actors": ["AI", "Ops"],
+        "steps": [
+            {"actor": rng.choice(["AI", "Ops"]), "action": f"Automated step {i}", "type": rng.choice(types)}
+            for i in range(steps)
+        ],
+    }
+
+
+class FakeChatModel:
+    def __init__(self, latency=None, steps=8, substeps=3, seed=None, failure_rate=0.0):
+        # latency: callable returning seconds for one call (see latency_distribution)
+        # steps/substeps: ints, or callables sampled per response for varying output sizes
+        # failure_rate: probability that a call raises a transient connection error
+        self.latency = latency or (lambda: 0.5)
+        self.steps = steps
+        self.substeps = substeps
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def _maybe_fail(self):
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            raise FakeTransientError("fake provider connection reset")
+
+    def _respond(self, prompt_input):
+        text = prompt_input if isinstance(prompt_input, str) else " ".join(
+            p for p in prompt_input if isinstance(p, str)
+        )
+        if "project name" in text:
+            body = {"name": "Fake Project", "description": "A generated project."}
+        elif "summarize the overall process" in text:
+            body = {"name": "Fake Workflow", "description": "A generated workflow."}
+        else:
+            body = _fake_detail(self.rng, self.steps, self.substeps)
+        return json.dumps(body)
+
+    async def ainvoke(self, prompt_input, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency())
+        self._maybe_fail()
+        return FakeMessage(self._respond(prompt_input))
+
+    def invoke(self, prompt_input, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency())
+        self._maybe_fail()
+        return FakeMessage(self._respond(prompt_input))
+
+    def with_structured_output(self, schema, **kwargs):
+        return _FakeStructuredModel(self, schema)
+
+
+class _FakeStructuredModel:
+    def __init__(self, parent, schema):
+        self.parent = parent
+        self.schema = schema
+
+    async def ainvoke(self, prompt_input, **kwargs):
+        self.parent.calls += 1
+        await asyncio.sleep(self.parent.latency())
+        self.parent._maybe_fail()
+        return self.schema(**_fake_compact(self.parent.rng, self.parent.steps))
+
+    def invoke(self, prompt_input, **kwargs):
+        self.parent.calls += 1
+        time.sleep(self.parent.latency())
+        self.parent._maybe_fail()
+        return self.schema(**_fake_compact(self.parent.rng, self.parent.steps))
+
+
+def install_fake_model(fake):
+    # Replace the live model everywhere the pipeline looks it up
+    import backend.langchain_pipeline as pipeline
+    pipeline._model = fake
+    return fake
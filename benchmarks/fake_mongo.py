@@ -0,0 +1,559 @@
+import asyncio
+import copy
+import sys
+from collections import namedtuple
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+# In-memory stand-in for the motor database used by the backend. Covers the
+# query/update operators the backend actually uses ($set, $unset, $inc, $push,
+# $exists, $in, $or, comparisons, dotted paths, sort/limit/projection,
+# find_one_and_update, insert_many/bulk_write, unique indexes, and aggregate with
+# $match/$unwind/$group/$sort/$limit). Documents are deep-copied in and out,
+# like a round trip through BSON. An optional per-operation latency simulates
+# a network hop.
+
+InsertOneResult = namedtuple("InsertOneResult", "inserted_id")
+InsertManyResult = namedtuple("InsertManyResult", "inserted_ids")
+UpdateResult = namedtuple("UpdateResult", "matched_count modified_count upserted_id")
+DeleteResult = namedtuple("DeleteResult", "deleted_count")
+BulkWriteResult = namedtuple("BulkWriteResult", "matched_count modified_count upserted_count")
+
+_MISSING = object()
+
+
+def _get_path(doc, path):
+    values = [doc]
+    for token in path.split("."):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict):
+                if token in value:
+                    next_values.append(value[token])
+            elif isinstance(value, list):
+                if token.isdigit() and int(token) < len(value):
+                    next_values.append(value[int(token)])
+                else:
+                    # Implicit traversal into array elements
+                    next_values.extend(v[token] for v in value if isinstance(v, dict) and token in v)
+        values = next_values
+    return values
+
+
+def _candidates(values):
+    # A field matches if it, or (for arrays) any element, matches
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            yield from value
+
+
+def _compare(op, left, right):
+    try:
+        if op == "$gt":
+            return left > right
+        if op == "$gte":
+            return left >= right
+        if op == "$lt":
+            return left < right
+        if op == "$lte":
+            return left <= right
+    except TypeError:
+        return False
+    raise ValueError(op)
+
+
+def _match_condition(values, condition):
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        for op, arg in condition.items():
+            if op == "$exists":
+                if bool(values) != bool(arg):
+                    return False
+            elif op == "$in":
+                if not any(v in arg for v in _candidates(values)) and not (None in arg and not values):
+                    return False
+            elif op == "$nin":
+                if any(v in arg for v in _candidates(values)):
+                    return False
+            elif op == "$ne":
+                if any(v == arg for v in _candidates(values)):
+                    return False
+            elif op == "$eq":
+                if not any(v == arg for v in _candidates(values)):
+                    return False
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                if not any(_compare(op, v, arg) for v in _candidates(values) if v is not None or arg is None):
+                    return False
+            else:
+                raise NotImplementedError(f"fake mongo: unsupported operator {op}")
+        return True
+    if condition is None:
+        return not values or any(v is None for v in values)
+    return any(v == condition for v in _candidates(values))
+
+
+def matches(doc, query):
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif not _match_condition(_get_path(doc, key), condition):
+            return False
+    return True
+
+
+def _parent(doc, path, create=True):
+    tokens = path.split(".")
+    container = doc
+    for token in tokens[:-1]:
+        if isinstance(container, list):
+            container = container[int(token)]
+        else:
+            if token not in container or container[token] is None:
+                if not create:
+                    return None, tokens[-1]
+                container[token] = {}
+            container = container[token]
+    return container, tokens[-1]
+
+
+def _set(doc, path, value):
+    container, key = _parent(doc, path)
+    if isinstance(container, list):
+        container[int(key)] = value
+    else:
+        container[key] = value
+
+
+def apply_update(doc, update, inserting=False):
+    if not any(k.startswith("$") for k in update):
+        # Replacement document
+        _id = doc.get("_id")
+        doc.clear()
+        doc.update(copy.deepcopy(update))
+        if _id is not None:
+            doc["_id"] = _id
+        return
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set(doc, path, copy.deepcopy(value))
+            elif op == "$setOnInsert":
+                continue
+            elif op == "$unset":
+                container, key = _parent(doc, path, create=False)
+                if isinstance(container, dict):
+                    container.pop(key, None)
+            elif op == "$inc":
+                container, key = _parent(doc, path)
+                container[key] = container.get(key, 0) + value
+            elif op == "$push":
+                container, key = _parent(doc, path)
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                container.setdefault(key, []).extend(copy.deepcopy(items))
+            elif op == "$addToSet":
+                container, key = _parent(doc, path)
+                items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                existing = container.setdefault(key, [])
+                existing.extend(copy.deepcopy(i) for i in items if i not in existing)
+            elif op == "$max":
+                container, key = _parent(doc, path)
+                if key not in container or container[key] < value:
+                    container[key] = value
+            elif op == "$min":
+                container, key = _parent(doc, path)
+                if key not in container or container[key] > value:
+                    container[key] = value
+            else:
+                raise NotImplementedError(f"fake mongo: unsupported update operator {op}")
+
+
+def project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        out = {}
+        for path in include:
+            values = _get_path(doc, path)
+            if values:
+                _set(out, path, copy.deepcopy(values[0]))
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    out = copy.deepcopy(doc)
+    for path, flag in projection.items():
+        if not flag:
+            container, key = _parent(out, path, create=False)
+            if isinstance(container, dict):
+                container.pop(key, None)
+    return out
+
+
+def _sort_key(value):
+    # Mongo orders null/missing before numbers, strings, ObjectIds and dates
+    values = value if isinstance(value, list) else [value]
+    value = values[0] if values else None
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    if isinstance(value, ObjectId):
+        return (3, value.binary)
+    return (4, value)
+
+
+def _normalize_sort(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    return list(key_or_list)
+
+
+def sort_documents(docs, spec):
+    for key, direction in reversed(spec):
+        docs.sort(key=lambda d: _sort_key((_get_path(d, key) or [None])[0]), reverse=direction < 0)
+    return docs
+
+
+class FakeCursor:
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def _materialize(self):
+        docs = [d for d in self._collection._docs.values() if matches(d, self._query)]
+        if self._sort:
+            sort_documents(docs, self._sort)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [project(d, self._projection) for d in docs]
+
+    async def to_list(self, length=None):
+        await self._collection._db._tick()
+        docs = self._materialize()
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._results is None:
+            await self._collection._db._tick()
+            self._results = iter(self._materialize())
+        try:
+            return next(self._results)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def _evaluate(expr, doc):
+    # The aggregation expressions the backend uses: field paths, $size, $ifNull, literals
+    if isinstance(expr, str) and expr.startswith("$"):
+        values = _get_path(doc, expr[1:])
+        return values[0] if values else None
+    if isinstance(expr, dict):
+        if "$size" in expr:
+            return len(_evaluate(expr["$size"], doc))
+        if "$ifNull" in expr:
+            for option in expr["$ifNull"]:
+                value = _evaluate(option, doc)
+                if value is not None:
+                    return value
+            return None
+        if any(k.startswith("$") for k in expr):
+            raise NotImplementedError(f"fake mongo: unsupported expression {list(expr)}")
+        return {k: _evaluate(v, doc) for k, v in expr.items()}
+    return expr
+
+
+def _unwind(docs, path):
+    path = path[1:]
+    for doc in docs:
+        values = _get_path(doc, path)
+        if not values or not isinstance(values[0], list):
+            continue
+        keys = path.split(".")
+        for element in values[0]:
+            # Copy only the dicts along the path; stages never modify their input
+            unwound = dict(doc)
+            container = unwound
+            for key in keys[:-1]:
+                container[key] = dict(container[key])
+                container = container[key]
+            container[keys[-1]] = element
+            yield unwound
+
+
+def _group(docs, spec):
+    groups = {}
+    for doc in docs:
+        key = _evaluate(spec["_id"], doc)
+        group = groups.setdefault(repr(key), {"_id": key})
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, arg), = accumulator.items()
+            value = _evaluate(arg, doc)
+            if op == "$sum":
+                group[field] = group.get(field, 0) + (value if isinstance(value, (int, float)) else 0)
+            elif op in ("$max", "$min"):
+                if value is not None and (field not in group or (value > group[field]) == (op == "$max")):
+                    group[field] = value
+            else:
+                raise NotImplementedError(f"fake mongo: unsupported accumulator {op}")
+    return list(groups.values())
+
+
+def run_pipeline(docs, pipeline):
+    docs = list(docs)
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            docs = [d for d in docs if matches(d, spec)]
+        elif name == "$unwind":
+            docs = list(_unwind(docs, spec))
+        elif name == "$group":
+            docs = _group(docs, spec)
+        elif name == "$sort":
+            docs = sort_documents(docs, list(spec.items()))
+        elif name == "$limit":
+            docs = docs[:spec]
+        else:
+            raise NotImplementedError(f"fake mongo: unsupported pipeline stage {name}")
+    return copy.deepcopy(docs)
+
+
+class FakeAggregateCursor:
+    def __init__(self, collection, pipeline):
+        self._collection = collection
+        self._pipeline = pipeline
+        self._results = None
+
+    async def to_list(self, length=None):
+        await self._collection._db._tick()
+        docs = run_pipeline(self._collection._docs.values(), self._pipeline)
+        return docs if length is None else docs[:length]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._results is None:
+            await self._collection._db._tick()
+            self._results = iter(run_pipeline(self._collection._docs.values(), self._pipeline))
+        try:
+            return next(self._results)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self._db = db
+        self.name = name
+        self._docs = {}
+        self._unique = []
+
+    def _check_unique(self, doc, ignore_id=None):
+        for fields in self._unique:
+            key = tuple(repr(_get_path(doc, f)) for f in fields)
+            for other in self._docs.values():
+                if other["_id"] != ignore_id and other["_id"] != doc.get("_id") and tuple(repr(_get_path(other, f)) for f in fields) == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {fields}")
+
+    async def create_index(self, keys, unique=False, **kwargs):
+        fields = [keys] if isinstance(keys, str) else [k for k, _ in keys]
+        if unique and fields not in self._unique:
+            self._unique.append(fields)
+        return "_".join(fields)
+
+    async def insert_one(self, document):
+        await self._db._tick()
+        return self._insert(document)
+
+    def _insert(self, document):
+        if "_id" not in document:
+            # Like pymongo, the generated id is written back into the caller's dict
+            document["_id"] = ObjectId()
+        if document["_id"] in self._docs:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_")
+        doc = copy.deepcopy(document)
+        self._check_unique(doc)
+        self._docs[doc["_id"]] = doc
+        return InsertOneResult(doc["_id"])
+
+    async def insert_many(self, documents, ordered=True):
+        # One round trip for the whole batch, like the real driver
+        await self._db._tick()
+        return InsertManyResult([self._insert(document).inserted_id for document in documents])
+
+    async def bulk_write(self, requests, ordered=True):
+        # UpdateOne requests only; pymongo keeps their arguments in private attributes
+        await self._db._tick()
+        matched = modified = upserted = 0
+        for request in requests:
+            doc = self._first(request._filter)
+            if doc is None:
+                if request._upsert:
+                    self._upsert_doc(request._filter, request._doc)
+                    upserted += 1
+                continue
+            before = copy.deepcopy(doc)
+            apply_update(doc, request._doc)
+            matched += 1
+            modified += int(before != doc)
+        return BulkWriteResult(matched, modified, upserted)
+
+    async def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        projection = projection or kwargs.get("projection")
+        cursor = FakeCursor(self, filter or {}, projection).limit(1)
+        if sort:
+            cursor.sort(sort)
+        docs = await cursor.to_list(1)
+        return docs[0] if docs else None
+
+    def find(self, filter=None, projection=None, **kwargs):
+        return FakeCursor(self, filter or {}, projection or kwargs.get("projection"))
+
+    def aggregate(self, pipeline, **kwargs):
+        return FakeAggregateCursor(self, pipeline)
+
+    def _first(self, filter, sort=None):
+        _id = (filter or {}).get("_id")
+        if _id is not None and not isinstance(_id, dict):
+            # Exact _id lookups go through the _id index in Mongo too
+            doc = self._docs.get(_id)
+            return doc if doc is not None and matches(doc, filter) else None
+        docs = [d for d in self._docs.values() if matches(d, filter)]
+        if sort:
+            sort_documents(docs, _normalize_sort(sort))
+        return docs[0] if docs else None
+
+    def _upsert_doc(self, filter, update):
+        doc = {k: copy.deepcopy(v) for k, v in filter.items() if not k.startswith("$") and not isinstance(v, dict)}
+        apply_update(doc, update, inserting=True)
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        self._docs[doc["_id"]] = doc
+        return doc
+
+    async def update_one(self, filter, update, upsert=False, **kwargs):
+        await self._db._tick()
+        doc = self._first(filter)
+        if doc is None:
+            if upsert:
+                return UpdateResult(0, 0, self._upsert_doc(filter, update)["_id"])
+            return UpdateResult(0, 0, None)
+        before = copy.deepcopy(doc)
+        apply_update(doc, update)
+        return UpdateResult(1, int(before != doc), None)
+
+    async def update_many(self, filter, update, upsert=False, **kwargs):
+        await self._db._tick()
+        docs = [d for d in self._docs.values() if matches(d, filter)]
+        if not docs and upsert:
+            return UpdateResult(0, 0, self._upsert_doc(filter, update)["_id"])
+        for doc in docs:
+            apply_update(doc, update)
+        return UpdateResult(len(docs), len(docs), None)
+
+    async def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        return await self.update_one(filter, replacement, upsert=upsert)
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False, return_document=False, **kwargs):
+        await self._db._tick()
+        doc = self._first(filter, sort)
+        if doc is None:
+            if not upsert:
+                return None
+            doc = self._upsert_doc(filter, update)
+            return project(doc, projection) if return_document else None
+        before = project(doc, projection)
+        apply_update(doc, update)
+        # pymongo's ReturnDocument.AFTER is True
+        return project(doc, projection) if return_document else before
+
+    async def delete_one(self, filter):
+        await self._db._tick()
+        doc = self._first(filter)
+        if doc is None:
+            return DeleteResult(0)
+        del self._docs[doc["_id"]]
+        return DeleteResult(1)
+
+    async def delete_many(self, filter):
+        await self._db._tick()
+        ids = [d["_id"] for d in self._docs.values() if matches(d, filter)]
+        for _id in ids:
+            del self._docs[_id]
+        return DeleteResult(len(ids))
+
+    async def count_documents(self, filter):
+        await self._db._tick()
+        return sum(1 for d in self._docs.values() if matches(d, filter))
+
+    async def estimated_document_count(self):
+        return len(self._docs)
+
+
+class FakeDatabase:
+    def __init__(self, latency=0.0):
+        # latency: seconds added to every operation (a local mongod round trip is ~0.2ms)
+        self.latency = latency
+        self._collections = {}
+        self.operations = 0
+
+    async def _tick(self):
+        self.operations += 1
+        await asyncio.sleep(self.latency)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self, name)
+        return self._collections[name]
+
+    async def command(self, name, *args, **kwargs):
+        await self._tick()
+        if name == "ping":
+            return {"ok": 1.0}
+        raise NotImplementedError(f"fake mongo: unsupported command {name}")
+
+
+def install_fake_db(fake=None):
+    # Swap the motor database for the stand-in in every backend module that imported it
+    import backend.db
+    fake = fake or FakeDatabase()
+    original = backend.db.db
+    for name, module in list(sys.modules.items()):
+        if name.startswith("backend") and getattr(module, "db", None) is original:
+            module.db = fake
+    return fake
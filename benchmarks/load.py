@@ -0,0 +1,294 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import resource
+import time
+import tracemalloc
+
+from benchmarks.common import offline_env, summarize
+
+offline_env()
+
+import httpx  # noqa: E402
+
+from backend.ai_cache import integration_node_list, workflow_hash  # noqa: E402
+from backend.db import ensure_indexes  # noqa: E402
+from backend.langchain_pipeline import CompactWorkflow, WorkflowDetail, workflowdetail_to_reactflow  # noqa: E402
+from backend.llm_gateway import llm_gateway  # noqa: E402
+from backend.main import app  # noqa: E402
+from backend.orgview_service import OrgViewService  # noqa: E402
+from benchmarks.fake_model import FakeChatModel, _fake_compact, install_fake_model, latency_distribution  # noqa: E402
+from benchmarks.fake_mongo import FakeDatabase, install_fake_db  # noqa: E402
+from benchmarks.synthetic import synthetic_workflow  # noqa: E402
+
+# End-to-end load scenarios against the FastAPI app, served in-process by
+# uvicorn (or called directly through the ASGI transport with --transport asgi,
+# where background tasks delay the response), with the fake chat model and the
+# in-memory Mongo stand-in:
+#
+#   python -m benchmarks.load                          # all scenarios
+#   python -m benchmarks.load --scenario patch retrieve --requests 500
+#   python -m benchmarks.load --save baseline.json     # then, after a change:
+#   python -m benchmarks.load --baseline baseline.json
+#
+# Reports throughput, p50/p95/p99 latency, RSS and (with --tracemalloc) peak
+# Python allocations per scenario. BCRYPT_ROUNDS affects the auth scenario.
+
+SCENARIOS = ("auth", "flows", "retrieve", "patch", "generate", "mixed")
+MIXED_WEIGHTS = {"flows": 30, "retrieve": 40, "patch": 15, "auth": 5, "generate": 10}
+
+PASSWORD = "correct horse battery"
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        # ru_maxrss is KiB on Linux; only the peak is available elsewhere
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LoadContext:
+    def __init__(self, client, args, rng):
+        self.client = client
+        self.args = args
+        self.rng = rng
+        self.users = []  # (email, token, [project ids])
+        self.graphs = {}  # project id -> last known react_flow_json
+        self.generated = 0
+
+    def user(self):
+        return self.rng.choice(self.users)
+
+    @staticmethod
+    def auth(token):
+        return {"Authorization": f"Bearer {token}"}
+
+
+async def seed(ctx: LoadContext):
+    service = OrgViewService()
+    for i in range(ctx.args.users):
+        email = f"load-user-{i}@example.com"
+        r = await ctx.client.post("/auth/register", data={"username": email, "password": PASSWORD})
+        r.raise_for_status()
+        token = r.json()["access_token"]
+        user_id = _user_id(token)
+        projects = []
+        for j in range(ctx.args.projects):
+            size = ctx.rng.choice(ctx.args.workflow_nodes)
+            workflow = synthetic_workflow(nodes=size, depth=ctx.args.workflow_depth, seed=i * 1000 + j)
+            react_flow_json = workflowdetail_to_reactflow(WorkflowDetail(**workflow))
+            ai_workflow_json = _fake_compact(ctx.rng, max(3, size // 10))
+            ai_react_flow_json = workflowdetail_to_reactflow(CompactWorkflow(**ai_workflow_json))
+            view = {
+                "project_name": f"Project {i}.{j}",
+                "project_desc": "Seeded by benchmarks.load",
+                "workflow_json": workflow,
+                "react_flow_json": react_flow_json,
+                "ai_workflow_json": ai_workflow_json,
+                "ai_react_flow_json": ai_react_flow_json,
+                "workflow_hash": workflow_hash(workflow),
+                "node_list": integration_node_list(ai_react_flow_json),
+            }
+            result = await service.save_org_view(user_id, view)
+            projects.append(result["project_id"])
+            ctx.graphs[result["project_id"]] = react_flow_json
+        ctx.users.append((email, token, projects))
+
+
+def _user_id(token):
+    import jwt
+    return jwt.decode(token, options={"verify_signature": False})["sub"]
+
+
+async def op_auth(ctx):
+    email, _, _ = ctx.user()
+    return await ctx.client.post("/auth/login", data={"username": email, "password": PASSWORD})
+
+
+async def op_flows(ctx):
+    _, token, _ = ctx.user()
+    return await ctx.client.get("/flows", headers=ctx.auth(token))
+
+
+async def op_retrieve(ctx):
+    _, token, projects = ctx.user()
+    return await ctx.client.get(f"/orgview/retrieve/{ctx.rng.choice(projects)}", headers=ctx.auth(token))
+
+
+async def op_patch(ctx):
+    _, token, projects = ctx.user()
+    project_id = ctx.rng.choice(projects)
+    graph = json.loads(json.dumps(ctx.graphs[project_id]))
+    if graph["nodes"]:
+        # A typical edit: rename one step and nudge another
+        node = ctx.rng.choice(graph["nodes"])
+        node["data"]["label"] = f"{node['data']['label'].split(' #')[0]} #{ctx.rng.randint(0, 999)}"
+        moved = ctx.rng.choice(graph["nodes"])
+        moved["position"] = {"x": moved["position"]["x"] + 10, "y": moved["position"]["y"]}
+    r = await ctx.client.post("/orgview/patch", json={"project_id": project_id, "react_flow_json": graph}, headers=ctx.auth(token))
+    if r.status_code == 200:
+        ctx.graphs[project_id] = graph
+    return r
+
+
+async def op_generate(ctx):
+    _, token, _ = ctx.user()
+    ctx.generated += 1
+    form = {
+        "department_function": ctx.rng.choice(["Sales", "Finance", "Support", "Operations"]),
+        "team_size": str(ctx.rng.randint(2, 50)),
+        "budget": f"${ctx.rng.randint(1, 100)}k",
+        # Distinct descriptions, so requests are not coalesced or served from cache
+        "description": f"Load test process {ctx.generated} {ctx.rng.random()}",
+    }
+    return await ctx.client.post("/orgview/generate", data=form, headers=ctx.auth(token))
+
+
+OPS = {"auth": op_auth, "flows": op_flows, "retrieve": op_retrieve, "patch": op_patch, "generate": op_generate}
+
+
+def _pick_mixed(rng):
+    names = list(MIXED_WEIGHTS)
+    return OPS[rng.choices(names, weights=[MIXED_WEIGHTS[n] for n in names])[0]]
+
+
+async def run_scenario(ctx: LoadContext, name: str, requests: int, concurrency: int) -> dict:
+    gc.collect()
+    if ctx.args.tracemalloc:
+        tracemalloc.start()
+    latencies = []
+    statuses = {}
+    counter = iter(range(requests))
+
+    async def worker():
+        for _ in counter:
+            op = _pick_mixed(ctx.rng) if name == "mixed" else OPS[name]
+            start = time.perf_counter()
+            try:
+                response = await op(ctx)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    wall = time.perf_counter() - start
+    result = {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "ok": sum(v for k, v in statuses.items() if isinstance(k, int) and k < 400),
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "throughput_rps": requests / wall if wall else 0.0,
+        "latency": summarize(latencies),
+        "rss_mb": rss_mb(),
+        "rss_growth_mb": rss_mb() - rss_before,
+    }
+    if ctx.args.tracemalloc:
+        result["peak_alloc_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+
+def report(result: dict, baseline: dict = None):
+    lat = result["latency"]
+    line = (
+        f"{result['scenario']:<9} n={result['requests']:<5} ok={result['ok']:<5} "
+        f"rps={result['throughput_rps']:8.1f} p50={lat['p50'] * 1000:7.1f}ms p95={lat['p95'] * 1000:7.1f}ms "
+        f"p99={lat['p99'] * 1000:7.1f}ms rss={result['rss_mb']:.0f}MB(+{result['rss_growth_mb']:.1f})"
+    )
+    if "peak_alloc_mb" in result:
+        line += f" peak_alloc={result['peak_alloc_mb']:.1f}MB"
+    print(line)
+    if result["ok"] != result["requests"]:
+        print(f"          statuses: {result['statuses']}")
+    if baseline:
+        base = baseline["latency"]
+
+        def delta(new, old):
+            return f"{(new - old) / old * 100:+.0f}%" if old else "n/a"
+        print(
+            f"          vs baseline: rps {delta(result['throughput_rps'], baseline['throughput_rps'])} "
+            f"p50 {delta(lat['p50'], base['p50'])} p95 {delta(lat['p95'], base['p95'])} p99 {delta(lat['p99'], base['p99'])}"
+        )
+
+
+async def main_async(args):
+    rng = random.Random(args.seed)
+    install_fake_db(FakeDatabase(latency=args.db_latency))
+    install_fake_model(FakeChatModel(
+        latency=latency_distribution(args.llm_distribution, args.llm_latency, rng=random.Random(args.seed)),
+        steps=lambda: rng.randint(4, args.llm_max_steps),
+        substeps=3,
+        seed=args.seed,
+    ))
+    # Thousands of fake calls would otherwise be paced by the tokens-per-minute budget
+    llm_gateway.tokens_per_minute = 0
+    await ensure_indexes()
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {r["scenario"]: r for r in json.load(f)}
+    server = None
+    if args.transport == "http":
+        import uvicorn
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning", lifespan="on"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        client_args = {"base_url": f"http://127.0.0.1:{args.port}", "limits": httpx.Limits(max_connections=args.concurrency)}
+    else:
+        client_args = {"transport": httpx.ASGITransport(app=app), "base_url": "http://load"}
+    async with httpx.AsyncClient(timeout=None, **client_args) as client:
+        ctx = LoadContext(client, args, rng)
+        start = time.perf_counter()
+        await seed(ctx)
+        print(f"seeded users={args.users} projects/user={args.projects} in {time.perf_counter() - start:.1f}s")
+        results = []
+        for name in args.scenario:
+            requests = args.generate_requests if name == "generate" else args.requests
+            result = await run_scenario(ctx, name, requests, args.concurrency)
+            report(result, baseline.get(name))
+            results.append(result)
+    if server is not None:
+        server.should_exit = True
+        await serving
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved results to {args.save}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--generate-requests", type=int, default=30)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--projects", type=int, default=5, help="seeded projects per user")
+    parser.add_argument("--workflow-nodes", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--workflow-depth", type=int, default=2)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="median/mean fake LLM latency in seconds")
+    parser.add_argument("--llm-distribution", default="lognormal")
+    parser.add_argument("--llm-max-steps", type=int, default=15)
+    parser.add_argument("--db-latency", type=float, default=0.0002)
+    parser.add_argument("--transport", choices=["http", "asgi"], default="http")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tracemalloc", action="store_true", help="also report peak Python allocations (slower)")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
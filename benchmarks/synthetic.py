@@ -0,0 +1,98 @@
+import random
+
+# Synthetic inputs for the offline benchmarks: nested workflows shaped like the
+# pipeline's WorkflowDetail output, and flat layered DAGs with random edges.
+
+
+def synthetic_workflow(nodes=1000, fanout=4, depth=2, seed=0):
+    # A WorkflowDetail-shaped dict with roughly `nodes` steps; each step gets up
+    # to `fanout` substeps, nested at most `depth` levels
+    rng = random.Random(seed)
+    actors = [f"Actor {i}" for i in range(8)]
+    remaining = [nodes]
+
+    def make_steps(level, prefix, limit):
+        steps = []
+        while remaining[0] > 0 and len(steps) < limit:
+            remaining[0] -= 1
+            path = f"{prefix}{len(steps)}"
+            step = {"actor": rng.choice(actors), "action": f"Step {path}"}
+            if level < depth and rng.random() < 0.5:
+                step["substeps"] = make_steps(level + 1, f"{path}.", rng.randint(1, fanout)) or None
+            steps.append(step)
+        return steps
+
+    return {
+        "name": "Synthetic Workflow",
+        "actors": actors,
+        "steps": make_steps(0, "", nodes),
+    }
+
+
+def synthetic_dag(nodes=1000, layers=50, edges_per_node=2, seed=0):
+    # React Flow JSON for a flat DAG: nodes spread over `layers`, each with up to
+    # `edges_per_node` edges into later layers
+    rng = random.Random(seed)
+    layer_of = sorted(rng.randrange(layers) for _ in range(nodes))
+    by_layer = {}
+    for i, layer in enumerate(layer_of):
+        by_layer.setdefault(layer, []).append(i)
+    node_list = [{"id": f"n{i}", "type": "default", "data": {"label": f"Node {i}"}} for i in range(nodes)]
+    edges = []
+    for i, layer in enumerate(layer_of):
+        for _ in range(edges_per_node):
+            later = rng.randint(layer + 1, min(layers - 1, layer + 3)) if layer < layers - 1 else None
+            if later is None or later not in by_layer:
+                continue
+            j = rng.choice(by_layer[later])
+            edges.append({"id": f"e{i}-{j}", "source": f"n{i}", "target": f"n{j}", "type": "default"})
+    return {"nodes": node_list, "edges": edges}
+
+
+def synthetic_reactflow(nodes=1000, fanout=4, depth=2, seed=0, shuffle=True):
+    # React Flow JSON in the shape workflowdetail_to_reactflow produces (parentNode
+    # nesting, chained siblings), optionally with the node list shuffled so sibling
+    # order can only be recovered from the edges
+    rng = random.Random(seed)
+    node_list = []
+    edges = []
+    last_child = {}
+
+    def add(parent, level):
+        node_id = f"n{len(node_list)}"
+        node = {"id": node_id, "type": "default", "data": {"label": f"Actor {len(node_list) % 8}: Step {len(node_list)}"}}
+        if parent:
+            node["parentNode"] = parent
+            node["extent"] = "parent"
+        node_list.append(node)
+        previous = last_child.get(parent, parent)
+        if previous:
+            edges.append({"id": f"e{previous}-{node_id}", "source": previous, "target": node_id, "type": "default"})
+        last_child[parent] = node_id
+        return node_id
+
+    pending = []
+    while len(node_list) < nodes:
+        if not pending:
+            pending.append((add(None, 0), 0))
+            continue
+        parent, level = pending.pop()
+        if level >= depth or rng.random() >= 0.5:
+            continue
+        for _ in range(rng.randint(1, fanout)):
+            if len(node_list) >= nodes:
+                break
+            pending.append((add(parent, level + 1), level + 1))
+    if shuffle:
+        rng.shuffle(node_list)
+    return {"nodes": node_list, "edges": edges}
+
+
+def synthetic_deep_reactflow(depth=5000):
+    # A single chain of nested groups, each step the only child of the previous one
+    node_list = [{"id": "n0", "type": "default", "data": {"label": "Step 0"}}]
+    edges = []
+    for i in range(1, depth):
+        node_list.append({"id": f"n{i}", "type": "default", "data": {"label": f"Step {i}"}, "parentNode": f"n{i - 1}", "extent": "parent"})
+        edges.append({"id": f"en{i - 1}-n{i}", "source": f"n{i - 1}", "target": f"n{i}", "type": "default"})
+    return {"nodes": node_list, "edges": edges}
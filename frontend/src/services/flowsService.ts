@@ -30,6 +30,17 @@ export interface AnalyticsData {
   monthlyLLMCalls: number;
   monthlyCost: string;
   costBenefit: string;
+  automatedSteps?: number;
+  manualSteps?: number;
+  integrationTypes?: Record<string, number>;
+  topActors?: Array<{ name: string; count: number }>;
+  graphSize?: {
+    nodes: number;
+    edges: number;
+    avgNodes: number;
+    maxNodes: number;
+  };
+  updatedAt?: string;
 }
 
 export interface FlowWorkflowData {
@@ -58,6 +69,8 @@ export interface FlowWorkflowData {
 export interface FlowApiResponse {
   react_flow_json: FlowWorkflowData;
   ai_react_flow_json: FlowWorkflowData;
+  ai_stale?: boolean;
+  revision?: number;
 }
 
 export interface IntegrationNode {
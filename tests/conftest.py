@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# Cheap hashes; set before any backend module builds its password context
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from benchmarks.fake_mongo import FakeDatabase
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    # A fresh in-memory Mongo stand-in in every backend module that uses `db`
+    import backend.db
+    fake = FakeDatabase()
+    original = backend.db.db
+    for name, module in list(sys.modules.items()):
+        if name.startswith("backend") and getattr(module, "db", None) is original:
+            monkeypatch.setattr(module, "db", fake)
+    return fake
@@ -0,0 +1,20 @@
+import asyncio
+
+from backend.orgview_service import generation_key
+
+CONTEXT = {"department_function": "Sales", "team_size": "5", "budget": "$10k", "description": "Qualify leads"}
+
+
+def key(context=CONTEXT, examples=""):
+    return asyncio.run(generation_key(context, [], [], examples))
+
+
+def test_whitespace_differences_share_a_key():
+    assert key() == key({**CONTEXT, "description": "  Qualify   leads "})
+
+
+def test_requests_seeded_with_different_examples_do_not_share_a_run():
+    # Examples are drawn from one user's private workflows
+    assert key(examples="Workflow: user A's process") != key(examples="Workflow: user B's process")
+    assert key(examples="Workflow: user A's process") != key()
+    assert key(examples="same") == key(examples="same")
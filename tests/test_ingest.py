@@ -0,0 +1,74 @@
+import asyncio
+import os
+import time
+
+import httpx
+from fastapi import FastAPI, File, UploadFile
+
+import backend.ingest as ingest
+from backend.ingest import UploadLimitMiddleware, collect_blobs
+
+BOUNDARY = "xyz"
+
+
+def multipart(size):
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.pdf\"\r\n"
+        f"Content-Type: application/pdf\r\n\r\n".encode() + b"x" * size + f"\r\n--{BOUNDARY}--\r\n".encode()
+    )
+
+
+def post(body, chunked):
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware, max_body_bytes=4096)
+    reached = []
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        reached.append(file.filename)
+        return {"size": len(await file.read())}
+
+    async def chunks():
+        for i in range(0, len(body), 512):
+            yield body[i:i + 512]
+
+    async def send():
+        content = chunks() if chunked else body
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            return await client.post("/upload", content=content, headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"})
+
+    return asyncio.run(send()), reached
+
+
+def test_body_within_limit_is_parsed():
+    for chunked in (False, True):
+        response, reached = post(multipart(1000), chunked)
+        assert response.status_code == 200 and response.json() == {"size": 1000}
+
+
+def test_oversized_body_is_rejected_before_the_endpoint():
+    for chunked in (False, True):
+        response, reached = post(multipart(10000), chunked)
+        assert response.status_code == 413 and not reached
+
+
+def test_expired_blobs_are_collected_unless_a_job_needs_them(fake_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "BLOB_DIR", str(tmp_path))
+    old = time.time() - 2 * 3600
+
+    def blob(char, mtime=None):
+        path = tmp_path / (char * 2) / (char * 64)
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"x")
+        if mtime:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    expired, fresh, queued, finished = blob("a", old), blob("b"), blob("c", old), blob("d", old)
+    leftover = tmp_path / ".upload-abc"
+    leftover.write_bytes(b"x")
+    os.utime(leftover, (old, old))
+    for status, char in (("queued", "c"), ("done", "d")):
+        asyncio.run(fake_db.jobs.insert_one({"status": status, "images": [], "pdfs": [{"sha256": char * 64}]}))
+    assert asyncio.run(collect_blobs(ttl=3600)) == 3
+    assert [p.exists() for p in (expired, fresh, queued, finished, leftover)] == [False, True, True, False, False]
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from backend.jobs import JOB_MAX_ATTEMPTS, JobWorkerPool, submit_job
+
+
+class BlockingService:
+    def __init__(self):
+        self.started = asyncio.Event()
+
+    async def build_org_view_coalesced(self, **kwargs):
+        self.started.set()
+        await asyncio.Event().wait()
+
+
+async def cancel_on_last_attempt(fake_db):
+    pool = JobWorkerPool(size=1)
+    pool.service = BlockingService()
+    job_id = await submit_job("u1", {"department_function": "Sales"}, [], [])
+    await fake_db.jobs.update_many({}, {"$set": {"attempts": JOB_MAX_ATTEMPTS - 1}})
+    job = await pool._claim()
+    assert job["attempts"] == JOB_MAX_ATTEMPTS
+    run = asyncio.create_task(pool._run(job))
+    await pool.service.started.wait()
+    run.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await run
+    return pool, await fake_db.jobs.find_one({})
+
+
+def test_cancelled_job_keeps_its_attempt_and_is_claimed_again(fake_db):
+    async def scenario():
+        pool, job = await cancel_on_last_attempt(fake_db)
+        assert job["status"] == "queued" and job["attempts"] == JOB_MAX_ATTEMPTS - 1
+        assert (await pool._claim())["_id"] == job["_id"]
+
+    asyncio.run(scenario())
+
+
+def test_queued_job_without_attempts_left_is_failed(fake_db):
+    async def scenario():
+        pool = JobWorkerPool(size=1)
+        await submit_job("u1", {}, [], [])
+        await fake_db.jobs.update_many({}, {"$set": {"attempts": JOB_MAX_ATTEMPTS}})
+        assert await pool._claim() is None
+        await pool._fail_abandoned()
+        job = await fake_db.jobs.find_one({})
+        assert job["status"] == "failed" and job["finished_at"]
+
+    asyncio.run(scenario())
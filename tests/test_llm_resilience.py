@@ -0,0 +1,45 @@
+import asyncio
+
+import backend.llm_resilience as llm_resilience
+from backend.llm_gateway import LLMGateway
+from backend.llm_resilience import ResilientInvoker
+
+
+def test_time_queued_for_admission_is_not_charged_to_the_deadline(monkeypatch):
+    # Each call needs 0.15s of a 0.25s deadline, but with one slot the last one
+    # waits 0.45s to be admitted
+    monkeypatch.setattr(llm_resilience, "llm_gateway", LLMGateway(max_concurrency=1, tokens_per_minute=0))
+    monkeypatch.setenv("LLM_DEADLINE_DETAIL_SECONDS", "0.25")
+    invoker = ResilientInvoker(hedging=False, max_retries=0)
+
+    async def attempt(usage):
+        await asyncio.sleep(0.15)
+        return "ok"
+
+    async def burst():
+        return await asyncio.gather(*[invoker.call("detail", attempt, "prompt") for _ in range(4)])
+
+    assert asyncio.run(burst()) == ["ok"] * 4
+    assert invoker.deadline_exceeded == 0
+    assert invoker.breaker.failures == 0 and invoker.breaker.state == "closed"
+    samples = invoker.latency._samples["detail"]
+    assert max(samples) < 0.25
+
+
+def test_slow_provider_still_hits_the_deadline(monkeypatch):
+    monkeypatch.setattr(llm_resilience, "llm_gateway", LLMGateway(max_concurrency=1, tokens_per_minute=0))
+    monkeypatch.setenv("LLM_DEADLINE_DETAIL_SECONDS", "0.05")
+    invoker = ResilientInvoker(hedging=False, max_retries=0)
+
+    async def attempt(usage):
+        await asyncio.sleep(1)
+
+    async def call():
+        try:
+            await invoker.call("detail", attempt, "prompt")
+        except llm_resilience.LLMDeadlineExceeded:
+            return "deadline"
+
+    assert asyncio.run(call()) == "deadline"
+    assert invoker.breaker.failures == 1
+    assert llm_resilience.llm_gateway.stats()["active"] == 0
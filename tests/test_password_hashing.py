@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import backend.auth as auth
+from backend.password_hashing import PasswordHasher, pwd_context
+
+
+def request(peer, forwarded=None):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+async def burst(hasher, keys, count):
+    hashed = pwd_context.hash("secret")
+
+    async def attempt(i):
+        try:
+            valid, _ = await hasher.verify_and_update("secret", hashed, *keys(i))
+            return valid
+        except HTTPException as exc:
+            return exc.status_code
+
+    try:
+        return await asyncio.gather(*[attempt(i) for i in range(count)])
+    finally:
+        hasher.shutdown()
+
+
+def test_shared_address_is_not_capped_by_default():
+    results = asyncio.run(burst(PasswordHasher(max_pending=32), lambda i: ("ip:203.0.113.7", f"email:u{i}@x.com"), 20))
+    assert results == [True] * 20
+
+
+def test_attempts_on_one_account_queue_instead_of_failing():
+    hasher = PasswordHasher(max_pending=32)
+    results = asyncio.run(burst(hasher, lambda i: (f"ip:10.0.0.{i}", "email:victim@x.com"), 20))
+    assert results == [True] * 20
+    assert hasher.queued == 19 and hasher.rejected == 0
+    assert not hasher._accounts
+
+
+def test_per_client_cap_is_opt_in():
+    hasher = PasswordHasher(max_pending=32, max_per_client=2)
+    results = asyncio.run(burst(hasher, lambda i: ("ip:203.0.113.7", f"email:u{i}@x.com"), 5))
+    assert results == [True, True, 429, 429, 429]
+
+
+def test_global_cap_still_rejects():
+    results = asyncio.run(burst(PasswordHasher(max_pending=3), lambda i: (None, "email:victim@x.com"), 5))
+    assert results == [True, True, True, 429, 429]
+
+
+@pytest.mark.parametrize("hops, forwarded, expected", [
+    (0, "1.2.3.4", "10.0.0.1"),
+    (1, "1.2.3.4, 5.6.7.8", "5.6.7.8"),
+    (2, "1.2.3.4, 5.6.7.8", "1.2.3.4"),
+    (2, "5.6.7.8", "10.0.0.1"),
+])
+def test_client_ip_trusts_only_configured_proxies(monkeypatch, hops, forwarded, expected):
+    monkeypatch.setattr(auth, "TRUSTED_PROXY_HOPS", hops)
+    assert auth.client_ip(request("10.0.0.1", forwarded)) == expected
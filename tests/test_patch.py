@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from bson import ObjectId
+
+import backend.main as main
+from backend.ai_cache import workflow_hash
+from backend.auth import get_current_user
+from backend.langchain_pipeline import WorkflowDetail, workflowdetail_to_reactflow
+
+WORKFLOW = WorkflowDetail(**{
+    "name": "Lead handling",
+    "actors": ["Rep", "Manager"],
+    "steps": [
+        {"actor": "Rep", "action": "Qualify lead", "type": "hubspot", "ai_recommendation": "Score leads automatically",
+         "substeps": [{"actor": "Rep", "action": "Check budget"}, {"actor": "Manager", "action": "Approve"}]},
+        {"actor": "Manager", "action": "Send contract"},
+    ],
+})
+
+
+@pytest.fixture
+def client(fake_db, monkeypatch):
+    refreshes = []
+    monkeypatch.setattr(main, "refresh_orgview_ai_graph", lambda *args: refreshes.append(args))
+    main.app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id="user-1")
+    workflow_json = WORKFLOW.model_dump()
+    react_flow_json = workflowdetail_to_reactflow(WORKFLOW)
+    project_id = str(ObjectId())
+    asyncio.run(fake_db.orgviews.insert_one({
+        "_id": ObjectId(),
+        "project_id": project_id,
+        "user_id": "user-1",
+        "workflow_json": workflow_json,
+        "react_flow_json": react_flow_json,
+        "workflow_hash": workflow_hash(workflow_json),
+        "revision": 0,
+    }))
+
+    async def patch(graph):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            response = await http.post("/orgview/patch", json={"project_id": project_id, "react_flow_json": graph})
+        response.raise_for_status()
+        return response.json()
+
+    yield SimpleNamespace(patch=lambda graph: asyncio.run(patch(graph)), graph=react_flow_json,
+                          workflow_json=workflow_json, refreshes=refreshes)
+    main.app.dependency_overrides.clear()
+
+
+def test_unchanged_diagram_does_not_schedule_an_ai_refresh(client):
+    result = client.patch(client.graph)
+    assert result["patched"] == client.workflow_json
+    assert client.refreshes == []
+
+
+def test_edited_diagram_schedules_an_ai_refresh(client):
+    graph = {"nodes": [dict(n, data=dict(n["data"])) for n in client.graph["nodes"]], "edges": client.graph["edges"]}
+    graph["nodes"][-1]["data"]["label"] = "Send signed contract"
+    result = client.patch(graph)
+    assert result["patched"]["steps"][-1] == {**client.workflow_json["steps"][-1], "action": "Send signed contract"}
+    assert len(client.refreshes) == 1
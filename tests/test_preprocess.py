@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import backend.ingest as ingest
+import backend.preprocess as preprocess
+from backend.ingest import Attachment, _expired_blobs
+from backend.preprocess import prepare_attachment_parts
+
+
+def png(size=300):
+    image = Image.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def upload(data):
+    # What ingest leaves behind for an upload of `data`
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = ingest.blob_path(sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return Attachment(filename="a.png", content_type="image/png", sha256=sha256, size=len(data), kind="image")
+
+
+def age_everything(root):
+    old = time.time() - 3600
+    for directory, _, files in os.walk(root):
+        for name in files:
+            os.utime(os.path.join(directory, name), (old, old))
+
+
+def test_reupload_after_blob_gc_is_processed_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "BLOB_DIR", str(tmp_path))
+    monkeypatch.setattr(preprocess, "DERIVED_DIR", str(tmp_path / "derived"))
+    monkeypatch.setattr(preprocess, "IMAGE_MAX_DIMENSION", 64)
+    pool = ThreadPoolExecutor(1)
+    monkeypatch.setattr(preprocess, "_get_pool", lambda: pool)
+    data = png()
+    first, report = asyncio.run(prepare_attachment_parts([upload(data)]))
+    assert report["cache_hits"] == 0 and report["bytes_out"] < len(data)
+    age_everything(tmp_path)
+    assert _expired_blobs(set(), time.time() - 60) == 3  # source, derived image, manifest
+    again, report = asyncio.run(prepare_attachment_parts([upload(data)]))
+    assert again == first and report["cache_hits"] == 0
+    # Only the derived blob collected: the stale manifest is detected and redone
+    age_everything(tmp_path)
+    os.remove(ingest.blob_path(hashlib.sha256(first[0]["data"]).hexdigest()))
+    again, report = asyncio.run(prepare_attachment_parts([upload(data)]))
+    assert again == first and report["cache_hits"] == 0
+    # A hit keeps what it uses
+    again, report = asyncio.run(prepare_attachment_parts([upload(data)]))
+    assert report["cache_hits"] == 1
+    assert _expired_blobs(set(), time.time() - 60) == 0
+    pool.shutdown()
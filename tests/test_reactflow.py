@@ -0,0 +1,70 @@
+import random
+
+from backend.langchain_pipeline import WorkflowDetail, reactflow_to_workflowdetail, workflowdetail_to_reactflow
+
+WORKFLOW = {
+    "name": "Onboarding",
+    "actors": ["HR", "IT", "Manager"],
+    "steps": [
+        {"actor": "HR", "action": "Send offer", "substeps": None, "ai_recommendation": "Use e-sign", "type": "gmail"},
+        {"actor": "IT", "action": "Provision", "ai_recommendation": None, "type": None, "substeps": [
+            {"actor": "IT", "action": "Create account", "substeps": None, "ai_recommendation": None, "type": "default"},
+            {"actor": "IT", "action": "Ship laptop", "ai_recommendation": None, "type": None, "substeps": [
+                {"actor": "IT", "action": "Image disk", "substeps": None, "ai_recommendation": None, "type": None},
+                {"actor": "IT", "action": "Courier", "substeps": None, "ai_recommendation": None, "type": None},
+            ]},
+        ]},
+        {"actor": "Manager", "action": "Welcome call", "substeps": None, "ai_recommendation": None, "type": "slack"},
+    ],
+}
+
+
+def actions(steps):
+    return [(step["action"], actions(step["substeps"] or [])) for step in steps]
+
+
+def graph():
+    return workflowdetail_to_reactflow(WorkflowDetail.model_validate(WORKFLOW))
+
+
+def test_tree_is_rebuilt_whatever_the_node_and_edge_order():
+    rng = random.Random(0)
+    for _ in range(20):
+        g = graph()
+        rng.shuffle(g["nodes"])
+        rng.shuffle(g["edges"])
+        issues = []
+        rebuilt = reactflow_to_workflowdetail(g["nodes"], g["edges"], issues)
+        assert actions(rebuilt["steps"]) == actions(WORKFLOW["steps"])
+        assert issues == []
+
+
+def test_unchanged_graph_with_original_round_trips_exactly():
+    g = graph()
+    assert reactflow_to_workflowdetail(g["nodes"], g["edges"], original=WORKFLOW) == WORKFLOW
+
+
+def test_long_chain_keeps_edge_order():
+    nodes = [{"id": f"s{i}", "data": {"label": f"Step {i}"}} for i in range(5000)]
+    edges = [{"id": f"e{i}", "source": f"s{i}", "target": f"s{i + 1}"} for i in range(4999)]
+    rebuilt = reactflow_to_workflowdetail(list(reversed(nodes)), edges)
+    assert [step["action"] for step in rebuilt["steps"]] == [f"Step {i}" for i in range(5000)]
+
+
+def test_broken_graphs_are_repaired_and_reported():
+    nodes = [
+        {"id": "a", "data": {"label": "A"}},
+        {"id": "b", "data": {"label": "B"}},
+        {"id": "c", "data": {"label": "C"}, "parentNode": "missing"},
+        {"id": "a", "data": {"label": "A again"}},
+    ]
+    edges = [
+        {"id": "ab", "source": "a", "target": "b"},
+        {"id": "ba", "source": "b", "target": "a"},
+        {"id": "ax", "source": "a", "target": "x"},
+    ]
+    issues = []
+    rebuilt = reactflow_to_workflowdetail(nodes, edges, issues)
+    # C has no incoming edge; the A <-> B cycle is broken at A
+    assert [step["action"] for step in rebuilt["steps"]] == ["C", "A", "B"]
+    assert sorted(issue["type"] for issue in issues) == ["cycle", "dangling_edge", "duplicate_node", "orphan"]
@@ -0,0 +1,64 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from backend.ai_cache import resolve_ai_graph, store_ai_graph, workflow_hash
+
+WORKFLOW = {"name": "Sales", "actors": ["Rep"], "steps": [{"actor": "Rep", "action": "Call lead"}]}
+AI_WORKFLOW = {"name": "Sales", "actors": ["AI"], "steps": [{"actor": "AI", "action": "Call lead", "type": "hubspot"}]}
+
+
+class Tasks:
+    def __init__(self):
+        self.added = []
+
+    def add_task(self, fn, *args):
+        self.added.append((fn, args))
+
+
+def legacy_orgview(fake_db, patched: bool):
+    created_at = datetime(2025, 1, 1, 12, 0, 0)
+    orgview = {
+        "_id": ObjectId(),
+        "project_id": str(ObjectId()),
+        "workflow_json": WORKFLOW,
+        "ai_workflow_json": AI_WORKFLOW,
+        "created_at": created_at,
+        "updated_at": created_at + (timedelta(days=3) if patched else timedelta(microseconds=40)),
+    }
+    asyncio.run(fake_db.orgviews.insert_one(orgview))
+    return orgview
+
+
+def test_legacy_ai_graph_is_reused_when_never_patched(fake_db):
+    orgview = legacy_orgview(fake_db, patched=False)
+    tasks = Tasks()
+    graph, stale = asyncio.run(resolve_ai_graph(orgview, tasks))
+    assert not stale and graph["nodes"]
+    assert not tasks.added
+    stored = asyncio.run(fake_db.orgviews.find_one({"_id": orgview["_id"]}))
+    assert stored["ai_workflow_hash"] == workflow_hash(WORKFLOW)
+
+
+def test_legacy_ai_graph_of_a_patched_workflow_is_recomputed(fake_db):
+    orgview = legacy_orgview(fake_db, patched=True)
+    tasks = Tasks()
+    _, stale = asyncio.run(resolve_ai_graph(orgview, tasks))
+    assert stale
+    assert len(tasks.added) == 1
+    stored = asyncio.run(fake_db.orgviews.find_one({"_id": orgview["_id"]}))
+    assert "ai_workflow_hash" not in stored
+
+
+def test_cached_graph_is_not_attached_over_a_concurrent_patch(fake_db):
+    old_key = workflow_hash(WORKFLOW)
+    orgview = {"_id": ObjectId(), "project_id": str(ObjectId()), "workflow_json": WORKFLOW, "workflow_hash": old_key}
+    asyncio.run(fake_db.orgviews.insert_one(orgview))
+    asyncio.run(store_ai_graph(old_key, AI_WORKFLOW, {"nodes": [{"id": "1"}], "edges": []}))
+    # A patch lands after retrieve read the orgview
+    asyncio.run(fake_db.orgviews.update_one({"_id": orgview["_id"]}, {"$set": {"workflow_hash": "patched"}}))
+    asyncio.run(resolve_ai_graph(orgview, Tasks()))
+    stored = asyncio.run(fake_db.orgviews.find_one({"_id": orgview["_id"]}))
+    assert stored["workflow_hash"] == "patched"
+    assert "ai_workflow_hash" not in stored
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from backend.orgview_service import OrgViewService
+
+
+def view(i):
+    return {
+        "project_name": f"Project {i}",
+        "project_desc": "desc",
+        "node_list": [],
+        "source_context": {"description": f"process {i}"},
+        "react_flow_json": {"nodes": [], "edges": []},
+        "workflow_json": {"name": f"W{i}", "actors": [], "steps": []},
+        "ai_workflow_json": None,
+        "ai_react_flow_json": {"nodes": [], "edges": []},
+        "workflow_hash": None,
+    }
+
+
+def test_failed_orgview_write_leaves_no_projects(fake_db, monkeypatch):
+    async def fail(documents, ordered=True):
+        raise RuntimeError("write concern error")
+
+    monkeypatch.setattr(fake_db.orgviews, "insert_many", fail)
+    with pytest.raises(RuntimeError):
+        asyncio.run(OrgViewService().save_org_views("u1", [view(i) for i in range(3)]))
+    assert asyncio.run(fake_db.projects.count_documents({})) == 0
+
+
+def test_saved_views_each_have_a_project(fake_db):
+    results = asyncio.run(OrgViewService().save_org_views("u1", [view(i) for i in range(3)]))
+    assert asyncio.run(fake_db.projects.count_documents({})) == 3
+    for result in results:
+        assert asyncio.run(fake_db.orgviews.find_one({"project_id": result["project_id"]}))
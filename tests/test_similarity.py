@@ -0,0 +1,18 @@
+import os
+
+from backend.similarity import SimilarityIndex
+
+CONTEXT = {"department_function": "Sales", "team_size": "5", "budget": "$10k", "description": "We qualify leads and send quotes"}
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = SimilarityIndex(directory=str(tmp_path))
+    index.upsert("a" * 24, "user-1", CONTEXT, None)
+    index.save()
+    index.save()
+    assert os.listdir(tmp_path) == ["index.npz"]
+    loaded = SimilarityIndex(directory=str(tmp_path))
+    assert loaded.load() and len(loaded) == 1
+    assert loaded.query("user-1", CONTEXT)["reuse"][0] == "a" * 24
+    # Scoped to the owner by default
+    assert loaded.query("user-2", CONTEXT)["reuse"] is None
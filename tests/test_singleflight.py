@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from backend.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def run():
+        flight = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "done"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        return results, calls, flight
+
+    results, calls, flight = asyncio.run(run())
+    assert results == ["done"] * 5
+    assert calls == 1
+    assert flight.stats() == {"executions": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_cancelled_leader_does_not_fail_followers():
+    async def run():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        leader = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, flight
+
+    result, flight = asyncio.run(run())
+    assert result == "result"
+    assert flight.stats()["executions"] == 1
+    assert not flight.in_flight("key")
+
+
+def test_failure_reaches_every_caller_and_clears_the_key():
+    async def run():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flight.do("key", work), flight.do("key", work), return_exceptions=True)
+        return results, flight
+
+    results, flight = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert not flight.in_flight("key")
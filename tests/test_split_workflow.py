@@ -0,0 +1,49 @@
+from backend.langchain_pipeline import (
+    CompactStep, CompactWorkflow, estimate_json_tokens, merge_compact_workflows, split_workflow,
+)
+
+
+def workflow(steps, subworkflows=0):
+    return {
+        "name": "Big",
+        "actors": ["A", "B"],
+        "steps": [{"actor": "A", "action": f"Step {i} " + "x" * (i % 7) * 40, "substeps": None} for i in range(steps)],
+        "subworkflows": [{"name": f"Sub {i}", "actors": ["B"], "steps": []} for i in range(subworkflows)] or None,
+    }
+
+
+def test_every_step_lands_in_exactly_one_chunk_in_order():
+    source = workflow(300, subworkflows=4)
+    chunks = split_workflow(source, token_budget=400)
+    assert len(chunks) > 1
+    assert [step for chunk in chunks for step in chunk["steps"]] == source["steps"]
+    assert [sub for chunk in chunks for sub in chunk["subworkflows"] or []] == source["subworkflows"]
+    for i, chunk in enumerate(chunks):
+        assert chunk["name"] == f"Big (part {i + 1} of {len(chunks)})" and chunk["actors"] == ["A", "B"]
+        units = chunk["steps"] + (chunk["subworkflows"] or [])
+        assert len(units) == 1 or sum(estimate_json_tokens(u) for u in units) <= 400
+
+
+def test_oversized_step_gets_its_own_chunk():
+    source = workflow(3)
+    source["steps"][1]["action"] = "y" * 10000
+    chunks = split_workflow(source, token_budget=100)
+    assert [len(chunk["steps"]) for chunk in chunks] == [1, 1, 1]
+
+
+def test_small_workflow_is_one_chunk():
+    assert len(split_workflow(workflow(5))) == 1
+    assert split_workflow({"name": "Empty", "steps": []}) == []
+
+
+def test_merge_keeps_every_step_in_part_order():
+    parts = [
+        CompactWorkflow(name=f"part {p}", actors=["A", f"X{p}"], steps=[
+            CompactStep(actor="A", action=f"{p}.{i}", type="default") for i in range(p + 1)
+        ])
+        for p in range(4)
+    ]
+    merged = merge_compact_workflows("Big", parts)
+    assert merged.name == "Big"
+    assert merged.actors == ["A", "X0", "X1", "X2", "X3"]
+    assert [step.action for step in merged.steps] == [f"{p}.{i}" for p in range(4) for i in range(p + 1)]
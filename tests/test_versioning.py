@@ -0,0 +1,107 @@
+import asyncio
+import copy
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from backend.db import ensure_indexes
+from backend.versioning import (
+    RevisionConflict, apply_patch, commit_revision, json_diff, load_revision, record_revision, revision_entry,
+    versioned_state,
+)
+
+BASE = {
+    "name": "Sales",
+    "actors": ["Rep", "Manager"],
+    "steps": [
+        {"actor": "Rep", "action": "Qualify", "substeps": [{"actor": "Rep", "action": "Call"}]},
+        {"actor": "Manager", "action": "Approve", "substeps": []},
+    ],
+    "a/b~c": 1,
+}
+
+
+@pytest.mark.parametrize("edit", [
+    lambda d: d["steps"].insert(1, {"actor": "Rep", "action": "Quote", "substeps": []}),
+    lambda d: d["steps"].pop(0),
+    lambda d: d["steps"][0]["substeps"].append({"actor": "Rep", "action": "Email"}),
+    lambda d: d.update(name="Renamed", actors=["Rep"]),
+    lambda d: d.pop("a/b~c"),
+    lambda d: d["steps"].reverse(),
+    lambda d: d.clear(),
+])
+def test_diff_then_patch_round_trips(edit):
+    new = copy.deepcopy(BASE)
+    edit(new)
+    ops = json_diff(BASE, new)
+    assert apply_patch(copy.deepcopy(BASE), ops) == new
+    assert json_diff(BASE, copy.deepcopy(BASE)) == []
+
+
+def test_whole_document_replace():
+    assert apply_patch({"a": 1}, json_diff({"a": 1}, [1, 2])) == [1, 2]
+
+
+def new_orgview(fake_db):
+    asyncio.run(ensure_indexes())
+    orgview = {"_id": ObjectId(), "project_id": "p", "revision": 0,
+               "workflow_json": copy.deepcopy(BASE), "react_flow_json": {"nodes": [], "edges": []}}
+    asyncio.run(fake_db.orgviews.insert_one(orgview))
+    asyncio.run(record_revision(orgview, 0, None, versioned_state(orgview)))
+    return orgview
+
+
+def edit(fake_db, orgview, action):
+    state = copy.deepcopy(versioned_state(orgview))
+    state["workflow_json"]["steps"][0]["action"] = action
+    asyncio.run(commit_revision(orgview, state, {}))
+    return asyncio.run(fake_db.orgviews.find_one({"_id": orgview["_id"]}))
+
+
+def test_load_revision_replays_every_step(fake_db, monkeypatch):
+    monkeypatch.setattr("backend.versioning.VERSION_SNAPSHOT_INTERVAL", 3)
+    orgview = new_orgview(fake_db)
+    history = [versioned_state(orgview)]
+    for i in range(7):
+        orgview = edit(fake_db, orgview, f"Qualify {i}")
+        history.append(copy.deepcopy(versioned_state(orgview)))
+    assert orgview["revision"] == 7
+    for revision, state in enumerate(history):
+        assert asyncio.run(load_revision(orgview, revision)) == state
+
+
+def test_load_revision_refuses_to_skip_a_gap(fake_db):
+    orgview = new_orgview(fake_db)
+    for i in range(3):
+        orgview = edit(fake_db, orgview, f"Qualify {i}")
+    asyncio.run(fake_db.orgview_revisions.delete_one({"orgview_id": orgview["_id"], "revision": 2}))
+    assert asyncio.run(load_revision(orgview, 1)) is not None
+    assert asyncio.run(load_revision(orgview, 2)) is None
+    assert asyncio.run(load_revision(orgview, 3)) == versioned_state(orgview)
+
+
+def test_log_entry_of_a_writer_that_died_is_replaced(fake_db):
+    orgview = new_orgview(fake_db)
+    state = copy.deepcopy(versioned_state(orgview))
+    state["workflow_json"]["name"] = "Never landed"
+    # Log entry written, orgview update never happened
+    pending = revision_entry(orgview, 1, json_diff(versioned_state(orgview), state), state)
+    asyncio.run(fake_db.orgview_revisions.insert_one(pending))
+    with pytest.raises(RevisionConflict):
+        edit(fake_db, orgview, "Too soon")
+    asyncio.run(fake_db.orgview_revisions.update_one(
+        {"_id": pending["_id"]}, {"$set": {"created_at": datetime.utcnow() - timedelta(hours=1)}}
+    ))
+    orgview = edit(fake_db, orgview, "Landed")
+    assert orgview["revision"] == 1
+    assert asyncio.run(load_revision(orgview, 1)) == versioned_state(orgview)
+    assert asyncio.run(load_revision(orgview, 0))["workflow_json"] == BASE
+
+
+def test_stale_writer_leaves_no_log_entry(fake_db):
+    orgview = new_orgview(fake_db)
+    edit(fake_db, orgview, "First")
+    with pytest.raises(RevisionConflict):
+        edit(fake_db, orgview, "From the same stale copy")
+    assert asyncio.run(fake_db.orgview_revisions.count_documents({"orgview_id": orgview["_id"]})) == 2